@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+backfill.py
+
+Pull every page a season needs into the html cache ahead of scraping: the
+schedule listing, each game's html and xml, and the page of every player in
+those games.  Pages land where pointstreakscraper looks for them, so the
+scrape that follows runs entirely from the cache.
+
+Pages are fetched by a fixed number of threads, and each host is held to a
+steady request rate.  Pages already in the cache are skipped, and each page is
+written in one go, so an interrupted backfill resumes where it stopped.
+
+    python backfill.py 12252 18269 -n 8 -r 2
+"""
+import json
+import logging
+import os
+import Queue
+import threading
+import time
+import urllib2
+import urlparse
+
+import pointstreakscraper as pss
+import setuplogger
+from scrapetools import DEFAULT_TIMEOUT, configure_http_pool, http_pool, write_cache_file
+
+logger = logging.getLogger("backfill")
+
+DEFAULT_CONCURRENCY = 8  # pages fetched at once
+DEFAULT_RATE = 2.0  # requests a second per host
+DEFAULT_RETRIES = 2
+LISTING_CACHE_PATH = "listings/list_{}.json"
+
+
+class RateLimiter(object):
+    """
+    let calls through at rate a second on average, in bursts of up to burst.
+    Safe to share between threads
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """ block until the next call is allowed """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            # take the token now, even if it is only due later, so waiting threads queue up in turn
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def _transient(exception):
+    if isinstance(exception, urllib2.HTTPError):
+        return exception.code >= 500 or exception.code == 429
+    return isinstance(exception, (urllib2.URLError, IOError))
+
+
+class SeasonBackfill(object):
+    """
+    fetch the pages of whole seasons into cache_path, at most concurrency at
+    a time and rate requests a second to each host.  rate of None means no
+    limit.  With refresh_listings, season schedules are fetched again, to
+    find games played since the last backfill
+    """
+    SCHEDULE_URL = pss.PS_JSON_URL
+    GAME_HTML_URL = pss.PS_GAME_HTML
+    GAME_XML_URL = pss.PS_GAME_XML
+    PLAYER_URL = pss.PS_PLAYER_URL
+
+    def __init__(self, cache_path=None, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, burst=1,
+                 retries=DEFAULT_RETRIES, players=True, refresh_listings=False):
+        self.cache_path = cache_path if cache_path is not None else pss.DEFAULT_CACHE_PATH
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.players = players
+        self.refresh_listings = refresh_listings
+        self.fetched = 0
+        self.cached = 0
+        self.failures = []  # (page, error message)
+        self._tasks = Queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def _limiter(self, url):
+        host = urlparse.urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate, self.burst)
+            return limiter
+
+    def _path(self, relative_path):
+        path = os.path.join(self.cache_path, relative_path)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # made by another thread in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        return path
+
+    def fetch(self, url, relative_path, force_reload=False):
+        """ return the page at url, from the cache if it is there, otherwise fetched into it """
+        path = self._path(relative_path)
+        if not force_reload and os.path.isfile(path):
+            with self._lock:
+                self.cached += 1
+            with open(path, "rb") as f:
+                return f.read()
+        for attempt in range(self.retries + 1):
+            if self.rate:
+                self._limiter(url).wait()
+            try:
+                page = http_pool().get(url)
+                break
+            except Exception, e:
+                if attempt == self.retries or not _transient(e):
+                    raise
+                logger.info("retrying %s after %s", url, e)
+                time.sleep(2 ** attempt)
+        write_cache_file(path, page)
+        with self._lock:
+            self.fetched += 1
+        return page
+
+    #---------------------------------------------------------------------------
+    # tasks
+    #---------------------------------------------------------------------------
+
+    def _add(self, kind, key):
+        """ queue a page to fetch, once per backfill """
+        with self._lock:
+            if (kind, key) in self._queued:
+                return
+            self._queued.add((kind, key))
+        self._tasks.put((kind, key))
+
+    def _season(self, seasonid):
+        listing = self.fetch(self.SCHEDULE_URL.format(seasonid), LISTING_CACHE_PATH.format(seasonid),
+                             self.refresh_listings)
+        for gameid in pss.scrape_pointstreak_gameids(json.loads(listing)["html"]):
+            self._add("game", gameid)
+            self._add("xml", gameid)
+
+    def _game(self, gameid):
+        html = self.fetch(self.GAME_HTML_URL % gameid, pss.GAME_CACHE_PATH % ("PS" + gameid))
+        if self.players:
+            for player_id in pss.game_player_ids(html):
+                self._add("player", player_id)
+
+    def _xml(self, gameid):
+        self.fetch(self.GAME_XML_URL % gameid, pss.GAME_XML_CACHE_PATH % ("PS" + gameid))
+
+    def _player(self, player_id):
+        self.fetch(self.PLAYER_URL % player_id, pss.PLAYER_CACHE_PATH % ("PS" + player_id))
+
+    def _work(self):
+        handlers = dict(season=self._season, game=self._game, xml=self._xml, player=self._player)
+        while True:
+            task = self._tasks.get()
+            try:
+                if task is None:
+                    return
+                kind, key = task
+                try:
+                    handlers[kind](str(key))
+                except Exception, e:
+                    logger.warning("Unable to backfill %s %s: %s", kind, key, e)
+                    with self._lock:
+                        self.failures.append(("{} {}".format(kind, key), "{}: {}".format(type(e).__name__, e)))
+            finally:
+                self._tasks.task_done()
+
+    def run(self, season_ids):
+        """ backfill the seasons.  return (pages fetched, pages already cached, failures) """
+        threads = [threading.Thread(target=self._work, name="backfill-{}".format(i))
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for seasonid in season_ids:
+            self._add("season", seasonid)
+        # a join with a timeout can still be interrupted by ctrl-c
+        while self._tasks.unfinished_tasks:
+            time.sleep(0.05)
+        for thread in threads:
+            self._tasks.put(None)
+        for thread in threads:
+            thread.join()
+        return self.fetched, self.cached, self.failures
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser("Backfill the html cache for whole seasons")
+    loghelp = """log level: one of 'all', 'debug', 'info', 'warn', 'error', 'critical'.
+                    Default is 'warn'"""
+    parser.add_argument('seasons', nargs="+", help="pointstreak season ids")
+    parser.add_argument('-l', '--log', action="store", default="warn", help=loghelp)
+    parser.add_argument('-c', '--cache', action="store", default=None, help="html cache directory")
+    parser.add_argument('-n', '--concurrency', action="store", type=int, default=DEFAULT_CONCURRENCY,
+                        help="pages fetched at once")
+    parser.add_argument('-r', '--rate', action="store", type=float, default=DEFAULT_RATE,
+                        help="requests a second to each host, 0 for no limit")
+    parser.add_argument('--no_players', action="store_true", default=False, help="skip player pages")
+    parser.add_argument('--refresh', action="store_true", default=False,
+                        help="fetch the season schedules again, for new games")
+    parser.add_argument('--http_pool', action="store", type=int, default=None,
+                        help="idle http connections kept per host.  Default is the concurrency")
+    parser.add_argument('--http_timeout', action="store", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds to wait on an http request")
+    options = parser.parse_args()
+
+    setuplogger.setupRootLogger(os.environ.get("SB_LOGLEVEL", options.log))
+    configure_http_pool(options.http_pool or options.concurrency, options.http_timeout)
+    backfill = SeasonBackfill(options.cache, options.concurrency, options.rate, players=not options.no_players,
+                              refresh_listings=options.refresh)
+    start = time.time()
+    fetched, cached, failures = backfill.run(options.seasons)
+    for page, error in failures:
+        print ">>>> FAILED {}: {}".format(page, error)
+    print "fetched {} pages, {} already cached, {} failed in {:.1f}s".format(
+        fetched, cached, len(failures), time.time() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
-import uuid
+from lineup import Name
+
+# bit for each base in the base state code
+BASE_BITS = (0, 1, 2, 4)
 
 
 class Bases:
@@ -7,17 +10,30 @@ class Bases:
     attributes:
     player_locations is a dictionary of player names and their current base location
 
+    runners are also kept by base, with the count of runners on each base, so the
+    usual case of one runner per base is answered without scanning, and the base
+    state code is kept as a bitmask.  fate ids index the fates list.
     """
 
     def __init__(self):
         self.clear()
 
+    @staticmethod
+    def _key(player_name):
+        """
+        runners are keyed by Name, which hashes like it compares, so a plain
+        string finds the runner put on base under any case of the same name
+        """
+        if player_name is None or isinstance(player_name, Name):
+            return player_name
+        return Name(player_name)
+
     def force_runners(self):
         """  resolved any runners by assuming they were forced forward """
         moved = []
         while self.unresolved_players:
             for runner in self.unresolved_players:
-                newbase = self.player_locations[runner] + 1
+                newbase = self.player_locations[self._key(runner)] + 1
                 self.advance(runner, newbase)
                 moved.append((runner, newbase))
         return moved
@@ -31,17 +47,22 @@ class Bases:
 
     def is_valid(self):
         """ verify that no two players are on the same base """
-        flipped_dict = dict((value, key) for key, value in self.player_locations.iteritems())
-        return len(flipped_dict) == len(self.player_locations)
+        return max(self._counts) <= 1
 
     def on_base(self, base_num):
         """
         return player name on a given base.
         if multiple players are on the same base, only one will be returned,
         and it could be different each time"""
+        if base_num in (1, 2, 3):
+            count = self._counts[base_num]
+            if count == 0:
+                return None
+            elif count == 1:
+                return self._occupants[base_num]
         for player, base in self.player_locations.items():
             if base == base_num:
-                return player
+                return self._runners[player]
         return None
 
     def runner_count(self):
@@ -49,15 +70,18 @@ class Bases:
 
     def remove(self, player_name):
         self._resolve(player_name)
-        del(self.player_locations[player_name])
-        del(self.fates_id_lookup[player_name])
+        self._remove_location(player_name)
+        del(self.fates_id_lookup[self._key(player_name)])
 
     def clear(self):
         self.player_locations = {}
         self.unresolved_players = []
-        self.fates_dict = {}
+        self.fates = [0]  # by fate id, 0 is no runner
         self.fates_id_lookup = {None: 0}
-        #self.fates_bases = [0,0,0,0]
+        self._runners = {}  # player name -> the name as put on base
+        self._occupants = [None, None, None, None]  # by base, when it has one runner
+        self._counts = [0, 0, 0, 0]  # runners by base
+        self._code = 0
 
     def advance(self, player_name, base):
         """ advance player to new base_num.  return the advance string ie. "1-2" """
@@ -68,25 +92,26 @@ class Bases:
         else:
             base_num = base
 
-        if player_name in self.player_locations:
+        key = self._key(player_name)
+        if key in self.player_locations:
             self._resolve(player_name)
-            assert (base_num > self.player_locations[player_name])
-            startbase = self.player_locations[player_name]
+            assert (base_num > self.player_locations[key])
+            startbase = self.player_locations[key]
             if base_num == 4:
                 # left bases with score
-                del(self.player_locations[player_name])
+                self._remove_location(player_name)
         else:
             startbase = 'B'
             self.new_fate(player_name)
 
-        self.fates_dict[self.fates_id_lookup[player_name]] = base
+        self.fates[self.fates_id_lookup[key]] = base
 
         if base_num == 4:
             endbase = 'H'
         else:
             if self.on_base(base_num) is not None:
                 self._mark_unresolved(self.on_base(base_num))
-            self.player_locations[player_name] = base_num
+            self._set_location(player_name, base_num)
             endbase = str(base_num)
 
         return "{}-{}".format(startbase, endbase)
@@ -104,8 +129,8 @@ class Bases:
             self._resolve(replacing_player)
             self._mark_unresolved(new_player)
         self.remove(replacing_player)
-        self.fates_id_lookup[new_player] = replacing_runner_fate_id
-        self.player_locations[new_player] = base
+        self.fates_id_lookup[self._key(new_player)] = replacing_runner_fate_id
+        self._set_location(new_player, base)
         return base
 
     def code(self):
@@ -123,26 +148,23 @@ class Bases:
         6    _23    2B & 3B
         7    123    Loaded
         """
-        # 1 if on base, 0 if not
-        base_state = [str(int(self.on_base(i) is not None)) for i in (3, 2, 1)]
-        return int(''.join(base_state), 2)
+        return self._code
 
     def new_fate(self, player_name):
         """
         create a new fate
         """
-        new_uuid = uuid.uuid4()
-        self.fates_dict[new_uuid] = 0
-        self.fates_id_lookup[player_name] = new_uuid
+        self.fates_id_lookup[self._key(player_name)] = len(self.fates)
+        self.fates.append(0)
 
     def player_fate_id(self, player_name):
-        return self.fates_id_lookup[player_name]
+        return self.fates_id_lookup[self._key(player_name)]
 
     def runners_fate_ids(self):
         return [self.player_fate_id(name) for name in self.runner_names()]
 
     def fate_for(self, fate_id):
-        return self.fates_dict[fate_id]
+        return self.fates[fate_id]
 
     def _mark_unresolved(self, player_name):
         self.unresolved_players.append(player_name)
@@ -150,3 +172,38 @@ class Bases:
     def _resolve(self, player_name):
         if player_name in self.unresolved_players:
             self.unresolved_players.remove(player_name)
+
+    #---------------------------------------------------------------------------
+    # base occupancy
+    #---------------------------------------------------------------------------
+
+    def _set_location(self, player_name, base_num):
+        key = self._key(player_name)
+        old_base = self.player_locations.get(key)
+        if old_base is None:
+            self._runners[key] = player_name
+        runner = self._runners[key]
+        self.player_locations[key] = base_num
+        if old_base is not None:
+            self._left(old_base)
+        self._counts[base_num] += 1
+        if self._counts[base_num] == 1:
+            self._occupants[base_num] = runner
+            self._code |= BASE_BITS[base_num]
+
+    def _remove_location(self, player_name):
+        key = self._key(player_name)
+        base_num = self.player_locations.pop(key)
+        del(self._runners[key])
+        self._left(base_num)
+
+    def _left(self, base_num):
+        """ a runner has left base_num and player_locations """
+        self._counts[base_num] -= 1
+        if self._counts[base_num] == 0:
+            self._occupants[base_num] = None
+            self._code &= ~BASE_BITS[base_num]
+        elif self._counts[base_num] == 1:
+            for player, base in self.player_locations.items():
+                if base == base_num:
+                    self._occupants[base_num] = self._runners[player]
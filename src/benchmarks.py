@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+benchmarks.py
+
+Micro-benchmarks for the hot spots in parsing a game.  Run one benchmark by
+name, or all of them with no arguments:
+
+    python benchmarks.py snapshot lineup logging
+"""
+import argparse
+import itertools
+import logging
+import os
+import time
+import timeit
+
+import constants
+import gamestate
+import lineup
+from eventrecord import EventRecord
+from gamecontainer import GameContainer, GameContainerLogHandler
+from models import event
+from setuplogger import GameLogContext
+from tests.gamefixtures import AWAY_NAMES, new_game, play_game
+
+
+def game_in_progress():
+    """ a GameState with runners on, ready to snapshot """
+    game, parser = new_game()
+    game.new_half()
+    game.new_batter("Al Abbot")
+    parser.parse_event("Ball, Called Strike, 10 Al Abbot advances to 1st (single)")
+    game.new_batter("Bo Baker")
+    parser.parse_event("11 Bo Baker advances to 1st (walk)")
+    game.new_batter("Cy Carter")
+    return game
+
+
+def report(name, count, seconds):
+    print "{:<32} {:>10.0f} events/s".format(name, count / seconds)
+
+
+#===============================================================================
+# Event snapshots
+#===============================================================================
+
+def snapshot_per_field_model(game):
+    """ the original snapshot: walk the lookup dict into an ORM Event """
+    newevent = event.Event()
+    for key, modelattribute in gamestate.MODEL_LOOKUP_DICT.items():
+        val = game.__dict__[key]
+        if type(val) == bool:
+            val = ['F', 'T'][val]
+        if type(val) == lineup.Name:
+            val = val.id()
+        newevent.__dict__[modelattribute] = val
+    return newevent
+
+
+def snapshot_per_field_record(game):
+    """ the same per-field checks, into an EventRecord """
+    values = []
+    for key in gamestate.EVENT_ATTRIBUTES:
+        val = game.__dict__[key]
+        if type(val) == bool:
+            val = ['F', 'T'][val]
+        if type(val) == lineup.Name:
+            val = val.id()
+        values.append(val)
+    return EventRecord(values)
+
+
+def bench_snapshot(count):
+    game = game_in_progress()
+    assert snapshot_per_field_record(game) == game._get_state_as_event_record()
+    for name, snapshot in (("per field, ORM model", snapshot_per_field_model),
+                           ("per field, record", snapshot_per_field_record),
+                           ("snapshot plan, record", gamestate.GameState._get_state_as_event_record)):
+        seconds = min(timeit.repeat(lambda: snapshot(game), number=count, repeat=3))
+        report(name, count, seconds)
+
+
+#===============================================================================
+# Lineup layouts
+#===============================================================================
+
+def brute_force_complete_positions(team):
+    """ the original search: try every combination of listed positions """
+    save_positions = [p.position for p in team]
+    options = []
+    try:
+        for test_positions in itertools.product(*[p.all_positions for p in team]):
+            for player, position in zip(team, test_positions):
+                player.position = position
+            if team.is_complete():
+                options.append(test_positions)
+    finally:
+        for player, position in zip(team, save_positions):
+            player.position = position
+    return options
+
+
+def utility_lineup(extra_positions):
+    """
+    a DH lineup with nobody at their listed position, where everyone is also
+    listed at extra_positions more spots, so one layout is hidden among many
+    """
+    spots = constants.POSITIONS + [constants.DH]
+    lu = lineup.Lineup()
+    for i, name in enumerate(AWAY_NAMES + ["Sal Stone"]):
+        player = lineup.Player(name, 10 + i, i + 1 if i < 9 else None, "PH")
+        player.all_positions = [spots[(i + k + 1) % 10] for k in range(extra_positions)] + [spots[i]]
+        lu.append(player)
+    return lu
+
+
+def bench_lineup(count):
+    for extra_positions in (1, 2, 3):
+        team = utility_lineup(extra_positions)
+        start = time.time()
+        expected = brute_force_complete_positions(team)
+        brute_seconds = time.time() - start
+        assert team.find_complete_positions() == expected
+        number = max(1, count // 100)
+        seconds = min(timeit.repeat(lambda: team.find_complete_positions(max_options=2), number=number, repeat=3)) / number
+        print "{} positions each: {:>8.4f}s product search, {:>8.6f}s solver".format(
+            extra_positions + 1, brute_seconds, seconds)
+
+
+#===============================================================================
+# Logging
+#===============================================================================
+
+def parse_game(halves=18, game_logs=False):
+    """
+    parse a generated game, return the number of events.  With game_logs, log
+    through GameLogAdapters into a container, the way parse_from_container does
+    """
+    log_context = None
+    if game_logs:
+        log_context = GameLogContext(GameContainerLogHandler(GameContainer(os.devnull, "bench", "away", "home")))
+    game, parser = new_game(log_context=log_context)
+    play_game(game, parser, halves)
+    game.set_previous_event_as_game_end()
+    return len(game.event_list)
+
+
+def bench_logging(count):
+    root = logging.getLogger()
+    save_level, save_handlers = root.level, root.handlers[:]
+    devnull = open(os.devnull, "w")
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter(" %(levelname)8s - %(asctime)s - %(name)s -%(message)s"))
+    root.handlers = [handler]
+    games = max(1, count // 1000)
+    try:
+        for level in (logging.WARNING, logging.INFO, logging.DEBUG):
+            root.setLevel(level)
+            for name, game_logs in (("module loggers", False), ("game log adapters", True)):
+                start = time.time()
+                events = sum(parse_game(game_logs=game_logs) for i in range(games))
+                report("{}, {}".format(logging.getLevelName(level), name), events, time.time() - start)
+    finally:
+        root.handlers = save_handlers
+        root.setLevel(save_level)
+        devnull.close()
+
+
+BENCHMARKS = {"snapshot": bench_snapshot,
+              "lineup": bench_lineup,
+              "logging": bench_logging}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("SBS micro-benchmarks")
+    parser.add_argument("names", nargs="*", default=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("-n", "--number", type=int, default=20000, help="iterations per timing")
+    options = parser.parse_args()
+    for name in options.names:
+        print "--- {} ---".format(name)
+        BENCHMARKS[name](options.number)
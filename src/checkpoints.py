@@ -0,0 +1,73 @@
+"""
+checkpoints.py
+
+Snapshots of a game's parse at the start of every half inning, kept next to
+its GameContainer as gc_<gameid>.checkpoints.  After the container is edited
+a reparse picks up from the last half inning before the first changed one,
+instead of replaying the game from the first pitch.
+
+A checkpoint is only used while the code that made it, the container's
+rosters and substitutions, and every half before it are unchanged.
+"""
+import cPickle
+import logging
+import os
+
+logger = logging.getLogger("checkpoints")
+
+CHECKPOINT_FILENAME = "gc_{}.checkpoints"
+
+
+class GameCheckpoints(object):
+    """
+    the checkpoints of one GameContainer's parse.  Make it before the parse
+    changes the container's players.
+    """
+    def __init__(self, gc):
+        self.gc = gc
+        self.path = os.path.join(gc.cache_path, CHECKPOINT_FILENAME.format(gc.gameid))
+        self.header, self.halves = gc.input_digests()
+        self.states = {}  # half index -> pickled state at the start of that half
+
+    def restore(self):
+        """
+        load the latest usable checkpoint into the container.  return
+        (half index, GameState) to resume from, or None to start over
+        """
+        try:
+            with open(self.path, "rb") as f:
+                saved = cPickle.load(f)
+        except IOError:
+            return None
+        except Exception, e:
+            logger.warning("Ignoring unreadable checkpoints {}: {}".format(self.path, e))
+            return None
+        if saved["header"] != self.header:
+            return None
+        unchanged = 0
+        for old, new in zip(saved["halves"], self.halves):
+            if old != new:
+                break
+            unchanged += 1
+        usable = [i for i in saved["states"] if i <= unchanged]
+        if not usable:
+            return None
+        half_index = max(usable)
+        self.states = dict((i, state) for i, state in saved["states"].items() if i <= half_index)
+        (game, self.gc._away_roster, self.gc._home_roster, self.gc._away_roster_share, self.gc._home_roster_share,
+         self.gc.errors) = cPickle.loads(self.states[half_index])
+        return half_index, game
+
+    def take(self, half_index, game):
+        """ checkpoint game, about to start half half_index """
+        gc = self.gc
+        self.states[half_index] = cPickle.dumps((game, gc._away_roster, gc._home_roster, gc._away_roster_share,
+                                                 gc._home_roster_share, gc.errors), cPickle.HIGHEST_PROTOCOL)
+
+    def save(self):
+        """ save the checkpoints, to match the container as it was just saved """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            cPickle.dump(dict(header=self.gc.input_digests()[0], halves=self.halves, states=self.states), f,
+                         cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
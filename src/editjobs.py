@@ -5,7 +5,7 @@ editjobs.py
 A command line tool to manage games to parse.  games can be added by
 season or individually.  See command line help (-h) for usage instructions.
 
-results will end up in a yaml jobs file.  This yaml file will be read
+results will end up in a SQLite jobs file.  This file will be read
 by grabber.py that also also updates that file to report progress.
 
 #TODO: add some code to easily check jobs have been completed.
@@ -13,6 +13,7 @@ by grabber.py that also also updates that file to report progress.
 """
 
 import os
+import time
 import argparse
 import logging
 
@@ -24,7 +25,7 @@ from workerconstants import JOBS_PATH, PERSISTENT_FILE_PATH
 setuplogger.setupRootLogger(os.environ.get("SB_LOGLEVEL", "warn"))
 logger = logging.getLogger("editjobs")
 
-jm = jobmanager.JobManager(JOBS_PATH)
+jm = jobmanager.open_jobs(JOBS_PATH)
 parser = argparse.ArgumentParser("The SBS Job Editor")
 
 parser.add_argument('--addgame', action="store", default=None, help="request to ADD one specific game ID")
@@ -33,10 +34,17 @@ parser.add_argument('--addseason', action="store", default=None, help="request A
 parser.add_argument('--group', action="store", default="pointstreak", help="game group: ie. pointstreak")
 parser.add_argument('--clear', action="store_true", default=False, help="clear all the jobs in the group")
 parser.add_argument('--retryfailed', action="store_true", default=False, help="request TODO on any listed games with previous errors")
+parser.add_argument('--importyaml', action="store", default=None, help="copy in the jobs of an old yaml jobs file")
+parser.add_argument('--retryquarantined', action="store_true", default=False, help="request TODO on any listed games quarantined for scrape, parse or lineup errors")
+parser.add_argument('--failures', action="store_true", default=False, help="list the failed games in the group and why they failed")
 parser.add_argument('--retrydone', action="store_true", default=False, help="request TODO on all games listed as done")
 
 
 options = parser.parse_args()
+if options.importyaml is not None:
+    jm.import_yaml(options.importyaml)
+    print "Imported jobs from {}".format(options.importyaml)
+
 if options.clear:
     jm.clear_jobs(job_group=options.group)
     jm.save()
@@ -66,6 +74,19 @@ if options.retryfailed:
     jm.save()
     print "Will retry {} games: {}".format(options.group, ' '.join(retry_list))
 
+if options.retryquarantined:
+    retry_list = []
+    for job in jm.jobs(options.group, do_job_type=jobmanager.QUARANTINE):
+        retry_list.append(job)
+        jm.set_job(job, options.group, job_type=jobmanager.TODO)
+    jm.save()
+    print "Will retry {} games: {}".format(options.group, ' '.join(retry_list))
+
+if options.failures:
+    for job, job_type, failure, attempts, message, retry_at in jm.failures(options.group):
+        when = "" if retry_at is None else ", retry at " + time.ctime(retry_at)
+        print "{} {} after {} attempts{}: {} {}".format(job, job_type, attempts, when, failure, message)
+
 if options.retrydone:
     retry_list = []
     for job in jm.jobs(options.group, do_job_type=jobmanager.DONE):
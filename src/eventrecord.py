@@ -0,0 +1,41 @@
+"""
+Compact storage for the event snapshots a GameState records.
+
+Each EventRecord is a plain list of values in eventfields order, so a game
+holds no SQLAlchemy instances until it is persisted.
+"""
+import eventfields
+from models.event import Event
+
+# skip the heading row of the extended list
+EVENT_FIELDS = [field for field in eventfields.cw_event_fields + eventfields.cw_event_fields_extended
+                if field[0] != 'Field number']
+
+# GameState attribute names and events table columns, in record order
+EVENT_ATTRIBUTES = tuple(field[1].lower().replace(' ', '_') for field in EVENT_FIELDS)
+EVENT_COLUMNS = tuple(field[2] for field in EVENT_FIELDS)
+
+ATTRIBUTE_INDEX = dict((attribute, i) for i, attribute in enumerate(EVENT_ATTRIBUTES))
+
+
+class EventRecord(list):
+    """
+    one row of the events table, indexed like EVENT_ATTRIBUTES
+    """
+    __slots__ = ()
+
+    def get(self, attribute_name):
+        return self[ATTRIBUTE_INDEX[attribute_name]]
+
+    def set(self, attribute_name, value):
+        self[ATTRIBUTE_INDEX[attribute_name]] = value
+
+    def as_dict(self):
+        """ return {column: value} suitable for a Core insert """
+        return dict(zip(EVENT_COLUMNS, self))
+
+    def to_model(self):
+        """ build the ORM Event for this row """
+        model = Event()
+        model.__dict__.update(zip(EVENT_COLUMNS, self))
+        return model
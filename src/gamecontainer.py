@@ -6,6 +6,7 @@ a means to save games outside of their html state.
 import logging
 import json
 import copy
+import hashlib
 import os
 from collections import OrderedDict
 
@@ -17,6 +18,24 @@ json.encoder.c_make_encoder = None
 
 ERROR_KEY = "process_output"
 
+# modules whose behaviour decides the events parsed from a container
+PARSING_MODULES = ("bases", "eventfields", "eventrecord", "gamestate", "gamewrapper", "lineup", "manager",
+                   "pointstreakparser", "subtracker")
+
+
+def _parsing_code_version():
+    digest = hashlib.sha1()
+    for name in PARSING_MODULES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name + ".py"), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+PARSING_CODE_VERSION = _parsing_code_version()
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True)).hexdigest()
+
 
 class GameContainer:
     def __init__(self, cache_path, gameid=None, away_team=None, home_team=None):
@@ -163,20 +182,44 @@ class GameContainer:
         for h in self.list_of_halfs:
             yield h
 
+    def input_digests(self):
+        """
+        return (header, halves): a digest of everything outside the halves
+        that a parse depends on, and a digest of each half
+        """
+        # stats are worked out by the parse, and not loaded back from a container
+        rosters = [[dict((key, value) for key, value in p.as_odict().items() if key not in ("bat_stats", "pitch_stats"))
+                    for p in roster]
+                   for roster in (self._away_roster, self._home_roster)]
+        subs = [event_info["text"] for half in self.halfs() for event_info in half if "batter" not in event_info]
+        header = _digest([PARSING_CODE_VERSION, self.home_team, self.away_team, rosters, subs])
+        halves = [_digest([dict((key, value) for key, value in event_info.items() if key != ERROR_KEY)
+                           for event_info in half])
+                  for half in self.halfs()]
+        return header, halves
+
+    def content_hash(self):
+        """
+        a hash of the container's inputs and the parsing code.  Taken after a
+        parse, it matches the container as saved by that parse.
+        """
+        return _digest(self.input_digests())
+
     def log_error(self, inning, bottom, event_num, message):
         self.errors.append(dict(inning=inning, bottom=bottom, event_num=event_num, message=message))
 
 
 class GameContainerLogHandler(logging.Handler):
     """
-    A handler class which allows logs to get inserted into a game container
+    A handler class which allows logs to get inserted into a game container.
+    Only warnings and worse are kept, unless a lower level is given.
     """
-    def __init__(self, game_container):
+    def __init__(self, game_container, level=logging.WARNING):
         logging.Handler.__init__(self)
         self.gc = game_container
         formatter = logging.Formatter("%(levelname)s - %(message)s")
         self.setFormatter(formatter)
-        self.setLevel(logging.INFO)
+        self.setLevel(level)
 
     def emit(self, record):
         try:
@@ -7,11 +7,12 @@ Therefore, at any time, this class may be added as a line in a SQL event databas
 """
 
 import logging
+import operator
 import constants
 
 from bases import Bases
-from models import event
 import eventfields
+from eventrecord import EventRecord, EVENT_ATTRIBUTES, EVENT_COLUMNS, ATTRIBUTE_INDEX
 from lineup import LineupError, Name
 
 MODEL_LOOKUP_DICT = eventfields.lookup_dict()
@@ -39,10 +40,30 @@ PLAYER_ID_ATTRS = ["batter",
                    "runner_removed_for_pinch_runner_on_third",
                    "batter_removed_for_pinch_hitter"]
 
+#------------------------------------------------------------------------------
+# Event snapshot plan, worked out once.  All the event attributes are read in
+# record order with one attrgetter.  Counters (_CT) and text (_TX) fields are
+# copied as is, flags (_FL) only need bools turned into 'T'/'F' and anything
+# else may also hold a player Name that is stored by id.
+#------------------------------------------------------------------------------
+snapshot_values = operator.attrgetter(*EVENT_ATTRIBUTES)
+SNAPSHOT_FLAG_FIELDS = tuple(i for i, column in enumerate(EVENT_COLUMNS) if column.endswith("_FL"))
+SNAPSHOT_CONVERTED_FIELDS = tuple(i for i, column in enumerate(EVENT_COLUMNS)
+                                  if not column.endswith(("_FL", "_CT", "_TX")))
+
+# record fields patched when a half inning closes
+FATE_FIELDS = tuple(ATTRIBUTE_INDEX[name] for name in ("fate_of_batter",
+                                                       "fate_of_runner_on_first",
+                                                       "fate_of_runner_on_second",
+                                                       "fate_of_runner_on_third"))
+RUNS_AFTER_FIELD = ATTRIBUTE_INDEX["runs_scored_in_half_inning_after_this_event"]
+
 
 class GameState:
-    def __init__(self):
-        self.logger = logging.getLogger("gamestate")
+    def __init__(self, logger=None):
+        if logger is None:
+            logger = logging.getLogger("gamestate")
+        self.logger = logger
 
         self.game_id = None
         self.visiting_team = None
@@ -75,6 +96,7 @@ class GameState:
                                          'LF': "left_fielder",
                                          'CF': "center_fielder",
                                          'RF': "right_fielder"}
+        self._position_fields = tuple(ATTRIBUTE_INDEX[name] for name in self.position_attribute_names.values())
         self.catcher = None
         self.first_baseman = None
         self.second_baseman = None
@@ -270,6 +292,23 @@ class GameState:
         # the whole reason this class exists is to fill this list!
         self.event_list = []
 
+        # events of this half with the fate fields still holding fate ids,
+        # as (record, fields)
+        self._half_events = []
+        # the latest events of this inning with an unknown '?' fielder, by field
+        self._missing_fielder_events = {}
+        self._missing_fielder_inning = None
+
+    def __getstate__(self):
+        # loggers may carry a game container's handler, so are not kept
+        state = self.__dict__.copy()
+        del state["logger"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger("gamestate")
+
     #------------------------------------------------------------------------------
     # GAME INFO
     #------------------------------------------------------------------------------
@@ -292,7 +331,7 @@ class GameState:
         for p in self.home_lineup:
             p.plate_appearances = 0
         if not self.home_lineup.is_complete(raise_reason=False):
-            options = self.home_lineup.find_complete_positions()
+            options = self.home_lineup.find_complete_positions(max_options=2)
             if len(options) == 1:
                 for player, position in zip(self.home_lineup, options[0]):
                     if player.position != position:
@@ -317,7 +356,7 @@ class GameState:
         for p in self.away_lineup:
             p.plate_appearances = 0
         if not self.away_lineup.is_complete(raise_reason=False):
-            options = self.away_lineup.find_complete_positions()
+            options = self.away_lineup.find_complete_positions(max_options=2)
             if len(options) == 1:
                 for player, position in zip(self.away_lineup, options[0]):
                     if player.position != position:
@@ -350,20 +389,32 @@ class GameState:
     #------------------------------------------------------------------------------
 
     def events(self):
+        """ yield an ORM Event model for each recorded event """
         for e in self.event_list:
-            yield e
-
-    def _get_state_as_event_model(self):
-        newevent = event.Event()
-        for key, modelattribute in MODEL_LOOKUP_DICT.items():
-            val = self.__dict__[key]
-            if type(val) == bool:
-                val = ['F', 'T'][val]
-            if type(val) == Name:
-                val = val.id()
+            yield e.to_model()
 
-            newevent.__dict__[modelattribute] = val
-        return newevent
+    def event_rows(self):
+        """ yield each event as a dict of events table column values, for bulk inserts """
+        for e in self.event_list:
+            yield e.as_dict()
+
+    def _get_state_as_event_record(self):
+        record = EventRecord(snapshot_values(self))
+        for i in SNAPSHOT_FLAG_FIELDS:
+            val = record[i]
+            if val is True:
+                record[i] = 'T'
+            elif val is False:
+                record[i] = 'F'
+        for i in SNAPSHOT_CONVERTED_FIELDS:
+            val = record[i]
+            if val is True:
+                record[i] = 'T'
+            elif val is False:
+                record[i] = 'F'
+            elif type(val) == Name:
+                record[i] = val.id()
+        return record
 
     # Removed at unused, April 2013 - TDH
     # def _gamestate_from_event_model(self, event):
@@ -375,30 +426,36 @@ class GameState:
     def get_event_value(self, e, attribute_name):
         """
         for a given gamestate attribute name, lookup the corresponding
-        value in an event model using the MODEL_LOOKUP_DICT
-        which is derived from eventfields.py
+        value in an event record.  Field order is derived from eventfields.py
         """
-        return getattr(e, MODEL_LOOKUP_DICT[attribute_name])
+        return e[ATTRIBUTE_INDEX[attribute_name]]
 
     def set_event_value(self, e, attribute_name, value):
         """
         for a given gamestate attribute name, set the corresponding
-        value in an event model using the MODEL_LOOKUP_DICT
-        which is derived from eventfields.py
+        value in an event record.  Field order is derived from eventfields.py
         """
-        setattr(e, MODEL_LOOKUP_DICT[attribute_name], value)
+        e[ATTRIBUTE_INDEX[attribute_name]] = value
 
     def repair_missing_fielder(self, position, player_name):
-        attribute_name = self.position_attribute_names[position]
-        for e in reversed(self.event_list):
-            if self.get_event_value(e, "inning") != self.inning:
-                break
-            if self.get_event_value(e, attribute_name) == '?':
-                self.set_event_value(e, attribute_name, player_name.id())
-            else:
-                break
+        field = ATTRIBUTE_INDEX[self.position_attribute_names[position]]
+        if self._missing_fielder_inning == self.inning:
+            for e in self._missing_fielder_events.pop(field, []):
+                e[field] = player_name.id()
         self._missing_fielders.remove(position)
 
+    def _index_event(self, record):
+        """ note what a new event record will need patched later """
+        self._half_events.append((record, [i for i in FATE_FIELDS if record[i] != 0]))
+        if self._missing_fielder_inning != self.inning:
+            self._missing_fielder_inning = self.inning
+            self._missing_fielder_events = {}
+        for i in self._position_fields:
+            if record[i] == '?':
+                self._missing_fielder_events.setdefault(i, []).append(record)
+            elif i in self._missing_fielder_events:
+                del self._missing_fielder_events[i]
+
     def _record_event(self, batting_event=True):
         """
         send event to database
@@ -415,8 +472,9 @@ class GameState:
                 self._increment_bat_stat("AB")
         self.event_text += self._advancing_event_text
         self.base_state_at_end_of_play = self._bases.code()
-        self._last_event = self._get_state_as_event_model()
+        self._last_event = self._get_state_as_event_record()
         self.event_list.append(self._last_event)
+        self._index_event(self._last_event)
         self.logger.debug(">-- APPEND EVENT --<")
         self._apply_pending_base_runner_positions()
         self._reset_play_flags()
@@ -433,22 +491,15 @@ class GameState:
         self.set_event_value(self._last_event, "end_game_flag", 'T')
 
     def _update_player_fates_for_half(self):
-        for e in reversed(self.event_list):
-            if self.get_event_value(e, "bat_home_id") != self.bat_home_id:
-                break
-            fate_attribute_names = ["fate_of_batter",
-                                    "fate_of_runner_on_first",
-                                    "fate_of_runner_on_second",
-                                    "fate_of_runner_on_third"
-                                    ]
-            for fate_attribute in fate_attribute_names:
-                fate_id = self.get_event_value(e, fate_attribute)
-                if fate_id != 0:
-                    self.logger.debug("looking up fate id for {} = {}".format(fate_attribute, fate_id))
-                    self.set_event_value(e, fate_attribute, self._bases.fate_for(fate_id))
-            subtract_runs = self.get_event_value(e, "runs_scored_in_half_inning_after_this_event")
-            runs_scored_after = subtract_runs + self.runs_scored_in_this_half_inning
-            self.set_event_value(e, "runs_scored_in_half_inning_after_this_event", runs_scored_after)
+        """ replace this half's fate ids with fates, and count the runs after each event """
+        fate_for = self._bases.fate_for
+        runs = self.runs_scored_in_this_half_inning
+        for e, fate_fields in self._half_events:
+            for i in fate_fields:
+                e[i] = fate_for(e[i])
+            # holds minus the runs scored before the event
+            e[RUNS_AFTER_FIELD] += runs
+        self._half_events = []
 
     #------------------------------------------------------------------------------
     # UTILITIES
@@ -460,11 +511,11 @@ class GameState:
 
     def _increment_bat_stat(self, stat):
         self._current_batting_lineup().find_player_by_name(self.batter).bat_stats[stat] += 1
-        self.logger.info("{} awarded {}".format(self.batter, stat))
+        self.logger.info("%s awarded %s", self.batter, stat)
 
     def _increment_runner_stat(self, player_name, stat):
         self._current_batting_lineup().find_player_by_name(player_name).bat_stats[stat] += 1
-        self.logger.info("{} awarded {}".format(player_name, stat))
+        self.logger.info("%s awarded %s", player_name, stat)
 
     def _allow_rbi(self):
         # tally any already scored before RBI option acknowledged
@@ -480,12 +531,12 @@ class GameState:
             self.batting_lineup = self.home_lineup
             self.fielding_lineup = self.away_lineup
             self._current_place_in_order = self._home_place_in_batting_order
-            self.logger.info("home lineup starts at order {}".format(self._current_place_in_order))
+            self.logger.info("home lineup starts at order %s", self._current_place_in_order)
         else:
             self.batting_lineup = self.away_lineup
             self.fielding_lineup = self.home_lineup
             self._current_place_in_order = self._away_place_in_batting_order
-            self.logger.info("away lineup starts at order {}".format(self._current_place_in_order))
+            self.logger.info("away lineup starts at order %s", self._current_place_in_order)
 
         self._update_fielders()
 
@@ -567,13 +618,13 @@ class GameState:
                 if self._home_place_in_batting_order > 9:
                     self._home_place_in_batting_order = 1
                 self._current_place_in_order = self._home_place_in_batting_order
-                self.logger.info("home team at order #{}".format(self._current_place_in_order))
+                self.logger.info("home team at order #%s", self._current_place_in_order)
             else:
                 self._away_place_in_batting_order += 1
                 if self._away_place_in_batting_order > 9:
                     self._away_place_in_batting_order = 1
                 self._current_place_in_order = self._away_place_in_batting_order
-                self.logger.info("away team at order #{}".format(self._current_place_in_order))
+                self.logger.info("away team at order #%s", self._current_place_in_order)
             # increment the atbat count
 
             self._current_batting_lineup().find_player_by_name(self.batter).plate_appearances += 1
@@ -748,7 +799,7 @@ class GameState:
                     batter_player.order = self._current_place_in_order
                     self.logger.warning("{} order auto set to {}".format(batter_player.name, batter_player.order))
             assert(batter_player.order == self._current_place_in_order)
-            self.logger.info("#{} {} to Bat".format(batter_player.number, batter_player.name))
+            self.logger.info("#%s %s to Bat", batter_player.number, batter_player.name)
         except KeyError:
             # Player not in lineup
             self.logger.warning(player_name + " not found in lineup for atbat")
@@ -774,7 +825,7 @@ class GameState:
             if batter_player.plate_appearances == 0:
                 try:
                     old_player = self._current_batting_lineup().find_player_by_order(self._current_place_in_order)
-                    self.logger.info("found old player {}".format(old_player.name))
+                    self.logger.info("found old player %s", old_player.name)
                     if old_player.plate_appearances == 0 or batter_player.is_pending_sub() or batter_player.order is None:
                         old_player.order = batter_player.order
                         batter_player.order = self._current_place_in_order
@@ -917,7 +968,7 @@ class GameState:
         base: 1, 2, or 3: the base where PO throw went
         """
         self._record_any_pending_runner_event()
-        self.logger.debug("Pickoff at {}, {} to {}".format(base, thrower_position, catcher_position))
+        self.logger.debug("Pickoff at %s, %s to %s", base, thrower_position, catcher_position)
         base_num = constants.BASE_LOOKUP[base]
         if base_num not in [1, 2, 3]:
             raise StandardError("pickoff base not a valid argument (1, 2, or 3)")
@@ -934,7 +985,7 @@ class GameState:
         self.outs += 1
         self.outs_on_play += 1
 
-        self.logger.info("{} Put Out.".format(player_name))
+        self.logger.info("%s Put Out.", player_name)
 
         if self.batter != player_name:
             self._bases.remove(player_name)
@@ -981,7 +1032,7 @@ class GameState:
         # catch case of fielders coming in as a string of digits, for example ['543']
         if len(fielders) == 1 and len(str(fielders)) > 1:
             fielders = list(str(fielders[0]))
-        self.logger.info("Fielders {}".format(fielders))
+        self.logger.info("Fielders %s", fielders)
         fielders = [self.lookup_position_num(pos) for pos in fielders]
         self.fielded_by = fielders[0]
         all_fielders = self._current_fielding_lineup()
@@ -992,7 +1043,12 @@ class GameState:
         except KeyError:
             # if we cant find the fielder to credit this out with.  Try to see if there is a single
             # set of correct fielding positions based
-            options = all_fielders.find_complete_positions()
+            try:
+                options = all_fielders.find_complete_positions(max_options=2)
+            except LineupError, e:
+                # too many layouts to search, so no single one to move to
+                self.logger.warning("%s", e)
+                options = []
             if len(options) == 1:
                 for player, position in zip(all_fielders, options[0]):
                     if player.position != position:
@@ -1051,7 +1107,7 @@ class GameState:
         self.event_text += "X" + '(' + ''.join([str(p) for p in fielders]) + ')'
         self._set_event_type(constants.EVENT_CODE.GENERIC_OUT, player_name)
         self._out(player_name)
-        self.logger.info("{} thrown out {}{}{}".format(player_name, fielders, ["", "DP"][double_play], ["", "TP"][triple_play]))
+        self.logger.info("%s thrown out %s%s%s", player_name, fielders, ["", "DP"][double_play], ["", "TP"][triple_play])
 
     def out_caught_stealing(self, runner_name, fielders=[], double_play=False):
         self._record_any_pending_runner_event()
@@ -1134,7 +1190,7 @@ class GameState:
         self.batted_ball_type = 'F'
 
         self._set_event_type(constants.EVENT_CODE.GENERIC_OUT, player_name)
-        self.logger.debug("{} flies out to {}. sac = {}".format(player_name, fielder_position, sacrifice))
+        self.logger.debug("%s flies out to %s. sac = %s", player_name, fielder_position, sacrifice)
         if not sacrifice:
             self._batting_event_is_official = True
         self._allow_rbi()
@@ -1149,7 +1205,7 @@ class GameState:
                                                                                                self.batter))
         self._credit_fielders_with_out(player_name, [2])
         self._out(self.batter)
-        self.logger.debug("Strike out for {outs} outs".format(outs=self.outs))
+        self.logger.debug("Strike out for %s outs", self.outs)
         self.event_text += "K"
         self._set_event_type(constants.EVENT_CODE.STRIKEOUT, player_name)
         self._increment_bat_stat("SO")
@@ -1171,7 +1227,7 @@ class GameState:
         self._credit_fielders_with_out(player_name, [fielder_position])
         self.event_text += str(fielder_position)  # TODO: does unassisted have a modifier?
         self._set_event_type(constants.EVENT_CODE.GENERIC_OUT, player_name)
-        self.logger.debug("Unassisted out for {outs} outs".format(outs=self.outs))
+        self.logger.debug("Unassisted out for %s outs", self.outs)
 
     def out_popup(self, player_name, fielder_position, foul=False, sacrifice=False):
         self._record_any_pending_runner_event()
@@ -1191,7 +1247,7 @@ class GameState:
             self._batting_event_is_official = True
         self._allow_rbi()
         self._first_batter_event = False
-        self.logger.debug("Popup out for {outs} outs".format(outs=self.outs))
+        self.logger.debug("Popup out for %s outs", self.outs)
 
     #------------------------------------------------------------------------------
     # ADVANCE
@@ -1211,7 +1267,7 @@ class GameState:
         base = constants.BASE_LOOKUP[base]
         extra_bases = base - 1
         if extra_bases:
-            self.logger.info("Single plus {} extra base".format(extra_bases))
+            self.logger.info("Single plus %s extra base", extra_bases)
         self._advance_player(player_name, base)
         self.hit_value = 1
         self._increment_bat_stat("H")
@@ -1318,7 +1374,7 @@ class GameState:
         self.event_text += "TH"
 
     def advance_on_error(self, player_name, base, error_position, error_type, sacrifice=False):
-        self.logger.info("{} advances to {} on error by position {}".format(player_name, base, error_position))
+        self.logger.info("%s advances to %s on error by position %s", player_name, base, error_position)
         self._record_any_pending_runner_event()
         if self.batter == player_name and self._first_batter_event:
             self.pitch_sequence += constants.PITCH_CHARS.BALL_PUT_INTO_PLAY_BY_BATTER
@@ -1404,7 +1460,7 @@ class GameState:
                 # check for the weird scoring choice to credit the runner!
                 if int(batter_number) == int(credit_batter.number):
                     credit_batter = current_batter
-                    self.logger.info("Auto: Batter is {} awarded advance not runner {} ".format(self.batter, player_name))
+                    self.logger.info("Auto: Batter is %s awarded advance not runner %s ", self.batter, player_name)
 
                 else:
                     self.logger.error("Advance recorded from batter number {} {} that is not current batter {}".format(batter_number,
@@ -1449,7 +1505,7 @@ class GameState:
         This will make it easier to use this method with whatever parsing means we need
         """
         base_num = constants.BASE_LOOKUP[base]
-        self.logger.info("%s to %s" % (player_name, base_num))
+        self.logger.info("%s to %s", player_name, base_num)
 
         if base_num == 4 and not earned:
             destination_base_name = 5
@@ -1520,7 +1576,7 @@ class GameState:
             self.home_score += 1
         else:
             self.visitor_score += 1
-        self.logger.debug("Score now Home %s, Vis %s" % (self.home_score, self.visitor_score))
+        self.logger.debug("Score now Home %s, Vis %s", self.home_score, self.visitor_score)
 
     #------------------------------------------------------------------------------
     # SUBSTITUTIONS
@@ -1582,7 +1638,7 @@ class GameState:
             else:
 
                 new_player = self._current_fielding_roster().find_player_by_name(new_player_name)
-                self.logger.info("moving {} into lineup\n {}".format(new_player, str(current_defense)))
+                self.logger.info("moving %s into lineup\n %s", new_player, current_defense)
                 # if new_player.order is None:
                 #     new_player.order = possible_remove_player.order
                 if position != '':
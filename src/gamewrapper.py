@@ -13,7 +13,8 @@ class GameWrapper:
     setup in a parser.
     """
 
-    def __init__(self, game=None):
+    def __init__(self, game=None, logger=logger):
+        self.logger = logger
         self.set_game(game)
         # for autocomplete
         if False:
@@ -47,9 +48,9 @@ class GameWrapper:
         self._game.pitch_foul()
 
     def put_out(self, text="", location=None, tokens={}):
-        logger.info("Rxed putout text :" + text + ".")
-        logger.info("Rxed putout location {}".format(location))
-        logger.info("Rxed putout tokens {}".format(tokens))
+        self.logger.info("Rxed putout text :%s.", text)
+        self.logger.info("Rxed putout location %s", location)
+        self.logger.info("Rxed putout tokens %s", tokens)
 
         if text == '':
              return
@@ -58,12 +59,16 @@ class GameWrapper:
             player_name = ' '.join(player_name)
         description = tokens.get(constants.PARSING.DESCRIPTION, {})
         if description == {}:
-            logger.warn("Empty Description")
+            self.logger.warn("Empty Description")
         else:
-            logger.info("PUT OUT {}".format(description.asDict()))
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("PUT OUT %s", description.asDict())
+        self._put_out(player_name, description)
+
+    def _put_out(self, player_name, description):
         position = description.get(constants.PARSING.POSITION)
         if constants.PARSING_OUTS.FLY_OUT in description:
-            logger.info("Fly Out {}".format(description))
+            self.logger.info("Fly Out %s", description)
             self._game.out_fly_out(player_name,
                                    position,
                                    constants.PARSING_OUTS.SACRIFICE in description)
@@ -73,7 +78,7 @@ class GameWrapper:
         elif constants.PARSING_OUTS.DROPPED_THIRD in description:
             self._game.out_dropped_third_strike(player_name)
         elif constants.PARSING_OUTS.CAUGHT_STEALING in description:
-            logger.info("Caught stealing")
+            self.logger.info("Caught stealing")
             self._game.out_caught_stealing(player_name, description.get(constants.PARSING_OUTS.THROWN_OUT, []),
                                            constants.PARSING_OUTS.DOUBLE_PLAY in description)
         elif constants.PARSING_OUTS.UNASSISTED in description or constants.PARSING_OUTS.LINE_DRIVE in description:
@@ -81,7 +86,7 @@ class GameWrapper:
                                       position,
                                       constants.PARSING_OUTS.FOUL in description)
         elif constants.PARSING_OUTS.POPUP in description:
-            logger.info("POPUP")
+            self.logger.info("POPUP")
             self._game.out_popup(player_name,
                                  position,
                                  constants.PARSING_OUTS.FOUL in description)
@@ -95,9 +100,9 @@ class GameWrapper:
 
         else:
             if len(description) == 0:
-                logger.error("Empty Putout Description")
+                self.logger.error("Empty Putout Description")
             else:
-                logger.error("Unknown Putout Description" + str(description))
+                self.logger.error("Unknown Putout Description" + str(description))
             self._game._out(player_name)
             #raise StandardError("Parsing Error from unknown putout description: " + ' '.join(tokens))
 
@@ -203,9 +208,9 @@ class GameWrapper:
         else:
             #raise StandardError("Parsing Error from unknown Advance description: " + ' '.join(description))
             if len(description) == 0:
-                logger.error("Empty Advance Description")
+                self.logger.error("Empty Advance Description")
             else:
-               logger.error("Unknown Advance Description" + str(description))
+               self.logger.error("Unknown Advance Description" + str(description))
             self._game._advance_player(player_name, base, earned)
 
     def event_complete(self, *args):
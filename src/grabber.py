@@ -4,7 +4,9 @@ import os
 import sys
 import time
 import signal
+import socket
 import logging
+import multiprocessing
 
 # this allows us to keep all the library code in the smallball directory
 # I am doing this instead of refering to the package because it makes
@@ -13,7 +15,9 @@ sys.path.append("/home/dotcloud/current/smallball")
 
 import manager
 import jobmanager
+import scrapetools
 import setuplogger
+from pointstreakscraper import PLAYER_FETCH_CONCURRENCY
 from models.event import Event
 from workerconstants import PERSISTENT_FILE_PATH, JOBS_PATH
 
@@ -27,11 +31,21 @@ loghelp = """log level: one of 'all', 'debug', 'info', 'warn', 'error', 'critica
 parser.add_argument('-l', '--log', action="store", default="warn", help=loghelp)
 parser.add_argument('-n', '--no_remote', action="store_true", default=False, help="don't apply changes to remote mysql database")
 parser.add_argument('-p', '--players_only', action="store_true", default=False, help="only pull game and player info, no events")
+parser.add_argument('-f', '--force', action="store_true", default=False, help="reparse games even when their container is unchanged")
+parser.add_argument('--poll', action="store", type=float, default=None, help="also check the jobs file every POLL seconds, for jobs added from other hosts")
+parser.add_argument('-w', '--workers', action="store", type=int, default=1, help="number of games to process at once in a pool of worker processes")
+parser.add_argument('--job_timeout', action="store", type=float, default=30 * 60, help="seconds a game may take in a worker process before it is failed, as when the worker died")
+parser.add_argument('--http_pool', action="store", type=int, default=PLAYER_FETCH_CONCURRENCY, help="idle http connections kept per host, in each process")
+parser.add_argument('--http_timeout', action="store", type=float, default=scrapetools.DEFAULT_TIMEOUT, help="seconds to wait on an http request")
 
 options = parser.parse_args()
 
 setuplogger.setupRootLogger(os.environ.get("SB_LOGLEVEL", options.log))
 logger = logging.getLogger("main")
+scrapetools.configure_http_pool(options.http_pool, options.http_timeout)
+
+# the name this process claims jobs under
+WORKER_ID = "{}:{}".format(socket.gethostname(), os.getpid())
 
 
 def delete_game(session, gameid):
@@ -39,10 +53,137 @@ def delete_game(session, gameid):
     count = events.count()
     if count > 0:
         events.delete()
+    manager.forget_parse(session, gameid)
     session.commit()
     print ">>>> deleted {} entries with id {}".format(count, gameid)
 
 
+def process_game(session, gameid):
+    if not (options.players_only or options.force) and manager.container_unchanged(session, gameid):
+        print ">>>> skipping unchanged {}".format(gameid)
+        return
+    delete_game(session, gameid)
+    print ">>>> processing {}".format(gameid)
+    if options.players_only:
+        manager.setup_scraper(gameid, PERSISTENT_FILE_PATH, session=session)
+    else:
+        manager.import_game(gameid, PERSISTENT_FILE_PATH, session=session,
+                            writer=manager.EventWriter(session))
+
+
+#===============================================================================
+# WORKER POOL
+#===============================================================================
+# every worker process gets its own database session.  the job manager is
+# only ever touched by the parent process, which merges in the results.
+
+worker_session = None
+
+
+def init_worker():
+    global worker_session
+    # let the parent handle ctrl-c and shut the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_session = manager.init_database(use_mysql=not options.no_remote)
+
+
+def pool_process_game(job):
+    """
+    run one (group, gameid) job in a worker.  return (group, gameid, failure,
+    message), with the failure class and error message if it failed
+    """
+    group, gameid = job
+    try:
+        process_game(worker_session, gameid)
+        return group, gameid, None, None
+    except Exception, e:
+        logger.exception("Error while processing {} game {}".format(group, gameid))
+        worker_session.rollback()
+        return group, gameid, manager.classify_failure(e), "{}: {}".format(type(e).__name__, e)
+
+
+def pool_results(jm, group, pool, size, timeout):
+    """
+    keep size claimed jobs running in the pool.  yield pool_process_game's
+    results as each finishes.  A job with no result after timeout seconds is
+    yielded as failed: the pool never reports a job whose worker process died
+    """
+    running = []  # (job, AsyncResult, give up time)
+    while True:
+        while len(running) < size:
+            job = jm.claim(WORKER_ID, group)
+            if job is None:
+                break
+            running.append((job, pool.apply_async(pool_process_game, (job,)), time.time() + timeout))
+        if not running:
+            return
+        # a wait with a timeout can still be interrupted by ctrl-c
+        running[0][1].wait(0.1)
+        now = time.time()
+        for entry in running[:]:
+            job, result, give_up = entry
+            if result.ready():
+                running.remove(entry)
+                try:
+                    yield result.get()
+                except Exception, e:
+                    logger.error("No result for {} game {}: {}".format(job[0], job[1], e))
+                    yield job + (manager.classify_failure(e), "{}: {}".format(type(e).__name__, e))
+            elif now > give_up:
+                running.remove(entry)
+                logger.error("Giving up on {} game {} after {:.0f}s".format(job[0], job[1], timeout))
+                yield job + (jobmanager.UNKNOWN, "no result after {:.0f}s, the worker died or hung".format(timeout))
+
+
+def record_result(jm, group, gameid, failure, message):
+    """ mark a claimed game done, or failed with failure, unless another worker has taken it over """
+    try:
+        if failure is None:
+            jm.complete_job(gameid, group, WORKER_ID)
+            job_type = jobmanager.DONE
+        else:
+            job_type = jm.fail_job(gameid, group, failure, message, worker=WORKER_ID)
+    except jobmanager.LeaseLost, e:
+        logger.warning("Not recording game {}: {}".format(gameid, e))
+        return
+    jm.save()
+    print ">>>> GAME {} {}. {} remaining in this set".format(gameid, job_type, jm.job_count())
+
+
+def run_jobs(jm, session, pool=None):
+    heartbeat = jobmanager.Heartbeat(jm, WORKER_ID)
+    heartbeat.start()
+    try:
+        for group in list(jm.pending_groups()):
+
+            for gameid in jm.jobs(group, do_job_type=jobmanager.DELETE):
+                delete_game(session, gameid)
+                jm.complete_job(gameid, group)
+                jm.save()
+
+            if pool is None:
+                while True:
+                    job = jm.claim(WORKER_ID, group)
+                    if job is None:
+                        break
+                    _, gameid = job
+                    try:
+                        process_game(session, gameid)
+                        failure = message = None
+                    except Exception, e:
+                        logger.exception("Error while processing {} game {}".format(group, gameid))
+                        session.rollback()
+                        failure, message = manager.classify_failure(e), "{}: {}".format(type(e).__name__, e)
+                    record_result(jm, group, gameid, failure, message)
+            else:
+                for group, gameid, failure, message in pool_results(jm, group, pool, options.workers, options.job_timeout):
+                    record_result(jm, group, gameid, failure, message)
+            print "jobs complete in group " + group
+    finally:
+        heartbeat.stop()
+    print "no jobs remaining"
+
+
 def main():
     f = open(os.path.join(PERSISTENT_FILE_PATH, "test.txt"), 'a')
     f.write("opened file at {}\n".format(time.asctime()))
@@ -50,45 +191,42 @@ def main():
 
     session = manager.init_database(use_mysql=not options.no_remote)
 
-    while True:
-        if os.path.isfile(JOBS_PATH):
-            jm = jobmanager.JobManager(JOBS_PATH)
-            for group in jm.groups():
-
-                for gameid in jm.jobs(group, do_job_type=jobmanager.DELETE):
-                    delete_game(session, gameid)
-                    jm.complete_job(gameid, group)
-                    jm.save()
-                for gameid in jm.jobs(group, do_job_type=jobmanager.TODO):
-                    try:
-                        delete_game(session, gameid)
-                        print ">>>> processing {}".format(gameid)
-                        if options.players_only:
-                            manager.setup_scraper(gameid, PERSISTENT_FILE_PATH, session=session)
-                        else:
-                            manager.import_game(gameid, PERSISTENT_FILE_PATH, session=session)
-
-                        jm.complete_job(gameid, group)
-                        jm.save()
-                        print ">>>> GAME {} complete. {} remaining in this set".format(gameid, jm.job_count())
-                    except Exception:
-                        logger.exception("Error while processing {} game {}".format(group, gameid))
-                        jm.set_job(gameid, group, jobmanager.ERROR)
-                        jm.save()
-                print "jobs complete in group " + group
-            print "no jobs remaining"
-
-        else:
-            print "no jobs file found, waiting to find it"
-        if os.path.isfile(JOBS_PATH):
-            jobs__last_editted = os.stat(JOBS_PATH).st_mtime
-            tries = 0
-            while jobs__last_editted == os.stat(JOBS_PATH).st_mtime:
-                time.sleep(5)
-                tries += 1
-                if tries == 12:
-                    tries = 0
+    pool = None
+    if options.workers > 1:
+        pool = multiprocessing.Pool(options.workers, initializer=init_worker)
+
+    # watch before the first look at the jobs, so no change can slip in between
+    watcher = jobmanager.JobsWatcher(JOBS_PATH, options.poll)
+    try:
+        while True:
+            if os.path.isfile(JOBS_PATH):
+                jm = jobmanager.open_jobs(JOBS_PATH)
+                try:
+                    if any(True for group in jm.pending_groups()):
+                        run_jobs(jm, session, pool)
+                        # our own updates to the jobs file are not news
+                        while watcher.wait(0):
+                            pass
+                        continue
+                    wake_at = jm.next_claim_time()
+                finally:
+                    jm.close()
+                if wake_at is None:
+                    timeout = None
                     print "waiting for changes to {}".format(JOBS_PATH)
+                else:
+                    # jobs being retried, or held by another worker
+                    timeout = max(0, wake_at - time.time())
+                    print "waiting for changes to {}, or {:.0f}s for held jobs".format(JOBS_PATH, timeout)
+            else:
+                timeout = None
+                print "no jobs file found, waiting to find it"
+            watcher.wait(timeout)
+    finally:
+        watcher.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
 
 # Callback called when you run `supervisorctl stop'
@@ -1,10 +1,76 @@
 import yaml
 import os
+import ctypes
+import ctypes.util
+import errno
+import logging
+import select
+import sqlite3
+import struct
+import threading
+import time
+
+logger = logging.getLogger("jobmanager")
 
 TODO = "todo"
 DONE = "> done"
 ERROR = "x error"
 DELETE = "delete"
+QUARANTINE = "quarantine"
+
+# why a job failed
+NETWORK = "network"
+SCRAPE = "scrape"
+PARSE = "parse"
+LINEUP = "lineup"
+DB = "db"
+UNKNOWN = "unknown"
+
+DEFAULT_LEASE_SECONDS = 30 * 60
+SQLITE_EXTENSIONS = (".sqlite", ".db")
+PENDING = (TODO, DELETE)
+DEFAULT_POLL_SECONDS = 5  # without inotify
+
+
+class LeaseLost(StandardError):
+    """ a worker changed a job it no longer holds the lease on """
+
+
+class RetryPolicy(object):
+    """
+    what to do with a failed job.  Transient failures are retried after an
+    exponentially growing delay until max_attempts have failed, and then left
+    as errors.  Deterministic failures will only fail again, so are
+    quarantined at once.  Anything else is an error straight away.
+    """
+    def __init__(self, max_attempts=5, base_delay=60, max_delay=6 * 60 * 60,
+                 transient=(NETWORK, DB), deterministic=(SCRAPE, PARSE, LINEUP)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.transient = transient
+        self.deterministic = deterministic
+
+    def delay(self, attempts):
+        """ seconds to wait before the next try, after attempts failures """
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    def next_job_type(self, failure, attempts):
+        """ return (job_type, seconds until the retry or None) after attempts failures """
+        if failure in self.deterministic:
+            return QUARANTINE, None
+        if failure in self.transient and attempts < self.max_attempts:
+            return TODO, self.delay(attempts)
+        return ERROR, None
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def open_jobs(filepath):
+    """ the job manager for filepath: SQLite for .sqlite or .db files, otherwise yaml """
+    if os.path.splitext(filepath)[1] in SQLITE_EXTENSIONS:
+        return SQLiteJobManager(filepath)
+    return JobManager(filepath)
 
 
 class JobManager:
@@ -23,6 +89,7 @@ class JobManager:
             self._jobs = yaml.load(open(self._filepath, 'r'))
         else:
             self._jobs = {}
+        self._claimed = set()
 
     def has_jobs(self, job_group):
         return job_group in self._jobs and len(self._jobs[job_group]) > 0
@@ -31,6 +98,12 @@ class JobManager:
         for group in self._jobs.keys():
             yield group
 
+    def pending_groups(self, job_types=PENDING):
+        """ the groups with any jobs of job_types """
+        for group, jobs in self._jobs.items():
+            if any(job_type in job_types for job_type in jobs.values()):
+                yield group
+
     def jobs(self, job_group, do_job_type=TODO):
         for job, job_type in self._jobs[job_group].items():
             if job_type == do_job_type:
@@ -42,7 +115,8 @@ class JobManager:
             total += len([i for i in v.values() if i == job_type])
         return total
 
-    def complete_job(self, job, job_group):
+    def complete_job(self, job, job_group, worker=None):
+        """ claims here only hold in this process and are never lost, so worker is not checked """
         if job_group not in self._jobs:
             raise StandardError("No Job Group {}".format(job_group))
         if job not in self._jobs[job_group]:
@@ -75,6 +149,426 @@ class JobManager:
     def clear_jobs(self, job_group):
         del(self._jobs[job_group])
 
+    def claim(self, worker, job_group=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        return the next (job_group, job) to do that is not yet claimed, or
+        None.  A yaml file can't be shared, so claims only hold in this process
+        """
+        groups = [job_group] if job_group is not None else list(self.groups())
+        for group in groups:
+            if not self.has_jobs(group):
+                continue
+            for job in self.jobs(group):
+                if (group, job) not in self._claimed:
+                    self._claimed.add((group, job))
+                    return group, job
+        return None
+
+    def heartbeat(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return len(self._claimed)
+
+    def fail_job(self, job, job_group, failure, message=None, policy=DEFAULT_RETRY_POLICY, worker=None):
+        """
+        mark a job failed.  A yaml file has no room to schedule retries, so a
+        job that would be retried is left as an error.  return the new job_type
+        """
+        job_type = policy.next_job_type(failure, policy.max_attempts)[0]
+        self.set_job(job, job_group, job_type)
+        self._claimed.discard((job_group, job))
+        return job_type
+
+    def failures(self, job_group):
+        """ (job, job_type, failure, attempts, message, retry_at) for the failed jobs in job_group """
+        return [(job, job_type, None, None, None, None) for job, job_type in self._jobs[job_group].items()
+                if job_type in (ERROR, QUARANTINE)]
+
+    def next_claim_time(self):
+        return None
+
+    def release(self, job, job_group):
+        self._claimed.discard((job_group, job))
+
     def save(self):
         with open(self._filepath, 'w') as f:
             yaml.dump(self._jobs, f, default_flow_style=False)
+
+    def close(self):
+        pass
+
+
+# columns after the key and job_type, added to older files as they are opened
+JOB_COLUMNS = [("worker", "TEXT"),
+               ("lease_until", "REAL"),
+               ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+               ("failure", "TEXT"),
+               ("message", "TEXT"),
+               ("retry_at", "REAL")]
+
+# a TODO job nobody holds and that is not waiting to be retried
+CLAIMABLE = ("job_type = '{}' AND (lease_until IS NULL OR lease_until < ?) "
+             "AND (retry_at IS NULL OR retry_at <= ?)").format(TODO)
+
+
+class SQLiteJobManager(object):
+    """
+    the JobManager interface over a SQLite file.  Every change is written as
+    it is made, so save() has nothing left to do.
+
+    Several processes, or hosts sharing a volume with working file locks, can
+    pull jobs from one file: claim() leases a TODO job to a worker, and the
+    lease is held until the job is changed, released, or it runs out without
+    a heartbeat() to renew it.  fail_job() records why a job failed, and
+    holds back a job to retry until its retry time.  Safe to share between
+    threads.
+    """
+    def __init__(self, filepath):
+        self._filepath = filepath
+        self._lock = threading.Lock()
+        # autocommit, so claim can take the write lock before it reads
+        self._db = sqlite3.connect(filepath, timeout=60, isolation_level=None, check_same_thread=False)
+        # job and job_group have no type, so ints and strings come back as they went in
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         "job_group NOT NULL, "
+                         "job NOT NULL, "
+                         "job_type TEXT NOT NULL, "
+                         "PRIMARY KEY (job_group, job))")
+        columns = set(row[1] for row in self._db.execute("PRAGMA table_info(jobs)"))
+        for column, declaration in JOB_COLUMNS:
+            if column not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN {} {}".format(column, declaration))
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_by_type ON jobs (job_type, job_group)")
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _write(self, statements):
+        """ run (sql, args) statements in one transaction.  return rows changed """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                changed = 0
+                for sql, args in statements:
+                    changed += self._db.execute(sql, args).rowcount
+                self._db.execute("COMMIT")
+            except:
+                self._db.execute("ROLLBACK")
+                raise
+        return changed
+
+    def has_jobs(self, job_group):
+        return bool(self._query("SELECT 1 FROM jobs WHERE job_group = ? LIMIT 1", (job_group,)))
+
+    def groups(self):
+        for row in self._query("SELECT DISTINCT job_group FROM jobs"):
+            yield row[0]
+
+    def pending_groups(self, job_types=PENDING):
+        """
+        the groups with any jobs of job_types, found from the job type index.
+        TODO jobs only count while they can be claimed
+        """
+        now = time.time()
+        other_types = [job_type for job_type in job_types if job_type != TODO]
+        sql = "SELECT DISTINCT job_group FROM jobs WHERE job_type IN ({})".format(", ".join("?" * len(other_types)))
+        args = tuple(other_types)
+        if TODO in job_types:
+            sql += " UNION SELECT DISTINCT job_group FROM jobs WHERE " + CLAIMABLE
+            args += (now, now)
+        for row in self._query(sql, args):
+            yield row[0]
+
+    def next_claim_time(self):
+        """ the earliest time a held or delayed TODO job can be claimed, or None with no TODO jobs """
+        return self._query("SELECT MIN(MAX(COALESCE(lease_until, 0), COALESCE(retry_at, 0))) FROM jobs "
+                           "WHERE job_type = ?", (TODO,))[0][0]
+
+    def jobs(self, job_group, do_job_type=TODO):
+        rows = self._query("SELECT job FROM jobs WHERE job_group = ? AND job_type = ? ORDER BY rowid",
+                           (job_group, do_job_type))
+        for row in rows:
+            yield row[0]
+
+    def job_count(self, job_type=TODO):
+        return self._query("SELECT COUNT(*) FROM jobs WHERE job_type = ?", (job_type,))[0][0]
+
+    def _set_type(self, job, job_group, job_type, forget_failures=False, worker=None):
+        """
+        change a job's type and end its lease.  With worker, only a TODO job
+        worker holds is changed.  return true if the job was changed
+        """
+        sql = "UPDATE jobs SET job_type = ?, worker = NULL, lease_until = NULL, retry_at = NULL"
+        if forget_failures:
+            sql += ", attempts = 0, failure = NULL, message = NULL"
+        sql += " WHERE job_group = ? AND job = ?"
+        args = (job_type, job_group, job)
+        if worker is not None:
+            sql += " AND job_type = ? AND worker = ?"
+            args += (TODO, worker)
+        return bool(self._write([(sql, args)]))
+
+    def complete_job(self, job, job_group, worker=None):
+        """
+        mark a job DONE.  With worker, raise LeaseLost unless worker still
+        holds the job, so a worker whose lease ran out and was claimed by
+        another can't also record it
+        """
+        if not self.has_jobs(job_group):
+            raise StandardError("No Job Group {}".format(job_group))
+        if not self._set_type(job, job_group, DONE, worker=worker):
+            if worker is not None and self._query("SELECT 1 FROM jobs WHERE job_group = ? AND job = ?",
+                                                  (job_group, job)):
+                raise LeaseLost("Job {} in group {} is no longer held by {}".format(job, job_group, worker))
+            raise StandardError("No Job {} in group {}".format(job, job_group))
+
+    def get_completed(self, job_group):
+        return list(self.jobs(job_group, DONE))
+
+    def _add_statement(self, job, job_group, job_type, overwrite):
+        if overwrite:
+            return ("INSERT OR REPLACE INTO jobs (job_group, job, job_type) VALUES (?, ?, ?)",
+                    (job_group, job, job_type))
+        return "INSERT INTO jobs (job_group, job, job_type) VALUES (?, ?, ?)", (job_group, job, job_type)
+
+    def add_job(self, job, job_group, job_type=TODO, overwrite=False):
+        self.add_jobs([job], job_group, job_type, overwrite)
+
+    def set_job(self, job, job_group, job_type):
+        """ shortcut to for changing job status.  The job's failures are forgotten """
+        if not self._set_type(job, job_group, job_type, forget_failures=True):
+            self.add_job(job, job_group, job_type)
+
+    def fail_job(self, job, job_group, failure, message=None, policy=DEFAULT_RETRY_POLICY, worker=None):
+        """
+        record that a job failed with failure, one of NETWORK, SCRAPE, PARSE,
+        LINEUP, DB or UNKNOWN, and let policy decide whether and when it is
+        retried.  With worker, raise LeaseLost unless worker still holds the
+        job.  return the new job_type
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT attempts, job_type, worker FROM jobs WHERE job_group = ? AND job = ?",
+                                       (job_group, job)).fetchone()
+                if row is None:
+                    raise StandardError("No Job {} in group {}".format(job, job_group))
+                if worker is not None and (row[1] != TODO or row[2] != worker):
+                    raise LeaseLost("Job {} in group {} is no longer held by {}".format(job, job_group, worker))
+                attempts = row[0] + 1
+                job_type, delay = policy.next_job_type(failure, attempts)
+                retry_at = None if delay is None else time.time() + delay
+                self._db.execute("UPDATE jobs SET job_type = ?, worker = NULL, lease_until = NULL, attempts = ?, "
+                                 "failure = ?, message = ?, retry_at = ? WHERE job_group = ? AND job = ?",
+                                 (job_type, attempts, failure, message, retry_at, job_group, job))
+                self._db.execute("COMMIT")
+            except:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_type
+
+    def failures(self, job_group):
+        """ (job, job_type, failure, attempts, message, retry_at) for the failed jobs in job_group """
+        return self._query("SELECT job, job_type, failure, attempts, message, retry_at FROM jobs "
+                           "WHERE job_group = ? AND (failure IS NOT NULL OR job_type IN (?, ?)) ORDER BY rowid",
+                           (job_group, ERROR, QUARANTINE))
+
+    def add_jobs(self, joblist, job_group, job_type=TODO, overwrite=False,):
+        joblist = list(joblist)
+        try:
+            self._write([self._add_statement(job, job_group, job_type, overwrite) for job in joblist])
+        except sqlite3.IntegrityError:
+            for job in joblist:
+                current = self._query("SELECT job_type FROM jobs WHERE job_group = ? AND job = ?", (job_group, job))
+                if current:
+                    raise StandardError("Job {} in group {}".format(job, job_group) +
+                                        "already exists with value" +
+                                        str(current[0][0])
+                                        )
+            raise
+
+    def clear_jobs(self, job_group):
+        self._write([("DELETE FROM jobs WHERE job_group = ?", (job_group,))])
+
+    def claim(self, worker, job_group=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        lease the next TODO job, in job_group if given, to worker.  return
+        (job_group, job), or None when there is nothing left to claim
+        """
+        sql = "SELECT rowid, job_group, job FROM jobs WHERE " + CLAIMABLE
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                if job_group is None:
+                    row = self._db.execute(sql + " ORDER BY rowid LIMIT 1", (now, now)).fetchone()
+                else:
+                    row = self._db.execute(sql + " AND job_group = ? ORDER BY rowid LIMIT 1",
+                                           (now, now, job_group)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE jobs SET worker = ?, lease_until = ? WHERE rowid = ?",
+                                     (worker, now + lease_seconds, row[0]))
+                self._db.execute("COMMIT")
+            except:
+                self._db.execute("ROLLBACK")
+                raise
+        return None if row is None else (row[1], row[2])
+
+    def heartbeat(self, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """ renew every lease worker holds.  return how many it still holds """
+        return self._write([("UPDATE jobs SET lease_until = ? WHERE worker = ? AND job_type = ?",
+                             (time.time() + lease_seconds, worker, TODO))])
+
+    def release(self, job, job_group):
+        """ give up the lease on a job, leaving it to do """
+        self._write([("UPDATE jobs SET worker = NULL, lease_until = NULL WHERE job_group = ? AND job = ?",
+                      (job_group, job))])
+
+    def import_yaml(self, filepath):
+        """ copy in every job of a yaml jobs file, replacing any already here """
+        jobs = JobManager(filepath)._jobs or {}
+        self._write([self._add_statement(job, job_group, job_type, True)
+                     for job_group, group_jobs in jobs.items() for job, job_type in group_jobs.items()])
+
+    def save(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Heartbeat(threading.Thread):
+    """ renew a worker's job leases in the background until stopped """
+    def __init__(self, jm, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.jm = jm
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.lease_seconds / 3.0):
+            try:
+                self.jm.heartbeat(self.worker, self.lease_seconds)
+            except Exception:
+                # keep beating: a lease has two more renewals before it runs out
+                logger.exception("Unable to renew the job leases of {}".format(self.worker))
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+
+#===============================================================================
+# Waiting for new jobs
+#===============================================================================
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _inotify():
+    """ the libc with inotify, or None off Linux """
+    path = ctypes.util.find_library("c")
+    if path is None:
+        return None
+    libc = ctypes.CDLL(path, use_errno=True)
+    if not hasattr(libc, "inotify_init"):
+        return None
+    return libc
+
+
+class JobsWatcher(object):
+    """
+    wait for a jobs file to be created or changed.  On Linux this blocks on
+    inotify, and costs nothing while idle; elsewhere the file is polled.
+
+    inotify does not see writes made by other hosts to a shared volume, so
+    give a poll_interval there to also check the file every so often.
+    """
+    def __init__(self, filepath, poll_interval=None):
+        self._directory, self._filename = os.path.split(os.path.abspath(filepath))
+        self._filepath = filepath
+        self._fd = None
+        libc = _inotify()
+        if libc is not None:
+            fd = libc.inotify_init()
+            if fd >= 0 and libc.inotify_add_watch(fd, self._directory,
+                                                  IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        if self._fd is None and poll_interval is None:
+            poll_interval = DEFAULT_POLL_SECONDS
+        self.poll_interval = poll_interval
+        self._signature = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self._filepath)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size, st.st_ino
+
+    def _changed(self):
+        signature = self._stat()
+        changed = signature != self._signature
+        self._signature = signature
+        return changed
+
+    def _ready(self, timeout):
+        while True:
+            try:
+                return bool(select.select([self._fd], [], [], timeout)[0])
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def _read_events(self):
+        """ drain the inotify events.  return true if any were for the jobs file """
+        data = os.read(self._fd, 64 * 1024)
+        ours = False
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip("\0")
+            offset += length
+            # a SQLite commit can touch only its -journal or -wal file
+            ours = ours or name.startswith(self._filename)
+        return ours
+
+    def wait(self, timeout=None):
+        """
+        block until the jobs file changes, or timeout seconds pass.  return
+        true if it changed.  Changes since the last wait count, so none are
+        missed between checking for jobs and waiting for more
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            step = remaining
+            if self.poll_interval is not None and (step is None or step > self.poll_interval):
+                step = self.poll_interval
+            if self._fd is not None:
+                if self._ready(step):
+                    if self._read_events():
+                        self._signature = self._stat()
+                        return True
+                    continue
+            elif step:
+                time.sleep(step)
+            if self._changed():
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -8,60 +8,117 @@ class LineupError(Exception):
     pass
 
 
+# bound on the partial layouts Lineup.find_complete_positions will try
+MAX_LAYOUT_STEPS = 100000
+
+
+# bumped whenever a player is renamed or a name's id changes, so PlayerList
+# name indexes know to rebuild.  It is shared by every game in the process, so
+# only real changes bump it: naming a new player or setting the id a name
+# already has don't
+_name_generation = [0]
+
+
+def _names_changed():
+    _name_generation[0] += 1
+
+
+def _same_name(a, b):
+    """ true if a PlayerList name index sees no difference between names a and b """
+    if type(a) is not type(b) or str(a) != str(b):
+        return False
+    return not isinstance(a, Name) or a.id() == b.id()
+
+
+# normalized forms of every name string seen in this process, as
+# (name, lower case name, default id, first, last)
+_canonical_names = {}
+MAX_CANONICAL_NAMES = 100000
+
+
+def _canonical_name(name):
+    if isinstance(name, Name):
+        # already normalized.  Never a key: looking one up would compare it
+        # with the keys through Name.__eq__, which comes back here
+        return str(name), name._lower, name._default_id, name._first, name._last
+    try:
+        return _canonical_names[name]
+    except (KeyError, TypeError):
+        pass
+    raw = name
+    try:
+        name = name.strip()
+        name = name.replace("&apos;", "'").replace("_apos;", "'")
+        if ',' in name:
+            last, first = name.split(',', 1)
+            name = first.strip() + ' ' + last.strip()
+        name = " ".join([word[0].upper() + word[1:] for word in name.split(" ") if word != ''])
+    except AttributeError:
+        pass
+    name = str(name)
+    splitname = name.split(' ', 1)
+    if len(splitname) == 2:
+        first, last = splitname
+        default_id = last.replace(" ", "")[:4].lower() + first[0].lower()
+    else:
+        first, last = "", splitname[0]
+        default_id = name.replace(" ", "")[:5].lower()
+    canonical = (name, name.lower(), default_id, first, last)
+    if type(raw) in (str, unicode):
+        if len(_canonical_names) >= MAX_CANONICAL_NAMES:
+            _canonical_names.clear()
+        _canonical_names[raw] = canonical
+    return canonical
+
+
 class Name(str):
     """ will test quality with lower case, and stripped"""
-    def __new__(self, name):
-        try:
-            name = name.strip()
-            name = name.replace("&apos;", "'").replace("_apos;", "'")
-            if ',' in name:
-                last, first = name.split(',', 1)
-                name = first.strip() + ' ' + last.strip()
-            name = " ".join([word[0].upper() + word[1:] for word in name.split(" ") if word != ''])
-        except AttributeError:
-            pass
+    def __new__(cls, name):
+        normalized, lower, default_id, first, last = _canonical_name(name)
+        self = str.__new__(cls, normalized)
+        self._lower = lower
+        self._default_id = default_id
+        self._first = first
+        self._last = last
+        self._hash = hash(lower)
         self._id = None
-        return str.__new__(self, name)
+        return self
 
     def id(self):
         if self._id is not None:
             return self._id
         else:
-            try:
-                first, last = self.split(" ", 1)
-                return last.replace(" ", "")[:4].lower() + first[0].lower()
-            except ValueError:
-                return self.replace(" ", "")[:5].lower()
+            return self._default_id
 
     def set_id(self, _id):
+        changed = _id != self.id()
         self._id = _id
+        if changed:
+            _names_changed()
+
+    def __hash__(self):
+        # the lower case form, like __eq__, so Names differing only in case share
+        # a dict or set entry.  Names that are only equal through their ids
+        # can't also hash alike, so dict and set lookups don't match by id
+        return self._hash
 
     def __eq__(self, other):
-        if self.lower() == Name(str(other)).lower():
+        if self._lower == _canonical_name(str(other))[1]:
+            return True
+        if self.id() == str(other):
+            return True
+        elif hasattr(other, "id") and self.id() == other.id():
             return True
-        if self.id() is not None:
-            if self.id() == str(other):
-                return True
-            elif hasattr(other, "id") and self.id() == other.id():
-                return True
         return False
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def first(self):
-        splitname = self.split(' ', 1)
-        if len(splitname) == 2:
-            return splitname[0]
-        else:
-            return ""
+        return self._first
 
     def last(self):
-        splitname = self.split(' ', 1)
-        if len(splitname) == 2:
-            return splitname[1]
-        else:
-            return splitname[0]
+        return self._last
 
 
 class Player:
@@ -76,9 +133,9 @@ class Player:
         self._pinch_hitter = False
         self._replacing_field_position = None
 
-        self.name = name
         if name is not None:
-            self.name = Name(self.name)
+            name = Name(name)
+        self.name = name
 
         try:
             self.number = int(number)
@@ -132,6 +189,12 @@ class Player:
         #TODO: add throwing hand vs. batting hand
         #TODO: add switch_hitter flag
 
+    def __setattr__(self, attr, value):
+        # a new player is in no list yet, so only a rename can stale an index
+        if attr == "name" and "name" in self.__dict__ and not _same_name(self.__dict__["name"], value):
+            _names_changed()
+        self.__dict__[attr] = value
+
     def as_odict(self):
         out = OrderedDict()
         for attr in ["name",
@@ -316,6 +379,122 @@ class PlayerList(list):
     """
     def __init__(self):
         list.__init__(self)
+        self._name_index = None
+
+    #---------------------------------------------------------------------------
+    # Name index
+    #
+    # Looking a name up gives the same player as scanning the list and comparing
+    # names with ==.  A Name equals another value when their normalized lower
+    # case forms match, when its id equals the value, or when the ids of both
+    # match.  The index keeps, for each of those keys, the first position in the
+    # list with it.  It is rebuilt after the list changes or any name changes.
+    #---------------------------------------------------------------------------
+
+    def _build_name_index(self):
+        # read first, so a name changed during the build leaves the index stale
+        generation = _name_generation[0]
+        by_lower = {}  # the player's Name, lower case
+        by_id = {}  # the player's Name id
+        by_str = {}  # players whose name is a plain string
+        by_normalized = {}  # any player's name, normalized as a Name, lower case
+        by_text = {}  # any player's name as a plain string
+        for i, p in enumerate(self):
+            name = p.name
+            if isinstance(name, Name):
+                by_lower.setdefault(name.lower(), i)
+                by_id.setdefault(name.id(), i)
+            elif name is not None:
+                by_str.setdefault(name, i)
+            by_normalized.setdefault(_canonical_name(str(name))[1], i)
+            by_text.setdefault(str(name), i)
+        self._name_index = (generation, by_lower, by_id, by_str, by_normalized, by_text)
+
+    def _index_of_name(self, name):
+        """
+        position of the first player whose name equals name, or None.
+        name may be a Name (compared as `name == p.name`) or a plain
+        string (compared as `p.name == name`)
+        """
+        index = self.__dict__.get("_name_index")
+        if index is None or index[0] != _name_generation[0]:
+            self._build_name_index()
+            index = self._name_index
+        _, by_lower, by_id, by_str, by_normalized, by_text = index
+        if isinstance(name, Name):
+            # by_id also covers Names comparing ids with other Names
+            found = (by_normalized.get(name.lower()),
+                     by_text.get(name.id()),
+                     by_id.get(name.id()))
+        else:
+            found = (by_lower.get(_canonical_name(str(name))[1]),
+                     by_id.get(str(name)),
+                     by_str.get(name))
+        found = [i for i in found if i is not None]
+        if found:
+            return min(found)
+        return None
+
+    def _list_changed(self):
+        self._name_index = None
+
+    def __getstate__(self):
+        # an index restored elsewhere could match the wrong name generation
+        state = self.__dict__.copy()
+        state["_name_index"] = None
+        return state
+
+    def append(self, player):
+        self._list_changed()
+        list.append(self, player)
+
+    def extend(self, players):
+        self._list_changed()
+        list.extend(self, players)
+
+    def insert(self, i, player):
+        self._list_changed()
+        list.insert(self, i, player)
+
+    def remove(self, player):
+        self._list_changed()
+        list.remove(self, player)
+
+    def pop(self, *args):
+        self._list_changed()
+        return list.pop(self, *args)
+
+    def sort(self, *args, **kwargs):
+        self._list_changed()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._list_changed()
+        list.reverse(self)
+
+    def __setitem__(self, i, player):
+        self._list_changed()
+        list.__setitem__(self, i, player)
+
+    def __delitem__(self, i):
+        self._list_changed()
+        list.__delitem__(self, i)
+
+    def __setslice__(self, i, j, players):
+        self._list_changed()
+        list.__setslice__(self, i, j, players)
+
+    def __delslice__(self, i, j):
+        self._list_changed()
+        list.__delslice__(self, i, j)
+
+    def __iadd__(self, players):
+        self._list_changed()
+        return list.__iadd__(self, players)
+
+    def __imul__(self, n):
+        self._list_changed()
+        return list.__imul__(self, n)
 
     def add_players(self, player_list):
         """
@@ -356,14 +535,13 @@ class PlayerList(list):
         if already in lineup, replace old player
         return True if added, False if merged with old
         """
-        my_player_names = [p.name for p in self]
         if player.name is None:
             raise StandardError("All Players must have names")
-        if player.name not in my_player_names:
+        merge_index = self._index_of_name(player.name)
+        if merge_index is None:
             self.append(player)
             return True
         else:
-            merge_index = my_player_names.index(player.name)
             current_player = self[merge_index]
             if current_player.iddict != player.iddict:
                 self.append(player)
@@ -374,9 +552,9 @@ class PlayerList(list):
 
     def find_player_by_name(self, name):
         name = name.strip()
-        for p in self:
-            if p.name == name:
-                return p
+        index = self._index_of_name(name)
+        if index is not None:
+            return self[index]
         # for p in self:
         #     if p.name.split(' ')[-1] == name.split(' ')[-1]:
         #         return p
@@ -544,22 +722,74 @@ class Lineup(PlayerList):
         self.add_player(player)
 
 
-    def find_complete_positions(self):
+    def find_complete_positions(self, max_options=None, max_steps=MAX_LAYOUT_STEPS):
         """
-        return a list of all valid position layouts for a team
+        return a list of all valid position layouts for a team, as tuples of
+        positions in player order, in the order itertools.product over every
+        player's all_positions would find them.
+
+        max_options - stop once this many layouts are found
+        max_steps - raise LineupError rather than search more partial layouts
         """
-        save_positions = [p.position for p in self]
+        # A complete lineup has every batting order slot filled, which takes
+        # at least 9 players, and at most 9 players without a DH or 10 with
+        # one.  So 9 players fill the 9 fielding positions one each, with the
+        # pitcher batting, and 10 players fill those and the DH one each.
+        orders = set(p.order for p in self)
+        if len(self) not in (9, 10) or not orders.issuperset(range(1, 10)):
+            return []
+        if len(self) == 10:
+            slots = set(POSITIONS + [DH])
+        else:
+            slots = set(POSITIONS)
+
+        choices = []
+        for p in self:
+            if len(self) == 9 and p.order is None:
+                choices.append([pos for pos in p.all_positions if pos in slots and pos != P])
+            else:
+                choices.append([pos for pos in p.all_positions if pos in slots])
+
         options = []
-        try:
-            team_positions = [p.all_positions for p in self]
-            for test_positions in itertools.product(*team_positions):
-                for player, position in zip(self, test_positions):
-                    player.position = position
-                if self.is_complete():
-                    options.append(test_positions)
-        finally:
-            for player, position in zip(self, save_positions):
-                player.position = position
+        layout = []
+        taken = set()
+        steps = [0]
+
+        def can_fill(start):
+            """ can players start.. each take a different open slot """
+            matched = {}
+
+            def augment(i, seen):
+                for pos in choices[i]:
+                    if pos in taken or pos in seen:
+                        continue
+                    seen.add(pos)
+                    if pos not in matched or augment(matched[pos], seen):
+                        matched[pos] = i
+                        return True
+                return False
+            return all(augment(i, set()) for i in range(start, len(choices)))
+
+        def search(i):
+            if i == len(choices):
+                options.append(tuple(layout))
+                return max_options is not None and len(options) >= max_options
+            for pos in choices[i]:
+                if pos in taken:
+                    continue
+                steps[0] += 1
+                if max_steps is not None and steps[0] > max_steps:
+                    raise LineupError("Gave up looking for complete lineups after %s steps" % max_steps)
+                taken.add(pos)
+                layout.append(pos)
+                try:
+                    if can_fill(i + 1) and search(i + 1):
+                        return True
+                finally:
+                    layout.pop()
+                    taken.discard(pos)
+            return False
 
+        search(0)
         return options
 
@@ -1,10 +1,17 @@
 import os
 import re
+import time
+import socket
+import httplib
+import urllib2
 import logging
+import weakref
+from collections import OrderedDict
 logger = logging.getLogger("manager")
 
 import pyparsing as pp
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, or_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 
 import gamestate
@@ -13,20 +20,21 @@ import pointstreakparser as psp
 import pointstreakscraper as pss
 from models.playerinfo import PlayerInfo
 import subtracker
+import jobmanager
+from lineup import LineupError
 
 from models import event
 from models import playerinfo
 from models import gameinfomodel
 from models import teaminfomodel
+from models import parserecord
 import gamewrapper
 
 from constants import BASE_DIR, CONTAINER_PATH
 from gamecontainer import GameContainer, GameContainerLogHandler
 
-from setuplogger import GameContextFilter
-
-CHECKED_PLAYERS = {}
-
+from setuplogger import GameLogAdapter, GameLogContext
+from checkpoints import GameCheckpoints
 
 def find_new_player_id(session, base_name):
     index = 1
@@ -39,17 +47,290 @@ def find_new_player_id(session, base_name):
     raise StandardError("Could not find a unqiue id for base name {}".format(base_name))
 
 
-def import_game(gameid, cache_path=None, game=None, session=None, force_fresh=False):
+MAX_ID_INDEX = 9  # new SBS ids run from base001 to base009
+
+
+class PlayerIdResolver(object):
+    """
+    Map roster players to their SBS_ID in the players table.
+
+    Players are keyed by (first, last, team_id), compared without case like the
+    MySQL database does.  Known ids are kept in an LRU of max_size entries.  On a
+    miss every players row for the missing teams is loaded in one query, and new
+    ids are allocated for the whole roster with one more query, so a game costs a
+    couple of queries however many players it has.
+
+    Ids allocated for new players are only remembered once commit() is called,
+    so a rolled back game does not leave ids behind that were never stored.
+    """
+    def __init__(self, session, max_size=20000):
+        self.session = session
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._pending = {}
+
+    def _key(self, first, last, team_id):
+        key = (first.lower(), last.lower(), team_id)
+        hash(key)
+        return key
+
+    def _remember(self, key, sbs_id):
+        self._ids.pop(key, None)
+        self._ids[key] = sbs_id
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def _cached(self, key):
+        sbs_id = self._ids.pop(key, None)
+        if sbs_id is not None:
+            self._ids[key] = sbs_id
+        return sbs_id
+
+    def warm(self, team_ids):
+        """ load every known player for team_ids with a single query """
+        team_ids = set(team_ids)
+        if not team_ids:
+            return
+        query = self.session.query(PlayerInfo.FIRST_NAME, PlayerInfo.LAST_NAME, PlayerInfo.TEAM_ID, PlayerInfo.SBS_ID)
+        in_teams = PlayerInfo.TEAM_ID.in_([t for t in team_ids if t is not None])
+        if None in team_ids:
+            in_teams = or_(in_teams, PlayerInfo.TEAM_ID == None)
+        seen = set()
+        for first, last, team_id, sbs_id in query.filter(in_teams).order_by(PlayerInfo.ID):
+            key = self._key(first or "", last or "", team_id)
+            if key in seen:
+                logger.warning("More than one player found for name: {} {}".format(first, last))
+                continue
+            seen.add(key)
+            self._remember(key, sbs_id)
+
+    def _allocate_ids(self, base_names):
+        """ return a new unused SBS_ID for each base name, with one query """
+        candidates = [base + "{:03d}".format(index) for base in set(base_names) for index in range(1, MAX_ID_INDEX + 1)]
+        taken = set(sbs_id.lower() for (sbs_id,) in
+                    self.session.query(PlayerInfo.SBS_ID).filter(PlayerInfo.SBS_ID.in_(candidates)) if sbs_id)
+        new_ids = []
+        for base in base_names:
+            for index in range(1, MAX_ID_INDEX + 1):
+                new_id = base + "{:03d}".format(index)
+                if new_id.lower() not in taken:
+                    break
+            else:
+                raise StandardError("Could not find a unqiue id for base name {}".format(base))
+            taken.add(new_id.lower())
+            new_ids.append(new_id)
+        return new_ids
+
+    def resolve(self, players):
+        """
+        set the name id of every player, adding new players to the session.
+        """
+        self._pending = {}
+        missing = []
+        for player in players:
+            try:
+                key = self._key(player.name.first(), player.name.last(), player.team_id)
+            except TypeError:
+                logger.warning("Could not cache {}".format((player.name.first(), player.name.last(), player.team_id)))
+                self._resolve_uncached(player)
+                continue
+            sbs_id = self._cached(key)
+            if sbs_id is not None:
+                player.name.set_id(sbs_id)
+            else:
+                missing.append((key, player))
+
+        if missing:
+            self.warm(player.team_id for _, player in missing)
+        new_players = []
+        for key, player in missing:
+            sbs_id = self._cached(key)
+            if sbs_id is not None:
+                player.name.set_id(sbs_id)
+            else:
+                new_players.append((key, player))
+
+        if new_players:
+            # a player listed twice is added once and both get the same id
+            unique = OrderedDict()
+            for key, player in new_players:
+                unique.setdefault(key, player)
+            new_ids = self._allocate_ids([player.name.id() for player in unique.values()])
+            for (key, player), sbs_id in zip(unique.items(), new_ids):
+                player.name.set_id(sbs_id)
+                self._pending[key] = sbs_id
+                self.session.add(player.to_model())
+                logger.info("Add {} to DB".format(player.name))
+            for key, player in new_players:
+                player.name.set_id(self._pending[key])
+
+    def _resolve_uncached(self, player):
+        player_models = self.session.query(PlayerInfo).filter_by(FIRST_NAME=player.name.first(), LAST_NAME=player.name.last(), TEAM_ID=player.team_id)
+        if player_models.count() < 1:
+            sbs_id = find_new_player_id(self.session, player.name.id())
+            player.name.set_id(sbs_id)
+            self.session.add(player.to_model())
+            logger.info("Add {} to DB".format(player.name))
+        else:
+            if player_models.count() > 1:
+                logger.warning("More than one player found for name: {} {}".format(player.name.first(), player.name.last()))
+            player.name.set_id(player_models[0].SBS_ID)
+
+    def commit(self):
+        """ call after the session commit, to remember the new players """
+        for key, sbs_id in self._pending.items():
+            self._remember(key, sbs_id)
+        self._pending = {}
+
+    def rollback(self):
+        self._pending = {}
+
+
+_resolvers = weakref.WeakKeyDictionary()
+
+
+def player_id_resolver(session):
+    """ the PlayerIdResolver kept for a session """
+    resolver = _resolvers.get(session)
+    if resolver is None:
+        resolver = _resolvers[session] = PlayerIdResolver(session)
+    return resolver
+
+
+class EventWriter(object):
+    """
+    collect the event rows of whole games and insert them with a single
+    executemany per batch, skipping the ORM entirely.
+
+    batch_size is the number of rows to buffer before writing.  Games are never
+    split across batches.  The default of 1 writes each game as it is added.
+    """
+    def __init__(self, session, batch_size=1):
+        self.session = session
+        self.batch_size = batch_size
+        self.rows = []
+        self.parses = []
+        self.replaced = []  # games whose old events are deleted as the batch is written
+        self.game_count = 0
+
+    def add_game(self, game, content_hash=None):
+        self.add_rows(game.event_rows(), game.game_id, content_hash)
+
+    def add_rows(self, rows, gameid=None, content_hash=None, replace=False):
+        """
+        add the event rows of one game, as from GameState.event_rows.  With a
+        content_hash, record it as the container the game was parsed from.
+        With replace, the game's old events are deleted in the same
+        transaction that writes the new ones, so no write lock is held while
+        the batch fills
+        """
+        self.rows.extend(rows)
+        if replace:
+            self.replaced.append(gameid)
+        if content_hash is not None:
+            self.parses.append(dict(GAME_ID=str(gameid), CONTENT_HASH=content_hash, PARSED_AT=int(time.time())))
+        self.game_count += 1
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        events = event.Event.__table__
+        # keep the IN clause a sane size
+        for i in range(0, len(self.replaced), 500):
+            self.session.execute(events.delete().where(events.c.GAME_ID.in_(self.replaced[i:i + 500])))
+        if self.parses:
+            parses = parserecord.ParseRecord.__table__
+            self.session.execute(parses.delete().where(parses.c.GAME_ID.in_([p["GAME_ID"] for p in self.parses])))
+            self.session.execute(parses.insert(), self.parses)
+        if self.rows:
+            self.session.execute(events.insert(), self.rows)
+            logger.info("wrote {} events from {} games".format(len(self.rows), self.game_count))
+        if self.rows or self.parses or self.replaced:
+            self.session.commit()
+        self.discard()
+
+    def discard(self):
+        """ drop anything not yet written """
+        self.rows = []
+        self.parses = []
+        self.replaced = []
+        self.game_count = 0
+
+
+def parsed_hashes(session, gameids):
+    """ return {gameid: content hash} for the games in gameids with a recorded parse """
+    hashes = {}
+    gameids = [str(gameid) for gameid in gameids]
+    # keep the IN clause a sane size
+    for i in range(0, len(gameids), 500):
+        query = session.query(parserecord.ParseRecord).filter(parserecord.ParseRecord.GAME_ID.in_(gameids[i:i + 500]))
+        hashes.update((record.GAME_ID, record.CONTENT_HASH) for record in query)
+    return hashes
+
+
+def forget_parse(session, gameid):
+    """ drop the recorded parse of gameid, as when its events are deleted """
+    session.query(parserecord.ParseRecord).filter(parserecord.ParseRecord.GAME_ID == str(gameid)).delete()
+
+
+def container_unchanged(session, gameid, container_path=CONTAINER_PATH):
+    """
+    true if gameid's saved container, and the parsing code, are unchanged since
+    its stored events were parsed
+    """
+    parsed_hash = parsed_hashes(session, [gameid]).get(str(gameid))
+    if parsed_hash is None:
+        return False
+    try:
+        gc = GameContainer(container_path, gameid)
+    except (IOError, ValueError, KeyError):
+        return False
+    return gc.content_hash() == parsed_hash
+
+
+def classify_failure(exception):
+    """ the jobmanager failure class (NETWORK, SCRAPE, ...) of an exception raised importing a game """
+    if isinstance(exception, urllib2.HTTPError):
+        # a busy server may recover, but a missing page stays missing
+        if exception.code >= 500 or exception.code == 429:
+            return jobmanager.NETWORK
+        return jobmanager.SCRAPE
+    if isinstance(exception, (urllib2.URLError, socket.error, httplib.HTTPException)):
+        return jobmanager.NETWORK
+    if isinstance(exception, pss.ScrapeError):
+        # the page was fetched, or read from the html cache, and had no game
+        return jobmanager.SCRAPE
+    if isinstance(exception, pp.ParseBaseException):
+        return jobmanager.PARSE
+    if isinstance(exception, LineupError):
+        return jobmanager.LINEUP
+    if isinstance(exception, SQLAlchemyError):
+        return jobmanager.DB
+    return jobmanager.UNKNOWN
+
+
+def import_game(gameid, cache_path=None, game=None, session=None, force_fresh=False, writer=None):
     try:
         if force_fresh:
             raise IOError("Not actually an IOError.")
         gc = GameContainer(CONTAINER_PATH, gameid)
     except IOError:
         gc = scrape_to_container(gameid, cache_path, session)
-    return parse_from_container(gc, game, session)
+    return parse_from_container(gc, game, session, writer)
 
 
 def setup_scraper(gameid, cache_path=None, session=None):
+    d = scrape_game(gameid, cache_path)
+    if session is not None:
+        sync_game(session, gameid, d[1], d[4], d[5])
+    return d[:1] + d[2:]
+
+
+def scrape_game(gameid, cache_path=None):
+    """
+    scrape a game without touching the database.  return (scraper, game_info,
+    away_starting_lineup, home_starting_lineup, away_roster, home_roster)
+    """
     gameid = str(gameid)
 
     scraper = pss.PointStreakScraper(gameid, cache_path)
@@ -61,11 +342,6 @@ def setup_scraper(gameid, cache_path=None, session=None):
     home = scraper.home_team()
     away = scraper.away_team()
 
-    if session:
-        for team_name in (home, away):
-            session.query(teaminfomodel.TeamInfo).filter_by(FULL_NAME=team_name)
-            #TODO: put home and away teams into the TeamInfo
-
     game_info = gameinfo.GameInfo(gameid)
     game_info.set_game_info(scraper.game_info)
 
@@ -77,47 +353,35 @@ def setup_scraper(gameid, cache_path=None, session=None):
     #away_roster, home_roster = scraper.game_rosters()
     away_starting_lineup, home_starting_lineup, away_roster, home_roster = scraper.starting_lineups()
     game_info.set_starting_players(away_starting_lineup, home_starting_lineup)
+    return scraper, game_info, away_starting_lineup, home_starting_lineup, away_roster, home_roster
 
 
-    # sync up with the player database.
-    if session is not None:
-        game_info_query = session.query(gameinfomodel.GameInfoModel).filter_by(GAME_ID=gameid)
+def sync_game(session, gameid, game_info, away_roster, home_roster):
+    """ store a scraped game's info, and give its players their database ids """
+    gameid = str(gameid)
+    for team_name in (game_info.home_team_id, game_info.away_team_id):
+        session.query(teaminfomodel.TeamInfo).filter_by(FULL_NAME=team_name)
+        #TODO: put home and away teams into the TeamInfo
 
-        if game_info_query.count() < 1:
-            session.add(game_info.as_model())
-            logger.info("added game info to db")
-        else:
-            if game_info_query.count() > 1:
-                logger.warning("More than one game found with id: {}".format(gameid))
-            game_info_query.delete()
-            session.add(game_info.as_model())
+    game_info_query = session.query(gameinfomodel.GameInfoModel).filter_by(GAME_ID=gameid)
 
-        for player in away_roster + home_roster:
-            logger.info("Checking DB for Player {}".format(player.name))
-            try:
-                cached = (player.name.first(), player.name.last(), player.team_id) in CHECKED_PLAYERS
-            except TypeError:
-                logger.warning("Could not cache {}".format((player.name.first(), player.name.last(), player.team_id)))
-                cached = False
-            if cached:
-                player.name.set_id(CHECKED_PLAYERS[(player.name.first(), player.name.last(), player.team_id)])
-            else:
-                player_models = session.query(PlayerInfo).filter_by(FIRST_NAME=player.name.first(), LAST_NAME=player.name.last(), TEAM_ID=player.team_id)
-                if player_models.count() < 1:
-                    sbs_id = find_new_player_id(session, player.name.id())
-                    player.name.set_id(sbs_id)
-                    session.add(player.to_model())
-                    logger.info("Add {} to DB".format(player.name))
-                elif player_models.count() > 1:
-                    logger.warning("More than one player found for name: {} {}".format(player.name.first(), player.name.last()))
-                    player.name.set_id(player_models[0].SBS_ID)
-                elif player_models.count() == 1:
-                    player.name.set_id(player_models[0].SBS_ID)
-                    #m = player.to_model(player_models[0])  # update existing model
-                    #session.merge(m)
-                CHECKED_PLAYERS[(player.name.first(), player.name.last(), player.team_id)] = player.name.id()
+    if game_info_query.count() < 1:
+        session.add(game_info.as_model())
+        logger.info("added game info to db")
+    else:
+        if game_info_query.count() > 1:
+            logger.warning("More than one game found with id: {}".format(gameid))
+        game_info_query.delete()
+        session.add(game_info.as_model())
+
+    resolver = player_id_resolver(session)
+    try:
+        resolver.resolve(away_roster + home_roster)
         session.commit()
-    return scraper, away_starting_lineup, home_starting_lineup, away_roster, home_roster
+    except:
+        resolver.rollback()
+        raise
+    resolver.commit()
 
 def scrape_to_container(gameid, cache_path=None, session=None, save_container=True):
     """
@@ -128,14 +392,16 @@ def scrape_to_container(gameid, cache_path=None, session=None, save_container=Tr
 
     d = setup_scraper(gameid, cache_path, session)
     scraper, away_starting_lineup, home_starting_lineup, away_roster, home_roster = d
-    #=======================================================================
-    # Move into game container
-    #=======================================================================
+    return container_from_scraper(gameid, scraper, away_roster, home_roster, save_container)
+
 
+def container_from_scraper(gameid, scraper, away_roster, home_roster, save_container=True,
+                           container_path=CONTAINER_PATH):
+    """ move a scraped game into a GameContainer """
     home = scraper.home_team()
     away = scraper.away_team()
 
-    gc = GameContainer(CONTAINER_PATH, gameid, away, home)
+    gc = GameContainer(container_path, gameid, away, home)
 
     gc.url = pss.make_html_url(gameid)
 
@@ -158,7 +424,16 @@ def scrape_to_container(gameid, cache_path=None, session=None, save_container=Tr
     return gc
 
 
-def parse_from_container(gc, game=None, session=None):
+def parse_from_container(gc, game=None, session=None, writer=None, checkpoints=False):
+    """
+    parse a game container into a GameState.  Events are written with writer
+    (an EventWriter) if given, otherwise added to session one at a time.
+
+    with checkpoints, resume from the last saved half inning that the
+    container's edits leave valid, and save a checkpoint at every half.
+    """
+    if checkpoints:
+        checkpoints = GameCheckpoints(gc)
     names_in_game = [p.name for p in gc.away_roster() + gc.home_roster()]
     home_subs = []
     away_subs = []
@@ -194,86 +469,95 @@ def parse_from_container(gc, game=None, session=None):
                 player.set_position(player.starting_position[0])
 
 
-    if game is None:
-        game = gamestate.GameState()
+    # this game's place in the parse goes on each of its log records, and its
+    # warnings and errors into the container.  The shared module loggers only
+    # get one GameLogRouter handler each, which hands records to their game's
+    # handler, so several games can be parsed at once.
+    log_context = GameLogContext(GameContainerLogHandler(gc))
+    log = GameLogAdapter(logger, log_context)
 
-    # setup log filter to add contextual info to logs
-    game_context_log_filter = GameContextFilter()
-    logger.addFilter(game_context_log_filter)
-    game.logger.addFilter(game_context_log_filter)  # will add context (current inning etc) to the error logs
-    psp.gamewrapper.logger.addFilter(game_context_log_filter)
+    resume_half = 0
+    if checkpoints:
+        restored = checkpoints.restore()
+        if restored is not None:
+            resume_half, game = restored
+            logger.info("Resuming game {} at half {}".format(gc.gameid, resume_half))
 
-    gc_handler = GameContainerLogHandler(gc)
-    game.logger.addHandler(gc_handler)  # will ensure that errors get inserted into container
-    logger.addHandler(gc_handler)
-    psp.gamewrapper.logger.addHandler(gc_handler)
+    if game is None:
+        game = gamestate.GameState()
+    game.logger = GameLogAdapter(logging.getLogger("gamestate"), log_context)
     try:
-        game.home_team_id = gc.home_team
-        game.visiting_team = gc.away_team
-        game.game_id = gc.gameid
+        if resume_half == 0:
+            game.home_team_id = gc.home_team
+            game.visiting_team = gc.away_team
+            game.game_id = gc.gameid
 
-        game.set_away_lineup(gc.away_lineup())
-        game.set_home_lineup(gc.home_lineup())
+            game.set_away_lineup(gc.away_lineup())
+            game.set_home_lineup(gc.home_lineup())
 
-        game.set_away_roster(gc.away_roster())
-        game.set_home_roster(gc.home_roster())
+            game.set_away_roster(gc.away_roster())
+            game.set_home_roster(gc.home_roster())
 
         #=======================================================================
         # Parse plays
         #=======================================================================
 
-        gw = gamewrapper.GameWrapper(game)
+        gw = gamewrapper.GameWrapper(game, GameLogAdapter(psp.gamewrapper.logger, log_context))
         parser = psp.PointStreakParser(gw, names_in_game)
 
-        for half in gc.halfs():
+        for half_index, half in enumerate(gc.halfs()):
+            if half_index < resume_half:
+                continue
+            if checkpoints:
+                checkpoints.take(half_index, game)
             game.new_half()
-            game_context_log_filter.inning = game.inning
-            game_context_log_filter.is_bottom = bool(game.half_inning)
-            game_context_log_filter.event_num = 0
+            log_context.inning = game.inning
+            log_context.is_bottom = bool(game.half_inning)
+            log_context.event_num = 0
             for event_info in half:
                 try:
                     if "batter" in event_info:
                         game.new_batter(event_info["batter"], event_info.get("batter_number"))
-                    logger.debug("Parsing: {}".format(event_info["text"]))
+                    log.debug("Parsing: %s", event_info["text"])
                     parser.parse_event(event_info["text"])
                 except pp.ParseException, pe:
                     try:
-                        logger.critical("PARSE ERROR - " + pe.markInputline(),
+                        log.critical("PARSE ERROR - " + pe.markInputline(),
                                         extra=dict(title=event_info["title"],
                                                     inning=game.inning,
                                                     bottom=game.half_inning
                                                     )
                                         )
                     except:
-                        logger.error("Error logging error! Possible source: {}".format(event_info["text"]))
+                        log.error("Error logging error! Possible source: {}".format(event_info["text"]))
                     raise
                 except Exception, e:
                     try:
-                        logger.critical(str(e))
+                        log.critical(str(e))
                     except:
-                        logger.error("Error loggin error!  Possible source: {}".format(event_info["text"]))
+                        log.error("Error loggin error!  Possible source: {}".format(event_info["text"]))
                     raise  # StandardError("Error with event: {}".format(raw_event.text()))
-                game_context_log_filter.event_num += 1
+                log_context.event_num += 1
 
         game.set_previous_event_as_game_end()
 
         for p in game.home_roster + game.away_roster:
             for stat in ["AB", "R", "H", "RBI", "BB", "SO"]:
                 if p.bat_stats.get(stat, 0) != p.verify_bat_stats.get(stat, 0):
-                    logger.warning(" counted {} {} does not equal reported {} {} for player {}".format(stat, p.bat_stats.get(stat, 0), stat, p.verify_bat_stats.get(stat, 0), p.name))
+                    log.warning(" counted {} {} does not equal reported {} {} for player {}".format(stat, p.bat_stats.get(stat, 0), stat, p.verify_bat_stats.get(stat, 0), p.name))
 
-        if session is not None:
+        if writer is not None:
+            writer.add_game(game, gc.content_hash())
+        elif session is not None:
             for e in game.events():
                 session.add(e)
+            session.merge(parserecord.ParseRecord(GAME_ID=str(gc.gameid), CONTENT_HASH=gc.content_hash(),
+                                                  PARSED_AT=int(time.time())))
             session.commit()
     finally:
         gc.save()
-        game.logger.removeFilter(game_context_log_filter)
-        game.logger.removeHandler(gc_handler)
-        logger.removeFilter(game_context_log_filter)
-        logger.removeHandler(gc_handler)
-        psp.gamewrapper.logger.removeFilter(game_context_log_filter)
-        psp.gamewrapper.logger.removeHandler(gc_handler)
+        if checkpoints:
+            checkpoints.save()
 
 
     return game
@@ -302,6 +586,7 @@ def init_database(use_mysql=False, dbname="sbs"):
     gameinfomodel.Base.metadata.create_all(engine)
     playerinfo.Base.metadata.create_all(engine)
     teaminfomodel.Base.metadata.create_all(engine)
+    parserecord.Base.metadata.create_all(engine)
     Session = sessionmaker(bind=engine)
     session = Session()
     return session
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class ParseRecord(Base):
+    """ the GameContainer content hash a game's stored events were parsed from """
+    __tablename__ = 'parses'
+
+    GAME_ID = Column(String(12), primary_key=True)
+    CONTENT_HASH = Column(String(40))
+    PARSED_AT = Column(Integer)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+"""
+pipeline.py
+
+Import games as a stream through five stages joined by bounded queues:
+
+    discover -> fetch -> scrape -> parse -> load
+
+discover lists a season's game ids, fetch pulls each game's html and xml into
+the html cache, scrape turns the cached pages into a saved GameContainer and
+syncs its game info and player ids, parse replays the container in a process
+pool, and load writes the events through one EventWriter.
+
+Every stage runs its own number of workers.  The queues between them are
+bounded, so a slow stage holds back the ones feeding it instead of piling up
+work, and the database writer is never handed more than it can take.
+
+    python pipeline.py --season 12252 --fetch 8 --scrape 4 --parse 4
+    python pipeline.py 87568 87259 --force
+"""
+import logging
+import multiprocessing
+import os
+import Queue
+import threading
+import time
+
+import manager
+import pointstreakscraper as pss
+import reparse
+import scrapetools
+import setuplogger
+from constants import CONTAINER_PATH
+from gamecontainer import GameContainer
+
+logger = logging.getLogger("pipeline")
+
+DEFAULT_QUEUE_SIZE = 16  # items waiting between two stages
+DEFAULT_BATCH_SIZE = 5000  # event rows per insert
+
+_STOP = object()
+
+
+def parse_container(job):
+    """
+    parse one saved container in a pool process.  job is (container_path,
+    gameid).  return (gameid, rows, content_hash, failure, message), with the
+    failure class and message instead of rows if it failed
+    """
+    container_path, gameid = job
+    try:
+        gc = GameContainer(container_path, gameid)
+        game = manager.parse_from_container(gc)
+        return gameid, list(game.event_rows()), gc.content_hash(), None, None
+    except Exception, e:
+        logger.exception("Error parsing game {}".format(gameid))
+        return gameid, None, None, manager.classify_failure(e), "{}: {}".format(type(e).__name__, e)
+
+
+class StageError(Exception):
+    """ an item failed in a stage, already classified """
+    def __init__(self, failure, message):
+        Exception.__init__(self, message)
+        self.failure = failure
+
+
+class Stage(object):
+    """
+    workers threads that take items from inbox, call function on each, and
+    put everything it returns on outbox.  A failed item is passed to
+    on_error(stage name, item, exception) and dropped.  When the last worker
+    sees the end of its inbox it calls on_finish(), and the end is passed on
+    to the next stage
+    """
+    def __init__(self, name, function, workers, inbox, outbox=None, on_error=None, on_finish=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.on_error = on_error
+        self.on_finish = on_finish
+        self.next_stage = None
+        self.done = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+        self._threads = []
+
+    def start(self):
+        self._running = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name="{}-{}".format(self.name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """ tell the workers there is nothing more coming """
+        for i in range(self.workers):
+            self.inbox.put(_STOP)
+
+    def join(self):
+        for thread in self._threads:
+            # a join with a timeout can still be interrupted by ctrl-c
+            while thread.is_alive():
+                thread.join(1)
+
+    def _work(self):
+        try:
+            while True:
+                item = self.inbox.get()
+                if item is _STOP:
+                    break
+                start = time.time()
+                try:
+                    results = self.function(item)
+                    ok = True
+                except Exception, e:
+                    ok = False
+                    if self.on_error is not None:
+                        self.on_error(self.name, item, e)
+                with self._lock:
+                    self.busy_seconds += time.time() - start
+                    if ok:
+                        self.done += 1
+                    else:
+                        self.failed += 1
+                if ok and self.outbox is not None:
+                    for result in results or []:
+                        self.outbox.put(result)
+        finally:
+            with self._lock:
+                self._running -= 1
+                last = self._running == 0
+            if last:
+                try:
+                    if self.on_finish is not None:
+                        self.on_finish()
+                finally:
+                    if self.next_stage is not None:
+                        self.next_stage.stop()
+
+
+class GamePipeline(object):
+    """
+    scrape, parse and load games with each stage's workers set separately.
+    new_session() makes a database session; the scrape and load stages each
+    get their own.
+
+    Games with a saved container are not fetched or scraped again unless
+    force_fresh, the same as manager.import_game
+    """
+    def __init__(self, new_session, cache_path=None, container_path=CONTAINER_PATH, fetch_workers=8,
+                 scrape_workers=2, parse_workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, force_fresh=False, report=None):
+        self.cache_path = cache_path
+        self.container_path = container_path
+        self.force_fresh = force_fresh
+        self.report = report
+        self.parse_workers = parse_workers or multiprocessing.cpu_count()
+        self.failures = []  # (stage, gameid, failure, message)
+        self.loaded = 0
+        self.events = 0
+        self._unwritten = []  # (gameid, event count) added to the writer but not yet written
+        self._seen = set()
+        self._sync_session = new_session()
+        # players get their ids one game at a time
+        self._sync_lock = threading.Lock()
+        self._load_session = new_session()
+        self._writer = manager.EventWriter(self._load_session, batch_size)
+        self._pool = None
+
+        queues = [Queue.Queue(queue_size) for i in range(5)]
+        self.stages = [Stage("discover", self.discover, 1, queues[0], queues[1], self._failed),
+                       Stage("fetch", self.fetch, fetch_workers, queues[1], queues[2], self._failed),
+                       Stage("scrape", self.scrape, scrape_workers, queues[2], queues[3], self._failed),
+                       # each parse thread keeps one pool process busy
+                       Stage("parse", self.parse, self.parse_workers, queues[3], queues[4], self._failed),
+                       # one writer, so one load worker
+                       Stage("load", self.load, 1, queues[4], None, self._failed, self._finish_load)]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    #---------------------------------------------------------------------------
+    # stages.  each takes one item and returns a list of items for the next
+    #---------------------------------------------------------------------------
+
+    def discover(self, item):
+        """ item is ("season", seasonid) or ("game", gameid).  return the new game ids """
+        kind, value = item
+        if kind == "season":
+            gameids = pss.scrape_season_gameids(value, cache_path=self.cache_path)
+        else:
+            gameids = [value]
+        new = [str(gameid) for gameid in gameids if str(gameid) not in self._seen]
+        self._seen.update(new)
+        return new
+
+    def _container_saved(self, gameid):
+        return os.path.isfile(os.path.join(self.container_path, "gc_{}.json".format(gameid)))
+
+    def fetch(self, gameid):
+        if self.force_fresh or not self._container_saved(gameid):
+            pss.fetch_game_pages(gameid, self.cache_path)
+        return [gameid]
+
+    def scrape(self, gameid):
+        if self.force_fresh or not self._container_saved(gameid):
+            scraper, game_info, _, _, away_roster, home_roster = manager.scrape_game(gameid, self.cache_path)
+            with self._sync_lock:
+                try:
+                    manager.sync_game(self._sync_session, gameid, game_info, away_roster, home_roster)
+                except:
+                    self._sync_session.rollback()
+                    raise
+            manager.container_from_scraper(gameid, scraper, away_roster, home_roster,
+                                           container_path=self.container_path)
+        return [gameid]
+
+    def parse(self, gameid):
+        gameid, rows, content_hash, failure, message = self._pool.apply(parse_container,
+                                                                        ((self.container_path, gameid),))
+        if failure is not None:
+            raise StageError(failure, message)
+        return [(gameid, rows, content_hash)]
+
+    def load(self, item):
+        gameid, rows, content_hash = item
+        self._unwritten.append((gameid, len(rows)))
+        self._writer.add_rows(rows, gameid, content_hash, replace=True)
+        if not self._writer.replaced:
+            self._written()
+        return []
+
+    def _finish_load(self):
+        """ write what is left, from the load thread that owns the session """
+        try:
+            self._writer.flush()
+        except Exception, e:
+            self._failed("load", self._unwritten[-1], e)
+        self._written()
+        self._load_session.close()
+
+    def _written(self):
+        for gameid, events in self._unwritten:
+            self.loaded += 1
+            self.events += events
+            if self.report is not None:
+                self.report(gameid, None, None)
+        self._unwritten = []
+
+    def _failed(self, stage, item, exception):
+        if stage == "discover":
+            gameid = item[1]
+        elif isinstance(item, tuple):
+            gameid = item[0]
+        else:
+            gameid = item
+        if isinstance(exception, StageError):
+            failure, message = exception.failure, str(exception)
+        else:
+            logger.error("Error in {} of {}".format(stage, gameid), exc_info=True)
+            failure, message = manager.classify_failure(exception), "{}: {}".format(type(exception).__name__,
+                                                                                  exception)
+        if stage == "load":
+            # the rollback loses every game not yet written, not just this one
+            self._writer.discard()
+            self._load_session.rollback()
+            for unwritten, events in self._unwritten:
+                self._record_failure(stage, unwritten, failure, message)
+            self._unwritten = []
+        else:
+            self._record_failure(stage, gameid, failure, message)
+
+    def _record_failure(self, stage, gameid, failure, message):
+        self.failures.append((stage, gameid, failure, message))
+        if self.report is not None:
+            self.report(gameid, stage, message)
+
+    #---------------------------------------------------------------------------
+
+    def run(self, gameids=(), season_ids=()):
+        """
+        import the games in gameids and in the seasons season_ids.  return
+        (games loaded, failures) with failures as (stage, gameid, failure class,
+        message)
+        """
+        self._pool = multiprocessing.Pool(self.parse_workers, reparse.init_worker)
+        try:
+            for stage in self.stages:
+                stage.start()
+            first = self.stages[0]
+            for seasonid in season_ids:
+                first.inbox.put(("season", seasonid))
+            for gameid in gameids:
+                first.inbox.put(("game", gameid))
+            first.stop()
+            for stage in self.stages:
+                stage.join()
+            self._pool.close()
+        except:
+            self._pool.terminate()
+            raise
+        finally:
+            self._pool.join()
+            self._sync_session.close()
+        return self.loaded, self.failures
+
+
+def print_report(gameid, stage, error):
+    if stage is None:
+        print ">>>> GAME {} loaded".format(gameid)
+    else:
+        print ">>>> GAME {} FAILED in {}: {}".format(gameid, stage, error)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser("Import games through a staged pipeline")
+    loghelp = """log level: one of 'all', 'debug', 'info', 'warn', 'error', 'critical'.
+                    Default is 'warn'"""
+    parser.add_argument('gameids', nargs="*", help="games to import")
+    parser.add_argument('-s', '--season', action="append", default=[], help="import every game in a season")
+    parser.add_argument('-l', '--log', action="store", default="warn", help=loghelp)
+    parser.add_argument('-a', '--apply', action="store_true", default=False, help="apply changes to mysql database")
+    parser.add_argument('-c', '--cache', action="store", default=None, help="html cache directory")
+    parser.add_argument('-f', '--force', action="store_true", default=False,
+                        help="scrape games again even if their container is saved")
+    parser.add_argument('--fetch', action="store", type=int, default=8, help="threads fetching pages")
+    parser.add_argument('--scrape', action="store", type=int, default=2, help="threads scraping pages")
+    parser.add_argument('--parse', action="store", type=int, default=multiprocessing.cpu_count(),
+                        help="processes parsing games")
+    parser.add_argument('-q', '--queue', action="store", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="games waiting between two stages")
+    parser.add_argument('-b', '--batch_size', action="store", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="event rows to buffer per database insert")
+    parser.add_argument('--http_pool', action="store", type=int, default=None,
+                        help="idle http connections kept per host.  Default is one per fetch thread")
+    parser.add_argument('--http_timeout', action="store", type=float, default=scrapetools.DEFAULT_TIMEOUT,
+                        help="seconds to wait on an http request")
+    options = parser.parse_args()
+
+    setuplogger.setupRootLogger(os.environ.get("SB_LOGLEVEL", options.log))
+    scrapetools.configure_http_pool(options.http_pool or options.fetch, options.http_timeout)
+    pipeline = GamePipeline(lambda: manager.init_database(use_mysql=options.apply), options.cache,
+                            fetch_workers=options.fetch, scrape_workers=options.scrape, parse_workers=options.parse,
+                            queue_size=options.queue, batch_size=options.batch_size, force_fresh=options.force,
+                            report=print_report)
+    start = time.time()
+    loaded, failures = pipeline.run(options.gameids, options.season)
+    seconds = max(time.time() - start, 0.001)
+    for stage in pipeline.stages:
+        print "{:<10} {:>6} done {:>4} failed {:>8.1f}s busy over {} workers".format(
+            stage.name, stage.done, stage.failed, stage.busy_seconds, stage.workers)
+    print "loaded {} games ({} failed), {} events in {:.1f}s: {:.1f} games/s".format(
+        loaded, len(failures), pipeline.events, seconds, loaded / seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+playercache.py
+
+A persistent cache of parsed Pointstreak player pages, so each player's page
+is parsed once a season rather than once for every game they appear in.
+
+Profiles are kept in a small SQLite table keyed by Pointstreak player id, as
+the full name plus a JSON dict of the PlayerInfo profile fields.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from models.playerinfo import PlayerInfo
+
+logger = logging.getLogger("player cache")
+
+PROFILE_CACHE_FILENAME = "players/profiles.sqlite"
+DEFAULT_MAX_AGE = 180 * 24 * 60 * 60  # seconds, about a season
+
+# the PlayerInfo columns filled in from a player page
+PROFILE_FIELDS = ["BAT_HAND",
+                  "THROW_HAND",
+                  "BIRTHDAY",
+                  "COLLEGE_YEAR",
+                  "COLLEGE_NAME",
+                  "DRAFT_STATUS",
+                  "HEIGHT",
+                  "HOMETOWN",
+                  "POSITIONS",
+                  "WEIGHT"]
+
+
+class PlayerProfileCache(object):
+    """
+    Parsed player profiles by Pointstreak id.  Entries older than max_age
+    seconds are treated as missing.  Safe to share between threads.
+    """
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS profiles ("
+                         "player_id TEXT PRIMARY KEY, "
+                         "full_name TEXT, "
+                         "profile TEXT, "
+                         "parsed_at REAL)")
+        self._db.commit()
+
+    def _row(self, player_id):
+        with self._lock:
+            row = self._db.execute("SELECT full_name, profile, parsed_at FROM profiles WHERE player_id = ?",
+                                   (str(player_id),)).fetchone()
+        if row is None or time.time() - row[2] > self.max_age:
+            return None
+        return row
+
+    def __contains__(self, player_id):
+        return self._row(player_id) is not None
+
+    def get(self, player_id):
+        """ return (full_name, PlayerInfo) or None if missing or expired """
+        row = self._row(player_id)
+        if row is None:
+            return None
+        full_name, profile, _ = row
+        player_info = PlayerInfo()
+        for field, value in json.loads(profile).items():
+            setattr(player_info, field, value)
+        return full_name, player_info
+
+    def put(self, player_id, full_name, player_info):
+        profile = json.dumps(dict((field, getattr(player_info, field)) for field in PROFILE_FIELDS))
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                             (str(player_id), full_name, profile, time.time()))
+            self._db.commit()
+
+    def invalidate(self, player_id=None):
+        """ drop one player's profile, or all of them """
+        with self._lock:
+            if player_id is None:
+                self._db.execute("DELETE FROM profiles")
+            else:
+                self._db.execute("DELETE FROM profiles WHERE player_id = ?", (str(player_id),))
+            self._db.commit()
+
+    def close(self):
+        """ close the file.  A shared cache is dropped, so profile_cache_for opens it again """
+        with _caches_lock:
+            for key, cache in _caches.items():
+                if cache is self:
+                    del _caches[key]
+        with self._lock:
+            self._db.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def profile_cache_for(cache_path):
+    """ the shared profile cache kept under an html cache directory """
+    path = os.path.abspath(os.path.join(cache_path, PROFILE_CACHE_FILENAME))
+    with _caches_lock:
+        cache = _caches.get((os.getpid(), path))
+        if cache is None:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            cache = _caches[(os.getpid(), path)] = PlayerProfileCache(path)
+        return cache
@@ -1,3 +1,6 @@
+import re
+import threading
+
 import pyparsing as pp
 import constants
 import gamewrapper
@@ -5,40 +8,85 @@ import gamewrapper
 import logging
 logger = logging.getLogger("pointstreak parser")
 
+# characters that may not border a player name, same as pp.Keyword
+NAME_BOUNDARY_CHARS = set(pp.Keyword.DEFAULT_KEYWORD_CHARS.upper())
 
+WHITESPACE = " \t\r\n"  # pyparsing's default whitespace
 
-class PointStreakParser:
+#===============================================================================
+# Fast path for the stock play texts.  Anything these don't match exactly goes
+# through the full grammar.
+#===============================================================================
+FAST_PITCHES = {"BALL": "ball",
+                "CALLED STRIKE": "called_strike",
+                "SWINGING STRIKE": "swinging_strike",
+                "FOUL": "foul"}
+FAST_PLAYER_NUMBER = re.compile(r"[0-9]+[ \t\r\n]+")
+FAST_ADVANCE = re.compile(r"[ \t\r\n]*advances to[ \t\r\n]+([a-z0-9]+)(?:[ \t\r\n]+[a-z0-9]+)*[ \t\r\n]*"
+                          r"\([ \t\r\n]*(single|double|triple|home run|walk)[ \t\r\n]*\)\Z", re.I)
+FAST_ADVANCE_TYPES = {"single": constants.PARSE_ADVANCE.SINGLE,
+                      "double": constants.PARSE_ADVANCE.DOUBLE,
+                      "triple": constants.PARSE_ADVANCE.TRIPLE,
+                      "home run": constants.PARSE_ADVANCE.HOME_RUN,
+                      "walk": constants.PARSE_ADVANCE.WALK}
+FAST_PUTOUT = re.compile(r"[ \t\r\n]*putout[ \t\r\n]*\([ \t\r\n]*([0-9]+(?:-[0-9]+)*)(?:[ \t\r\n]+(DP|TP))?[ \t\r\n]*\)"
+                         r"[ \t\r\n]*(for out number)[ \t\r\n]+[0-9]+\Z", re.I)
+FAST_PUTOUT_PLAYS = {"DP": constants.PARSING_OUTS.DOUBLE_PLAY,
+                     "TP": constants.PARSING_OUTS.TRIPLE_PLAY}
+
+# grammars are built once per thread and shared by every parser on that thread
+_grammars = threading.local()
+
+
+def shared_grammar():
     """
+    return this thread's compiled grammar, building it on first use
+    """
+    grammar = getattr(_grammars, "grammar", None)
+    if grammar is None:
+        grammar = _grammars.grammar = PointStreakGrammar()
+    return grammar
+
 
+class KnownPlayerName(pp.Token):
     """
-    def __init__(self, gamewrap=None, player_names=[]):
-        self.gamewrap = gamewrap
-        self.event_cache = []
-        self.player_names = player_names
-        self.setup_parser()
+    match any of the active parser's player names, caseless and with the
+    same word boundaries as pp.Keyword.  Returns the name as given to the parser.
+    """
+    def __init__(self, grammar):
+        super(KnownPlayerName, self).__init__()
+        self.grammar = grammar
+        self.name = "known player name"
+        self.errmsg = "Expected " + self.name
+        self.mayReturnEmpty = False
+        self.mayIndexError = False
 
-    def setup_parser(self):
+    def parseImpl(self, instring, loc, doActions=True):
+        parser = self.grammar.active
+        if parser is not None:
+            match = parser.match_player_name(instring, loc)
+            if match is not None:
+                return match
+        exc = self.myException
+        exc.loc = loc
+        exc.pstr = instring
+        raise exc
+
+
+class PointStreakGrammar(object):
+    """
+    the static pointstreak event grammar.  Parse actions are forwarded to the
+    gamewrapper of whichever parser is currently active.
+    """
+    def __init__(self):
+        self.active = None
         #=======================================================================
         # Names
         #=======================================================================
 
         catch_all = (pp.Word(pp.alphas+'-') + pp.OneOrMore(pp.Word(pp.alphas+'-'))).setResultsName(constants.PARSING_PLAYER.NAME)
-        if self.player_names:
-            player_no_num = pp.Keyword(self.player_names[0], caseless=True).setResultsName(constants.PARSING_PLAYER.NAME)
-            for name in self.player_names[1:]:
-                player_no_num |= pp.Keyword(name, caseless=True).setResultsName(constants.PARSING_PLAYER.NAME)
-            for name in self.player_names:
-                if "'" in name:
-                    version = "&apos;".join(name.split("'"))
-                    version2 = "_apos;".join(name.split("'"))
-                    kw = pp.Keyword(version, caseless=True).setResultsName(constants.PARSING_PLAYER.NAME)
-                    player_no_num |= kw
-                    kw2 = pp.Keyword(version2, caseless=True).setResultsName(constants.PARSING_PLAYER.NAME)
-                    player_no_num |= kw2
-            player_no_num |= catch_all
-
-        else:
-            player_no_num = catch_all
+        known_name = KnownPlayerName(self).setResultsName(constants.PARSING_PLAYER.NAME)
+        player_no_num = known_name | catch_all
         player = (pp.Word(pp.nums).setResultsName(constants.PARSING_PLAYER.NUMBER) + \
             player_no_num).setResultsName(constants.PARSING.PLAYER)
 
@@ -81,11 +129,11 @@ class PointStreakParser:
                             pp.Keyword("to")) +
                             position.setResultsName(constants.PARSE_PITCHING.CATCH_POSITION) +
                             right_paren
-                           ).setParseAction(self.gamewrap.pickoff)
-        swinging = pp.Keyword("Swinging Strike", caseless=True).setParseAction(self.gamewrap.swinging_strike)
-        called = pp.Keyword("Called Strike", caseless=True).setParseAction(self.gamewrap.called_strike)
-        ball = pp.Keyword("Ball", caseless=True).setParseAction(self.gamewrap.ball)
-        foul = pp.Keyword("Foul", caseless=True).setParseAction(self.gamewrap.foul)
+                           ).setParseAction(self._callback("pickoff"))
+        swinging = pp.Keyword("Swinging Strike", caseless=True).setParseAction(self._callback("swinging_strike"))
+        called = pp.Keyword("Called Strike", caseless=True).setParseAction(self._callback("called_strike"))
+        ball = pp.Keyword("Ball", caseless=True).setParseAction(self._callback("ball"))
+        foul = pp.Keyword("Foul", caseless=True).setParseAction(self._callback("foul"))
         error_e = pp.CaselessLiteral("E") + pp.Word(pp.nums).setResultsName(constants.PARSING.POSITION)
         dropped_foul = pp.Keyword("Dropped Foul", caseless=True) + pp.Optional(dash + error_e)
         pitches = dropped_foul | swinging | called | ball | foul | pickoff_attempt
@@ -138,7 +186,7 @@ class PointStreakParser:
                            (left_paren + pp.Word(pp.alphanums + ':-') + right_paren)) +
                            right_paren).setResultsName(constants.PARSING.DESCRIPTION)
 
-        putout = (player + pp.Keyword("putout", caseless=True) + pp.Optional(out_description) + pp.Keyword("for out number") + pp.Word(pp.nums)).setParseAction(self.gamewrap.put_out)
+        putout = (player + pp.Keyword("putout", caseless=True) + pp.Optional(out_description) + pp.Keyword("for out number") + pp.Word(pp.nums)).setParseAction(self._callback("put_out"))
         #===============================================================================
         # Advancing
         #===============================================================================
@@ -199,7 +247,7 @@ class PointStreakParser:
         advances = (player +
                     pp.Keyword("advances to", caseless=True) +
                     base + advance_desc.setResultsName(constants.PARSING.DESCRIPTION)
-                    ).setParseAction(self.gamewrap.parse_advance)
+                    ).setParseAction(self._callback("parse_advance"))
 
         #===========================================================================
         # Scoring
@@ -213,7 +261,7 @@ class PointStreakParser:
         unearned = unearned_span + pp.Keyword("Unearned", caseless=True).setResultsName(constants.PARSING.UNEARNED) + \
                     end_span
         score_word = score_span + pp.Keyword("Scores", caseless=True) + end_span
-        scores = (player + score_word + pp.Optional(unearned | earned) + advance_desc.setResultsName(constants.PARSING.DESCRIPTION)).setParseAction(self.gamewrap.parse_score)
+        scores = (player + score_word + pp.Optional(unearned | earned) + advance_desc.setResultsName(constants.PARSING.DESCRIPTION)).setParseAction(self._callback("parse_score"))
 
         #======================================================================
         # SUBS
@@ -229,35 +277,130 @@ class PointStreakParser:
                             ) + \
                             position.setResultsName(constants.PARSING.POSITION)
                         ) + period
-        defensive_sub.setParseAction(self.gamewrap.parse_defensive_sub)
+        defensive_sub.setParseAction(self._callback("parse_defensive_sub"))
         dh_sub = pp.Keyword("Defensive Substitution.") + new_player + \
                  pp.Keyword("subs for") + replacing + period
-        dh_sub.setParseAction(self.gamewrap.parse_defensive_sub)
+        dh_sub.setParseAction(self._callback("parse_defensive_sub"))
 
         pitching_sub = pp.Keyword("Pitching Substitution.") + new_player + \
                        pp.Optional(
                         (pp.Keyword("subs for") + replacing.setResultsName(constants.PARSING.REPLACING)) | \
                         (pp.Keyword("moves to", caseless=True) + position.setResultsName(constants.PARSING.POSITION))
                         ) + period
-        pitching_sub.setParseAction(self.gamewrap.parse_pitching_sub)
+        pitching_sub.setParseAction(self._callback("parse_pitching_sub"))
         self.pitching_sub = pitching_sub
 
         offensive_sub = pp.Keyword("Offensive Substitution.") + new_player + \
                         pp.Optional(pp.Keyword("subs for") + replacing) + period
-        offensive_sub.setParseAction(self.gamewrap.parse_offensive_sub)
+        offensive_sub.setParseAction(self._callback("parse_offensive_sub"))
         runner_sub = pp.Keyword("Offensive Substitution.") + new_player + \
                      ((pp.Keyword("runs for") + replacing) | pp.Keyword("subs")) + pp.Keyword("at") + \
                      pp.Word(pp.alphanums).setResultsName(constants.PARSING.BASE) + pp.Word(pp.alphanums) + period
-        runner_sub.setParseAction(self.gamewrap.parse_offensive_sub)
+        runner_sub.setParseAction(self._callback("parse_offensive_sub"))
         subs = defensive_sub | dh_sub | pitching_sub | offensive_sub | runner_sub
 
         #===========================================================================
         # Summary
         #===========================================================================
-        self.event_parser = (subs + pp.StringEnd()) | (pp.delimitedList(pitches | advances | putout | scores) + pp.StringEnd().setParseAction(self.gamewrap.event_complete))
+        self.event_parser = (subs + pp.StringEnd()) | (pp.delimitedList(pitches | advances | putout | scores) + pp.StringEnd().setParseAction(self._callback("event_complete")))
+
+
+    def _callback(self, name):
+        def parse_action(text, location, tokens):
+            return getattr(self.active.gamewrap, name)(text, location, tokens)
+        return parse_action
+
+
+class PointStreakParser:
+    """
+
+    """
+    def __init__(self, gamewrap=None, player_names=[], use_fast_path=True):
+        self.gamewrap = gamewrap
+        self.event_cache = []
+        self.player_names = player_names
+        self.use_fast_path = use_fast_path
+        self.setup_parser()
+
+    def setup_parser(self):
+        grammar = shared_grammar()
+        self.grammar = grammar
+        self.event_parser = grammar.event_parser
+        self.pitching_sub = grammar.pitching_sub
+
+        # names are tried in the order given, then the apostrophe variants
+        names = list(self.player_names)
+        for name in self.player_names:
+            if "'" in name:
+                names.append("&apos;".join(name.split("'")))
+                names.append("_apos;".join(name.split("'")))
+        self.name_lookup = {}
+        for name in names:
+            if name:
+                self.name_lookup.setdefault(name[0].upper(), []).append((name.upper(), name))
+
+    def match_player_name(self, text, loc):
+        """
+        return (end, name) for the first known player name at text[loc:], or None
+        """
+        for caseless_name, name in self.name_lookup.get(text[loc:loc + 1].upper(), ()):
+            end = loc + len(caseless_name)
+            if (text[loc:end].upper() == caseless_name and
+                (end >= len(text) or text[end].upper() not in NAME_BOUNDARY_CHARS) and
+                (loc == 0 or text[loc - 1].upper() not in NAME_BOUNDARY_CHARS)):
+                return end, name
+        return None
 
     def parse_event(self, text):
         self.last_event_text = text
         self.event_cache.append(text)
-        self.event_parser.parseString(text)
+        if self.use_fast_path:
+            plays = self._classify_common_event(text)
+            if plays is not None:
+                for callback, args in plays:
+                    callback(*args)
+                self.gamewrap.event_complete()
+                return self.gamewrap._game
+        previous = self.grammar.active
+        self.grammar.active = self
+        try:
+            self.event_parser.parseString(text)
+        finally:
+            self.grammar.active = previous
         return self.gamewrap._game
+
+    def _classify_common_event(self, text):
+        """
+        return a list of (gamewrap callback, args) if every play in text is one
+        of the stock forms, otherwise None
+        """
+        plays = []
+        for item in text.split(","):
+            item = item.strip(WHITESPACE)
+            pitch = FAST_PITCHES.get(item.upper())
+            if pitch is not None:
+                plays.append((getattr(self.gamewrap, pitch), (text, None, None)))
+                continue
+            number = FAST_PLAYER_NUMBER.match(item)
+            if number is None:
+                return None
+            name_match = self.match_player_name(item, number.end())
+            if name_match is None:
+                return None
+            end, player_name = name_match
+            advance = FAST_ADVANCE.match(item, end)
+            if advance is not None:
+                base, advance_type = advance.groups()
+                description = {FAST_ADVANCE_TYPES[advance_type.lower()]: advance_type}
+                plays.append((self.gamewrap._advance, (player_name, base, description)))
+                continue
+            putout = FAST_PUTOUT.match(item, end)
+            if putout is not None and putout.group(3) == "for out number":
+                fielders, double_or_triple, _ = putout.groups()
+                description = {constants.PARSING_OUTS.THROWN_OUT: pp.ParseResults(fielders.split("-"))}
+                if double_or_triple is not None:
+                    description[FAST_PUTOUT_PLAYS[double_or_triple.upper()]] = double_or_triple
+                plays.append((self.gamewrap._put_out, (player_name, description)))
+                continue
+            return None
+        return plays
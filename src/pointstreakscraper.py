@@ -5,11 +5,13 @@ import os
 import json
 import string
 import re
+from multiprocessing.pool import ThreadPool
 
 from models.playerinfo import PlayerInfo
 
 from scrapetools import GameScraper, HalfInning, RawEvent
 from scrapetools import get_cached_url
+from playercache import profile_cache_for
 from lineup import Lineup, Player, PlayerList, LineupError
 import constants
 
@@ -39,6 +41,7 @@ DIV_ID_PLAYBYPLAY = "psbb_playbyplay"
 DIV_ID_GAME_SUMMARY = "psbb_game_summary"
 
 MAX_EVENTS_COUNT = 40
+PLAYER_FETCH_CONCURRENCY = 8  # player pages fetched at once per roster
 
 
 class ScrapeError(Exception):
@@ -59,6 +62,15 @@ def make_html_url(gameid):
     """ the html url used for parsing game.  useful for reviewing site source """
     return PS_GAME_HTML % str(gameid)
 
+
+def fetch_game_pages(gameid, cache_path=None):
+    """ fetch a game's html and xml into the cache, ready for a PointStreakScraper """
+    if cache_path is None:
+        cache_path = DEFAULT_CACHE_PATH
+    gameid = str(gameid)
+    get_cached_url(make_html_url(gameid), os.path.join(cache_path, GAME_CACHE_PATH % ("PS" + gameid)))
+    get_cached_url(make_xml_url(gameid), os.path.join(cache_path, GAME_XML_CACHE_PATH % ("PS" + gameid)))
+
 #===============================================================================
 # GameID Scraping
 #===============================================================================
@@ -84,7 +96,24 @@ def scrape_season_gameids(seasonid, cache_path=None):
     return ids
 
 
+def game_player_ids(html):
+    """ the pointstreak ids of the players in a game's batting and pitching stats """
+    soup = BeautifulSoup(html)
+    player_ids = []
+    for div_id in (DIV_ID_BATTING_STATS, DIV_ID_PITCHING_STATS):
+        for div in soup.find_all("div", {"id": div_id}):
+            for link in div.find_all("a"):
+                href = link.attrs.get("href", "")
+                if "playerid=" in href:
+                    player_id = href.split("playerid=")[1].split("&")[0]
+                    if player_id not in player_ids:
+                        player_ids.append(player_id)
+    return player_ids
+
+
 class PointStreakScraper(GameScraper):
+    profile_cache = None
+
     def __init__(self, gameid, cache_path=None):
         self.critical_errors = False
         self.gameid = str(gameid)
@@ -92,6 +121,7 @@ class PointStreakScraper(GameScraper):
             self._cache_path = cache_path
         else:
             self._cache_path = DEFAULT_CACHE_PATH
+        self.profile_cache = profile_cache_for(self._cache_path)
 
         html = self._get_pointstreak_game_html()
         self.soup = BeautifulSoup(html)
@@ -165,7 +195,7 @@ class PointStreakScraper(GameScraper):
         for lineup, which_lineup in [(home_lineup, "Home"), (away_lineup, "Away")]:
             try:
                 if not lineup.is_complete(raise_reason=False):
-                    options = lineup.find_complete_positions()
+                    options = lineup.find_complete_positions(max_options=2)
                     if len(options) == 1:
                         for player, position in zip(lineup, options[0]):
                             if player.position != position:
@@ -194,8 +224,13 @@ class PointStreakScraper(GameScraper):
         self._complete_player_profile(True, home_roster)
         return away_lineup, home_lineup, away_roster, home_roster
 
-    def get_player_info(self, player_id):
-        html = self._player_page_from_id(player_id)
+    def get_player_info(self, player_id, html=None):
+        if self.profile_cache is not None and player_id is not None:
+            cached = self.profile_cache.get(player_id)
+            if cached is not None:
+                return cached
+        if html is None:
+            html = self._player_page_from_id(player_id)
         soup = BeautifulSoup(html)
         full_name = soup.find("title").text.split(" - ", 1)[0]
         divs = soup.find_all("div", {"id": "psbb_player_info"})
@@ -220,6 +255,8 @@ class PointStreakScraper(GameScraper):
         pinfo.HOMETOWN = info_dict.get("Hometown")
         pinfo.POSITIONS = info_dict.get("Position")
         pinfo.WEIGHT = info_dict.get("Weight")
+        if self.profile_cache is not None and player_id is not None:
+            self.profile_cache.put(player_id, full_name, pinfo)
         return full_name, pinfo
 
     def _get_point_streak_url(self):
@@ -339,7 +376,37 @@ class PointStreakScraper(GameScraper):
         player_cache_path = os.path.join(self._cache_path, PLAYER_CACHE_PATH % ("PS" + str(player_id)))
         return get_cached_url(self._player_url_from_id(player_id), player_cache_path)
 
+    def _prefetch_player_pages(self, player_ids):
+        """
+        fetch the player pages for player_ids concurrently.
+        return {player_id: html} for the ones that came back.
+        """
+        player_ids = sorted(set(pid for pid in player_ids if pid is not None))
+        if self.profile_cache is not None:
+            player_ids = [pid for pid in player_ids if pid not in self.profile_cache]
+        pages = {}
+        if not player_ids:
+            return pages
+
+        def fetch(player_id):
+            try:
+                return player_id, self._player_page_from_id(player_id)
+            except Exception:
+                # left for the serial loop to retry and report
+                return player_id, None
+
+        pool = ThreadPool(min(PLAYER_FETCH_CONCURRENCY, len(player_ids)))
+        try:
+            for player_id, html in pool.imap_unordered(fetch, player_ids):
+                if html is not None:
+                    pages[player_id] = html
+        finally:
+            pool.close()
+            pool.join()
+        return pages
+
     def _complete_player_profile(self, is_home, player_list):
+        player_ids = []
         for player in player_list:
             player_id = None
             try:
@@ -348,9 +415,13 @@ class PointStreakScraper(GameScraper):
                 player.verify_pitch_stats.update(verify_pitch_stats)
             except:
                 logger.exception("unable to find id for player {}".format(player.name))
+            player_ids.append(player_id)
+
+        pages = self._prefetch_player_pages(player_ids)
 
+        for player, player_id in zip(player_list, player_ids):
             try:
-                full_name, player_info = self.get_player_info(player_id)
+                full_name, player_info = self.get_player_info(player_id, pages.get(player_id))
                 player.set_name(full_name)
                 player.iddict["pointstreak"] = player_id
             except:
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+reparse.py
+
+Re-run the play by play parser over saved game containers, after a grammar or
+GameState fix.  Containers are parsed in a pool of worker processes, and the
+parent replaces each game's events in the database through one EventWriter.
+Nothing is scraped: a game without a container is reported and skipped, and
+unless forced so is a game whose container hash matches its recorded parse.
+
+    python reparse.py                 # every gc_*.json under CONTAINER_PATH
+    python reparse.py 87568 87259 -w 4
+    python reparse.py 87568 -c        # resume from half inning checkpoints
+    python reparse.py -f              # even games unchanged since their last parse
+"""
+import glob
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import time
+
+import manager
+import setuplogger
+from constants import CONTAINER_PATH
+from gamecontainer import GameContainer
+
+logger = logging.getLogger("reparse")
+
+CONTAINER_PATTERN = re.compile(r"^gc_(.+)\.json$")
+DEFAULT_BATCH_SIZE = 5000  # event rows per insert
+
+
+def container_gameids(container_path=CONTAINER_PATH):
+    """ the game ids of every container saved under container_path """
+    gameids = []
+    for path in sorted(glob.glob(os.path.join(container_path, "gc_*.json"))):
+        match = CONTAINER_PATTERN.match(os.path.basename(path))
+        if match:
+            gameids.append(match.group(1))
+    return gameids
+
+
+def init_worker():
+    # let the parent handle ctrl-c and shut the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def reparse_container(job):
+    """
+    parse one saved container.  job is (container_path, gameid, checkpoints,
+    parsed_hash).  return (gameid, rows, error, seconds, content_hash) with
+    the event rows on success, the error message on failure, or neither when
+    the container's content hash is still parsed_hash
+    """
+    container_path, gameid, checkpoints, parsed_hash = job
+    start = time.time()
+    try:
+        gc = GameContainer(container_path, gameid)
+        if parsed_hash is not None and gc.content_hash() == parsed_hash:
+            return gameid, None, None, time.time() - start, parsed_hash
+        game = manager.parse_from_container(gc, checkpoints=checkpoints)
+        return gameid, list(game.event_rows()), None, time.time() - start, gc.content_hash()
+    except Exception, e:
+        logger.exception("Error reparsing game {}".format(gameid))
+        return gameid, None, "{}: {}".format(type(e).__name__, e), time.time() - start, None
+
+
+def reparse(gameids, session, container_path=CONTAINER_PATH, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+            report=None, checkpoints=False, skip_unchanged=False):
+    """
+    reparse the containers for gameids and replace their events in session's
+    database.  report(gameid, rows, error, seconds) is called as each game
+    finishes, with neither rows nor error for a skipped game.  with
+    checkpoints, each game resumes from its last valid half inning checkpoint.
+    with skip_unchanged, games whose container and parsing code match their
+    recorded parse are skipped.  return (good games, failed games, event count)
+    """
+    writer = manager.EventWriter(session, batch_size)
+    parsed = manager.parsed_hashes(session, gameids) if skip_unchanged else {}
+    jobs = [(container_path, gameid, checkpoints, parsed.get(str(gameid))) for gameid in gameids]
+    if workers == 1:
+        pool = None
+        results = (reparse_container(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(workers, init_worker)
+        results = pool.imap_unordered(reparse_container, jobs)
+    good, failed, events = 0, 0, 0
+    try:
+        for gameid, rows, error, seconds, content_hash in results:
+            if error is not None:
+                failed += 1
+            elif rows is not None:
+                writer.add_rows(rows, gameid, content_hash, replace=True)
+                good += 1
+                events += len(rows)
+            if report is not None:
+                report(gameid, rows, error, seconds)
+        writer.flush()
+        if pool is not None:
+            pool.close()
+    except:
+        writer.discard()
+        session.rollback()
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+    return good, failed, events
+
+
+def print_report(gameid, rows, error, seconds):
+    if error is None and rows is None:
+        print ">>>> GAME {} unchanged".format(gameid)
+    elif error is None:
+        print ">>>> GAME {} ok, {} events in {:.2f}s".format(gameid, len(rows), seconds)
+    else:
+        print ">>>> GAME {} FAILED in {:.2f}s: {}".format(gameid, seconds, error)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser("Reparse saved game containers")
+    loghelp = """log level: one of 'all', 'debug', 'info', 'warn', 'error', 'critical'.
+                    Default is 'warn'"""
+    parser.add_argument('gameids', nargs="*", help="games to reparse.  Default is every saved container")
+    parser.add_argument('-l', '--log', action="store", default="warn", help=loghelp)
+    parser.add_argument('-a', '--apply', action="store_true", default=False, help="apply changes to mysql database")
+    parser.add_argument('-p', '--path', action="store", default=CONTAINER_PATH, help="directory of gc_*.json containers")
+    parser.add_argument('-w', '--workers', action="store", type=int, default=multiprocessing.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument('-b', '--batch_size', action="store", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="event rows to buffer per database insert")
+    parser.add_argument('-c', '--checkpoints', action="store_true", default=False,
+                        help="resume each game from the half inning checkpoints saved by its last reparse")
+    parser.add_argument('-f', '--force', action="store_true", default=False,
+                        help="reparse games even when their container and the parsing code are unchanged")
+    options = parser.parse_args()
+
+    setuplogger.setupRootLogger(os.environ.get("SB_LOGLEVEL", options.log))
+    session = manager.init_database(use_mysql=options.apply)
+
+    gameids = options.gameids or container_gameids(options.path)
+    start = time.time()
+    good, failed, events = reparse(gameids, session, options.path, options.workers, options.batch_size,
+                                   print_report, options.checkpoints, not options.force)
+    seconds = max(time.time() - start, 0.001)
+    print "reparsed {} games ({} failed), {} events in {:.1f}s: {:.1f} games/s, {:.0f} events/s".format(
+        good + failed, failed, events, seconds, (good + failed) / seconds, events / seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,190 @@
-import mechanize
 import os
 import logging
 import gzip
+import httplib
+import re
+import socket
+import threading
+import urllib2
+import urlparse
+from StringIO import StringIO
 
 logger = logging.getLogger("scrapetools")
 
-
-def ungzipResponse(r, br):
-    headers = r.info()
-    if headers.get('Content-Encoding') == 'gzip':
-        gz = gzip.GzipFile(fileobj=r, mode='rb')
-        html = gz.read()
-        gz.close()
-        headers["Content-type"] = "text/html; charset=utf-8"
-        r.set_data(html)
-        br.set_response(r)
+USER_AGENT = 'Mozilla/5.0 (iPad; CPU OS 6_0 like Mac OS X) AppleWebKit/536.26 (KHTML, like Gecko) Version/6.0 Mobile/10A5355d Safari/8536.25'
+DEFAULT_POOL_SIZE = 4  # idle connections kept per host
+DEFAULT_TIMEOUT = 30  # seconds
+MAX_REDIRECTS = 10
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+META_REFRESH = re.compile(r"""<meta[^>]+http-equiv=["']?refresh[^>]+content=["']?([^"'>]*)""", re.IGNORECASE)
+
+
+#===============================================================================
+# Keep-alive HTTP client
+#===============================================================================
+
+class HTTPConnectionPool(object):
+    """
+    Keep-alive HTTP(S) connections, kept per host and shared between threads.
+
+    Follows redirects and refreshes, un-gzips responses and raises
+    urllib2.HTTPError for 4xx/5xx responses and urllib2.URLError when the
+    server can't be reached, like the mechanize browser it replaces.
+    """
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.headers = {'User-agent': USER_AGENT,
+                        'Accept-Encoding': 'gzip'}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        return httplib.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _take_connection(self, key):
+        """ return (connection, reused) """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(key), False
+
+    def _give_back(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _request_once(self, url, referer=None):
+        """ one GET, no redirects.  returns the httplib response with its body read """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise urllib2.URLError("unsupported url scheme: " + url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = self.headers
+        if referer is not None:
+            headers = dict(headers, Referer=referer)
+        while True:
+            connection, reused = self._take_connection(key)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.body = response.read()
+            except (httplib.HTTPException, socket.error), e:
+                connection.close()
+                if reused:
+                    # the server dropped an idle connection, try a fresh one
+                    continue
+                raise urllib2.URLError(e)
+            if response.will_close:
+                connection.close()
+            else:
+                self._give_back(key, connection)
+            return response
+
+    def get(self, url):
+        """ return the body of url """
+        referer = None
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._request_once(url, referer)
+            location = response.getheader('location')
+            if response.status in REDIRECT_CODES and location:
+                url, referer = urlparse.urljoin(url, location), url
+                continue
+            if response.status >= 400:
+                raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+            body = response.body
+            if response.getheader('content-encoding') == 'gzip':
+                body = gzip.GzipFile(fileobj=StringIO(body), mode='rb').read()
+            refresh = _refresh_url(response, body)
+            if refresh is not None:
+                # followed at once, whatever delay the page asks for
+                url, referer = urlparse.urljoin(url, refresh), url
+                continue
+            return body
+        raise urllib2.HTTPError(url, response.status, "too many redirects", response.msg, None)
+
+    def clear(self):
+        """ close all idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+def _refresh_url(response, body):
+    """ the url a Refresh header or meta refresh tag sends a page on to, or None """
+    refresh = response.getheader('refresh')
+    if refresh is None and 'html' in (response.getheader('content-type') or ''):
+        match = META_REFRESH.search(body)
+        if match is not None:
+            refresh = match.group(1)
+    if refresh is None:
+        return None
+    for part in refresh.split(';'):
+        name, _, value = part.strip().partition('=')
+        if name.strip().lower() == 'url' and value.strip():
+            return value.strip().strip("'\"")
+    return None
+
+
+_pool_settings = dict(pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT)
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def configure_http_pool(pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+    """ set the size and timeout of the shared pool, replacing it if it exists """
+    global _pool
+    with _pool_lock:
+        _pool_settings.update(pool_size=pool_size, timeout=timeout)
+        if _pool is not None:
+            _pool.clear()
+            _pool = None
+
+
+def http_pool():
+    """
+    the shared connection pool for this process.  A forked worker gets its own
+    pool rather than the parent's sockets.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = HTTPConnectionPool(**_pool_settings)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def write_cache_file(cache_filename, data):
+    """
+    write a cache file all at once, so an interrupted write never leaves a
+    partial page that would pass for a cached one
+    """
+    tmp_filename = "{}.{}.{}.tmp".format(cache_filename, os.getpid(), threading.current_thread().ident)
+    with open(tmp_filename, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_filename, cache_filename)
 
 
 def get_cached_url(url, cache_filename=None, force_reload=False):
     if force_reload or cache_filename is None or not os.path.isfile(cache_filename):
-        logging.info("getting page at " + url)
-        br = mechanize.Browser()
-        # Browser options
-        br.set_handle_equiv(True)
-        br.set_handle_redirect(True)
-        br.set_handle_referer(True)
-        br.set_handle_robots(False)
-        br.addheaders = [('User-agent', 'Mozilla/5.0 (iPad; CPU OS 6_0 like Mac OS X) AppleWebKit/536.26 (KHTML, like Gecko) Version/6.0 Mobile/10A5355d Safari/8536.25')]
-        br.addheaders.append(('Accept-Encoding', 'gzip'))
-
-        br.open(url)
-        response = br.response()
-        ungzipResponse(response, br)
-        html = response.read()
+        logger.info("getting page at " + url)
+        html = http_pool().get(url)
 
         if cache_filename is not None:
-            f = open(cache_filename, 'aw')
-            f.write(html)
-            f.close()
+            write_cache_file(cache_filename, html)
         else:
             return html
     return open(cache_filename, 'r').read()
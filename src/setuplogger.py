@@ -1,4 +1,5 @@
 import logging
+import threading
 
 LOOKUP_LEVEL = {"all": 0,
                 "debug": logging.DEBUG,
@@ -45,3 +46,75 @@ class GameContextFilter(logging.Filter):
         record.is_bottom = self.is_bottom
         record.event_num = self.event_num
         return True
+
+
+class GameLogContext(object):
+    """
+    where in a game the parse is, for the logs.  One per game being parsed.
+    """
+    def __init__(self, handler=None):
+        self.inning = 0
+        self.is_bottom = 0
+        self.event_num = 0
+        self.handler = handler  # gets this game's warnings and errors, if given
+
+
+class GameLogAdapter(logging.LoggerAdapter):
+    """
+    log through a shared module logger with one game's context attached to
+    each record, so games parsed side by side keep their logs apart.
+    """
+    def __init__(self, logger, context):
+        logging.LoggerAdapter.__init__(self, logger, context)
+        route_game_logs(logger)
+
+    # LoggerAdapter builds the context before checking the level, so check
+    # first: most calls in a parse are debug and info ones that are turned off
+
+    def debug(self, msg, *args, **kwargs):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            logging.LoggerAdapter.debug(self, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        if self.logger.isEnabledFor(logging.INFO):
+            logging.LoggerAdapter.info(self, msg, *args, **kwargs)
+
+    def log(self, level, msg, *args, **kwargs):
+        if self.logger.isEnabledFor(level):
+            logging.LoggerAdapter.log(self, level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        extra = dict(kwargs.get("extra") or {})
+        extra.update(inning=self.extra.inning,
+                     is_bottom=self.extra.is_bottom,
+                     event_num=self.extra.event_num,
+                     game_log_handler=self.extra.handler)
+        kwargs["extra"] = extra
+        return msg, kwargs
+
+    def warn(self, msg, *args, **kwargs):
+        self.warning(msg, *args, **kwargs)
+
+
+class GameLogRouter(logging.Handler):
+    """
+    hands each record logged through a GameLogAdapter on to the handler of
+    that record's game
+    """
+    def emit(self, record):
+        handler = getattr(record, "game_log_handler", None)
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+
+
+_router = GameLogRouter()
+_routed_loggers = set()
+_router_lock = threading.Lock()
+
+
+def route_game_logs(logger):
+    """ make sure records logged to logger reach their game's handler """
+    with _router_lock:
+        if logger.name not in _routed_loggers:
+            logger.addHandler(_router)
+            _routed_loggers.add(logger.name)
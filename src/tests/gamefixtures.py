@@ -0,0 +1,93 @@
+"""
+gamefixtures.py
+
+A made up game shared by the tests and benchmarks: two teams of nine, and
+the plays of as many half innings as are wanted, each half ending on its
+third out.
+"""
+import itertools
+import logging
+
+import constants
+import gamestate
+import gamewrapper
+import lineup
+import pointstreakparser as psp
+from setuplogger import GameLogAdapter
+
+AWAY_NAMES = ["Al Abbot", "Bo Baker", "Cy Carter", "Di Dunn", "Ed Evans", "Fi Ford", "Gus Grant", "Hal Hill", "Ike Irwin"]
+HOME_NAMES = ["Jo Jones", "Ken King", "Lou Lane", "Mo Mann", "Ned Nash", "Ole Ortiz", "Pat Peck", "Quin Quade", "Roy Reed"]
+
+# the plays batters take turns at, filled in with their number, name and the out
+PLAYS = ["Ball, Called Strike, {n} {name} advances to 1st (single)",
+         "{n} {name} advances to 2nd (double)",
+         "Ball, {n} {name} putout (6-3) for out number {out}",
+         "Ball, Ball, Ball, Ball, {n} {name} advances to 1st (walk)",
+         "{n} {name} advances to home (home run)",
+         "Foul, {n} {name} putout (Fly out to Left Fielder) for out number {out}",
+         "{n} {name} putout (5-3) for out number {out}"]
+
+
+def make_lineup(names, team=None):
+    """ a starting Lineup of names, numbered from 10 and fielded in position order """
+    lu = lineup.Lineup()
+    for order, (name, position) in enumerate(zip(names, constants.POSITIONS)):
+        lu.add_player(lineup.Player(name, 10 + order, order + 1, position, team_id=team))
+    return lu
+
+
+def roster(names, team):
+    """ the roster of a team of starters, as a GameContainer keeps it """
+    players = lineup.PlayerList()
+    for player in make_lineup(names, team):
+        for attr in ("birthday", "college_name", "college_year", "draft_status", "height", "weight"):
+            setattr(player, attr, None)
+        player.starter = True
+        players.append(player)
+    return players
+
+
+def new_game(use_fast_path=True, log_context=None):
+    """
+    (GameState, PointStreakParser) for a game between the two teams, ready
+    for its first half.  With a GameLogContext, the game and its wrapper log
+    through GameLogAdapters, as manager.parse_from_container sets them up
+    """
+    game = gamestate.GameState()
+    wrapper_logger = gamewrapper.logger
+    if log_context is not None:
+        game.logger = GameLogAdapter(logging.getLogger("gamestate"), log_context)
+        wrapper_logger = GameLogAdapter(gamewrapper.logger, log_context)
+    game.set_away_lineup(make_lineup(AWAY_NAMES))
+    game.set_home_lineup(make_lineup(HOME_NAMES))
+    parser = psp.PointStreakParser(gamewrapper.GameWrapper(game, wrapper_logger), AWAY_NAMES + HOME_NAMES,
+                                   use_fast_path)
+    return game, parser
+
+
+def game_plays(halves):
+    """ a list per half inning of (batter name, number, play text) """
+    order = [itertools.cycle(range(9)), itertools.cycle(range(9))]
+    plays = itertools.cycle(PLAYS)
+    game = []
+    for half in range(halves):
+        names = [AWAY_NAMES, HOME_NAMES][half % 2]
+        batters = []
+        outs = 0
+        while outs < 3:
+            i = next(order[half % 2])
+            play = next(plays)
+            if "putout" in play:
+                outs += 1
+            batters.append((names[i], 10 + i, play.format(n=10 + i, name=names[i], out=outs)))
+        game.append(batters)
+    return game
+
+
+def play_game(game, parser, halves):
+    """ parse the plays of halves half innings into game """
+    for batters in game_plays(halves):
+        game.new_half()
+        for name, number, text in batters:
+            game.new_batter(name)
+            parser.parse_event(text)
@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingTCPServer
+
+import backfill
+import pointstreakscraper as pss
+
+SEASONS = {"1": ["11", "12"], "2": ["12", "21"]}
+
+
+def listing(gameids):
+    links = "".join('<a href="boxscore.html?gameid={0}">final</a><a href="x.html?id={0}">preview</a>'.format(g)
+                    for g in gameids)
+    return json.dumps({"html": links})
+
+
+def boxscore(gameid):
+    players = "".join('<a href="player.html?playerid={}&seasonid=1">p</a>'.format(p) for p in ("7", gameid))
+    return '<div id="{}">{}</div><div id="{}">{}</div>'.format(
+        pss.DIV_ID_BATTING_STATS, players, pss.DIV_ID_PITCHING_STATS, players)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, body, code=200):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+        try:
+            time.sleep(server.delay)
+            page, key = self.path.lstrip("/").split("?")
+            key = key.split("=")[1]
+            if page == "schedule" and key in SEASONS:
+                self.send_body(listing(SEASONS[key]))
+            elif page == "game":
+                self.send_body(boxscore(key))
+            elif page == "xml" or page == "player":
+                self.send_body("{} {}".format(page, key))
+            else:
+                self.send_body("missing", 404)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSeasonBackfill(unittest.TestCase):
+    def setUp(self):
+        ThreadingTCPServer.allow_reuse_address = True
+        self.server = ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.active = 0
+        self.server.most_active = 0
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.path = tempfile.mkdtemp()
+
+        base = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+        class LocalBackfill(backfill.SeasonBackfill):
+            SCHEDULE_URL = base + "/schedule?s={}"
+            GAME_HTML_URL = base + "/game?gameid=%s"
+            GAME_XML_URL = base + "/xml?gameid=%s"
+            PLAYER_URL = base + "/player?playerid=%s"
+        self.Backfill = LocalBackfill
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def run_backfill(self, seasons=("1", "2"), **kwargs):
+        kwargs.setdefault("rate", None)
+        return self.Backfill(self.path, **kwargs).run(seasons)
+
+    def test_backfill(self):
+        fetched, cached, failures = self.run_backfill()
+        self.assertEqual(failures, [])
+        # 2 listings, 3 games as html and xml, and players 7, 11, 12 and 21
+        self.assertEqual((fetched, cached), (12, 0))
+        self.assertEqual(len(self.server.requests), 12)
+        files = []
+        for directory, dirs, names in os.walk(self.path):
+            files.extend(os.path.relpath(os.path.join(directory, n), self.path) for n in names)
+        self.assertEqual(sorted(files), sorted(
+            ["listings/list_1.json", "listings/list_2.json"] +
+            [pss.GAME_CACHE_PATH % ("PS" + g) for g in ("11", "12", "21")] +
+            [pss.GAME_XML_CACHE_PATH % ("PS" + g) for g in ("11", "12", "21")] +
+            [pss.PLAYER_CACHE_PATH % ("PS" + p) for p in ("7", "11", "12", "21")]))
+        with open(os.path.join(self.path, pss.PLAYER_CACHE_PATH % "PS21")) as f:
+            self.assertEqual(f.read(), "player 21")
+
+    def test_resume(self):
+        self.run_backfill()
+        del self.server.requests[:]
+        self.assertEqual(self.run_backfill(), (0, 12, []))
+        self.assertEqual(self.server.requests, [])
+
+        os.remove(os.path.join(self.path, pss.GAME_XML_CACHE_PATH % "PS21"))
+        self.assertEqual(self.run_backfill()[:2], (1, 11))
+        self.assertEqual(self.server.requests, ["/xml?gameid=21"])
+        # new games only turn up when the listings are fetched again
+        self.assertEqual(self.run_backfill(refresh_listings=True)[:2], (2, 10))
+
+    def test_concurrency(self):
+        self.server.delay = 0.05
+        fetched, cached, failures = self.run_backfill(concurrency=2)
+        self.assertEqual(fetched, 12)
+        self.assertEqual(self.server.most_active, 2)
+
+    def test_failures(self):
+        fetched, cached, failures = self.run_backfill(("1", "3"), players=False)
+        self.assertEqual(fetched, 5)
+        self.assertEqual([f[0] for f in failures], ["season 3"])
+        self.assertTrue(failures[0][1].startswith("HTTPError"))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_rate(self):
+        limiter = backfill.RateLimiter(20, burst=2)
+        times = []
+
+        def call():
+            for i in range(3):
+                limiter.wait()
+                times.append(time.time())
+        start = time.time()
+        threads = [threading.Thread(target=call) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # the burst goes at once, then one call every 50ms
+        times.sort()
+        self.assertTrue(times[1] - start < 0.03)
+        self.assertTrue(0.18 <= times[-1] - start < 0.35)
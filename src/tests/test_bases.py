@@ -120,3 +120,21 @@ class TestCase(unittest.TestCase):
         self.bases.advance("Bert", 4)
         berts_fate_id_1 = self.bases.player_fate_id("Bert")
         self.assertEquals(self.bases.fate_for(berts_fate_id_1),4)
+
+    def test_shared_base(self):
+        self.bases.advance("Bert", 2)
+        self.bases.advance("Ernie", 2)
+        self.assertTrue(self.bases.on_base(2) in ("Bert", "Ernie"))
+        self.bases.advance("Ernie", 3)
+        self.assertEquals(self.bases.runner_names(), (None, "Bert", "Ernie"))
+        self.assertEquals(self.bases.code(), 6)
+        self.bases.advance("Ernie", 4)
+        self.bases.advance("Bert", 4)
+        self.assertEquals(self.bases.code(), 0)
+        self.assertTrue(self.bases.is_valid())
+
+    def test_fate_ids(self):
+        self.bases.advance("Bert", 1)
+        self.bases.advance("Ernie", 4)
+        self.assertEquals(self.bases.runners_fate_ids(), [1, 0, 0])
+        self.assertEquals(self.bases.player_fate_id("Ernie"), 2)
@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import manager
+from checkpoints import GameCheckpoints
+from gamecontainer import GameContainer
+from test_reparse import save_container
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fresh_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        shutil.rmtree(self.fresh_path)
+
+    def edit(self, path, half_index, old, new):
+        filename = os.path.join(path, "gc_201.json")
+        with open(filename) as f:
+            d = json.load(f)
+        for event_info in d["list_of_halfs"][half_index]:
+            event_info["text"] = event_info["text"].replace(old, new)
+        with open(filename, "w") as f:
+            json.dump(d, f)
+
+    def parse(self, path, checkpoints):
+        game = manager.parse_from_container(GameContainer(path, "201"), checkpoints=checkpoints)
+        return list(game.event_rows())
+
+    def test_resume_after_edit(self):
+        save_container(self.path, "201", halves=8)
+        save_container(self.fresh_path, "201", halves=8)
+        first = self.parse(self.path, True)
+        self.assertEqual(first, self.parse(self.fresh_path, False))
+
+        for path in (self.path, self.fresh_path):
+            self.edit(path, 5, "(single)", "(double)")
+        self.assertEqual(GameCheckpoints(GameContainer(self.path, "201")).restore()[0], 5)
+        resumed = self.parse(self.path, True)
+        self.assertNotEqual(resumed, first)
+        self.assertEqual(resumed, self.parse(self.fresh_path, False))
+
+    def test_roster_change_starts_over(self):
+        save_container(self.path, "201", halves=4)
+        self.parse(self.path, True)
+        gc = GameContainer(self.path, "201")
+        gc.away_roster()[0].number = 99
+        self.assertEqual(GameCheckpoints(gc).restore(), None)
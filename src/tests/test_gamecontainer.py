@@ -1,7 +1,10 @@
 import unittest
 import logging
+import shutil
+import tempfile
 import manager
 import gamecontainer
+import playercache
 from constants import CONTAINER_PATH
 
 
@@ -9,15 +12,26 @@ TEST_GAME = 87568
 TEST_GAME2 = 87259
 
 
-class TestGameContainer(unittest.TestCase):
+class ScratchCacheTestCase(unittest.TestCase):
+    """ pages and player profiles go to a scratch cache, not the shared html cache """
     def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        playercache.profile_cache_for(self.cache_path).close()
+        shutil.rmtree(self.cache_path)
+
+
+class TestGameContainer(ScratchCacheTestCase):
+    def setUp(self):
+        ScratchCacheTestCase.setUp(self)
         self.maxDiff = 20000  # for TestCase assertEqual
 
     def test_scrape_vs_load(self):
         """
         test_events compare events coming from scraped game versus loaded game
         """
-        scraper, away_starting_lineup, home_starting_lineup, away_roster, home_roster = manager.setup_scraper(TEST_GAME2)
+        scraper, away_starting_lineup, home_starting_lineup, away_roster, home_roster = manager.setup_scraper(TEST_GAME2, self.cache_path)
         gc = gamecontainer.GameContainer(CONTAINER_PATH, TEST_GAME2)
 
         scraper_events = []
@@ -35,7 +49,7 @@ class TestGameContainer(unittest.TestCase):
         test_load
         """
 
-        html_game = manager.import_game(TEST_GAME, force_fresh=True)
+        html_game = manager.import_game(TEST_GAME, self.cache_path, force_fresh=True)
         gc = gamecontainer.GameContainer(CONTAINER_PATH, TEST_GAME)
 
         import pdb; pdb.set_trace()
@@ -44,17 +58,18 @@ class TestGameContainer(unittest.TestCase):
 
 
     def test_lineups(self):
-        parsed_gc = manager.scrape_to_container(TEST_GAME2)
+        parsed_gc = manager.scrape_to_container(TEST_GAME2, self.cache_path)
         loaded_gc = gamecontainer.GameContainer(CONTAINER_PATH, TEST_GAME2)
 
         self.assertEqual(parsed_gc.home_lineup(), loaded_gc.home_lineup())
         self.assertEqual(parsed_gc.away_lineup(), loaded_gc.away_lineup())
 
 
-class TestParseEffect(unittest.TestCase):
+class TestParseEffect(ScratchCacheTestCase):
     def setUp(self):
-        self.base_state = manager.setup_scraper(TEST_GAME)
-        self.gc = manager.scrape_to_container(TEST_GAME)
+        ScratchCacheTestCase.setUp(self)
+        self.base_state = manager.setup_scraper(TEST_GAME, self.cache_path)
+        self.gc = manager.scrape_to_container(TEST_GAME, self.cache_path)
         manager.parse_from_container(self.gc)
 
     def test_events(self):
@@ -73,3 +88,59 @@ class TestParseEffect(unittest.TestCase):
         scraper, away_starting_lineup, home_starting_lineup, away_roster, home_roster = self.base_state
         self.assertEqual(home_starting_lineup, self.gc.home_lineup)
         self.assertEqual(home_roster, self.gc.home_roster)
+
+
+class TestGameContainerLogHandler(unittest.TestCase):
+    def test_keeps_warnings_with_context(self):
+        from setuplogger import GameContextFilter
+        gc = gamecontainer.GameContainer(CONTAINER_PATH, 1, "away", "home")
+        context = GameContextFilter()
+        context.inning = 3
+        handler = gamecontainer.GameContainerLogHandler(gc)
+        handler.addFilter(context)
+        logger = logging.getLogger("test container handler")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.info("routine %s", "play")
+            logger.warning("odd %s", "play")
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(gc.errors, [dict(inning=3, bottom=0, event_num=0, message="WARNING - odd play")])
+
+    def test_games_logged_side_by_side(self):
+        import threading
+        from setuplogger import GameLogAdapter, GameLogContext
+        logger = logging.getLogger("test side by side")
+        logger.propagate = False
+        containers = [gamecontainer.GameContainer(CONTAINER_PATH, i, "away", "home") for i in range(4)]
+
+        def parse(gc):
+            context = GameLogContext(gamecontainer.GameContainerLogHandler(gc))
+            log = GameLogAdapter(logger, context)
+            for inning in range(1, 10):
+                context.inning = inning
+                log.info("inning %s", inning)
+                log.warn("game %s inning %s", gc.gameid, inning)
+        threads = [threading.Thread(target=parse, args=(gc,)) for gc in containers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for gc in containers:
+            self.assertEqual([(e["inning"], e["message"]) for e in gc.errors],
+                             [(i, "WARNING - game {} inning {}".format(gc.gameid, i)) for i in range(1, 10)])
+
+    def test_disabled_levels_skip_context(self):
+        from setuplogger import GameLogAdapter, GameLogContext
+        logger = logging.getLogger("test disabled levels")
+        logger.propagate = False
+        logger.setLevel(logging.WARNING)
+        log = GameLogAdapter(logger, GameLogContext())
+        processed = []
+        log.process = lambda msg, kwargs: processed.append(msg) or (msg, kwargs)
+        log.debug("off")
+        log.info("off")
+        log.log(logging.DEBUG, "off")
+        log.warning("on")
+        self.assertEqual(processed, ["on"])
@@ -0,0 +1,261 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import jobmanager
+
+
+def claim_all(path):
+    """ claim jobs from path until none are left.  return the claimed jobs """
+    jm = jobmanager.SQLiteJobManager(path)
+    claimed = []
+    while True:
+        job = jm.claim(os.getpid())
+        if job is None:
+            break
+        claimed.append(job[1])
+        jm.complete_job(job[1], job[0])
+    jm.close()
+    return claimed
+
+
+class JobManagerTests(object):
+    """ the JobManager interface, run against each backend """
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.jm = self.open()
+
+    def tearDown(self):
+        self.jm.close()
+        shutil.rmtree(self.path)
+
+    def reopen(self):
+        self.jm.save()
+        self.jm.close()
+        self.jm = self.open()
+
+    def test_jobs(self):
+        self.jm.add_jobs([3, 1, 2], "pointstreak")
+        self.jm.add_job("9", "other", job_type=jobmanager.DELETE)
+        self.reopen()
+        self.assertEqual(sorted(self.jm.groups()), ["other", "pointstreak"])
+        self.assertEqual(sorted(self.jm.jobs("pointstreak")), [1, 2, 3])
+        self.assertEqual(list(self.jm.jobs("other", do_job_type=jobmanager.DELETE)), ["9"])
+        self.assertEqual(self.jm.job_count(), 3)
+        self.assertTrue(self.jm.has_jobs("other"))
+        self.assertFalse(self.jm.has_jobs("missing"))
+        self.assertEqual(sorted(self.jm.pending_groups()), ["other", "pointstreak"])
+
+        self.jm.complete_job(1, "pointstreak")
+        self.jm.set_job(2, "pointstreak", jobmanager.ERROR)
+        self.jm.set_job(4, "pointstreak", jobmanager.ERROR)
+        self.reopen()
+        self.assertEqual(self.jm.get_completed("pointstreak"), [1])
+        self.assertEqual(sorted(self.jm.jobs("pointstreak", jobmanager.ERROR)), [2, 4])
+        self.assertEqual(self.jm.job_count(), 1)
+
+        self.assertRaises(StandardError, self.jm.add_job, 3, "pointstreak")
+        self.assertRaises(StandardError, self.jm.complete_job, 5, "pointstreak")
+        self.assertRaises(StandardError, self.jm.complete_job, 1, "missing")
+        self.jm.add_job(3, "pointstreak", jobmanager.DONE, overwrite=True)
+        self.assertEqual(self.jm.job_count(), 0)
+
+        self.assertEqual(list(self.jm.pending_groups()), ["other"])
+        self.jm.clear_jobs("pointstreak")
+        self.reopen()
+        self.assertEqual(list(self.jm.groups()), ["other"])
+
+    def test_claim(self):
+        self.jm.add_jobs([1, 2], "pointstreak")
+        self.assertEqual(self.jm.claim("a"), ("pointstreak", 1))
+        self.assertEqual(self.jm.claim("a", "pointstreak"), ("pointstreak", 2))
+        self.assertEqual(self.jm.claim("a"), None)
+        self.jm.release(2, "pointstreak")
+        self.assertEqual(self.jm.claim("a"), ("pointstreak", 2))
+
+    def test_quarantine(self):
+        self.jm.add_jobs([1, 2], "pointstreak")
+        self.assertEqual(self.jm.fail_job(1, "pointstreak", jobmanager.PARSE, "bad play"), jobmanager.QUARANTINE)
+        self.assertEqual(self.jm.fail_job(2, "pointstreak", jobmanager.UNKNOWN), jobmanager.ERROR)
+        self.assertEqual([f[:2] for f in self.jm.failures("pointstreak")],
+                         [(1, jobmanager.QUARANTINE), (2, jobmanager.ERROR)])
+        self.assertEqual(self.jm.job_count(), 0)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_policy(self):
+        policy = jobmanager.RetryPolicy(max_attempts=3, base_delay=10, max_delay=15)
+        self.assertEqual(policy.next_job_type(jobmanager.NETWORK, 1), (jobmanager.TODO, 10))
+        self.assertEqual(policy.next_job_type(jobmanager.DB, 2), (jobmanager.TODO, 15))
+        self.assertEqual(policy.next_job_type(jobmanager.NETWORK, 3), (jobmanager.ERROR, None))
+        self.assertEqual(policy.next_job_type(jobmanager.LINEUP, 1), (jobmanager.QUARANTINE, None))
+        self.assertEqual(policy.next_job_type(jobmanager.SCRAPE, 1), (jobmanager.QUARANTINE, None))
+        self.assertEqual(policy.next_job_type(jobmanager.UNKNOWN, 1), (jobmanager.ERROR, None))
+        self.assertEqual([jobmanager.DEFAULT_RETRY_POLICY.delay(n) for n in (1, 2, 3)], [60, 120, 240])
+
+
+class TestJobManager(JobManagerTests, unittest.TestCase):
+    def open(self):
+        return jobmanager.open_jobs(os.path.join(self.path, "jobs.yml"))
+
+
+class TestSQLiteJobManager(JobManagerTests, unittest.TestCase):
+    def open(self):
+        return jobmanager.open_jobs(os.path.join(self.path, "jobs.sqlite"))
+
+    def test_leases(self):
+        self.jm.add_jobs([1, 2], "pointstreak")
+        other = self.open()
+        try:
+            self.assertEqual(self.jm.claim("a", lease_seconds=0.2), ("pointstreak", 1))
+            self.assertEqual(other.claim("b", lease_seconds=0.2), ("pointstreak", 2))
+            self.assertEqual(other.claim("b"), None)
+            time.sleep(0.3)
+            self.assertEqual(self.jm.heartbeat("a"), 1)
+            # b let its lease run out, so its job can be claimed again
+            self.assertEqual(self.jm.claim("a"), ("pointstreak", 2))
+            self.jm.complete_job(2, "pointstreak")
+            self.assertEqual(self.jm.heartbeat("a"), 1)
+        finally:
+            other.close()
+
+    def test_lease_lost(self):
+        self.jm.add_jobs([1], "pointstreak")
+        self.assertEqual(self.jm.claim("a", lease_seconds=0.1), ("pointstreak", 1))
+        time.sleep(0.15)
+        self.assertEqual(self.jm.claim("b"), ("pointstreak", 1))
+        # a's lease ran out and b holds the job now
+        self.assertRaises(jobmanager.LeaseLost, self.jm.complete_job, 1, "pointstreak", "a")
+        self.assertRaises(jobmanager.LeaseLost, self.jm.fail_job, 1, "pointstreak", jobmanager.PARSE, worker="a")
+        self.jm.complete_job(1, "pointstreak", "b")
+        self.assertRaises(jobmanager.LeaseLost, self.jm.fail_job, 1, "pointstreak", jobmanager.PARSE, worker="b")
+        self.assertEqual(self.jm.get_completed("pointstreak"), [1])
+        self.assertEqual(self.jm.failures("pointstreak"), [])
+        self.assertRaises(StandardError, self.jm.complete_job, 2, "pointstreak", "b")
+
+    def test_retries(self):
+        policy = jobmanager.RetryPolicy(max_attempts=2, base_delay=0.2)
+        self.jm.add_jobs([1, 2], "pointstreak")
+        self.assertEqual(self.jm.claim("a"), ("pointstreak", 1))
+        start = time.time()
+        self.assertEqual(self.jm.fail_job(1, "pointstreak", jobmanager.NETWORK, "timed out", policy), jobmanager.TODO)
+        self.assertEqual(self.jm.claim("a"), ("pointstreak", 2))
+        self.jm.complete_job(2, "pointstreak")
+
+        # waiting for its retry
+        self.assertEqual(self.jm.claim("a"), None)
+        self.assertEqual(list(self.jm.pending_groups()), [])
+        self.assertTrue(start + 0.2 <= self.jm.next_claim_time() <= time.time() + 0.2)
+        self.assertEqual(self.jm.failures("pointstreak"),
+                         [(1, jobmanager.TODO, jobmanager.NETWORK, 1, "timed out", self.jm.next_claim_time())])
+        time.sleep(0.25)
+        self.assertEqual(list(self.jm.pending_groups()), ["pointstreak"])
+        self.assertEqual(self.jm.claim("a"), ("pointstreak", 1))
+        self.assertEqual(self.jm.fail_job(1, "pointstreak", jobmanager.NETWORK, "timed out", policy), jobmanager.ERROR)
+        self.assertEqual(self.jm.failures("pointstreak")[0][:4], (1, jobmanager.ERROR, jobmanager.NETWORK, 2))
+        self.assertEqual(self.jm.next_claim_time(), None)
+
+        self.jm.set_job(1, "pointstreak", jobmanager.TODO)
+        self.assertEqual(self.jm.failures("pointstreak"), [])
+        self.assertRaises(StandardError, self.jm.fail_job, 3, "pointstreak", jobmanager.DB)
+
+    def test_older_file(self):
+        db = sqlite3.connect(os.path.join(self.path, "old.sqlite"))
+        db.execute("CREATE TABLE jobs (job_group NOT NULL, job NOT NULL, job_type TEXT NOT NULL, "
+                   "worker TEXT, lease_until REAL, PRIMARY KEY (job_group, job))")
+        db.execute("INSERT INTO jobs (job_group, job, job_type) VALUES ('pointstreak', 1, 'todo')")
+        db.commit()
+        db.close()
+        jm = jobmanager.open_jobs(os.path.join(self.path, "old.sqlite"))
+        try:
+            self.assertEqual(jm.fail_job(1, "pointstreak", jobmanager.LINEUP), jobmanager.QUARANTINE)
+        finally:
+            jm.close()
+
+    def test_import_yaml(self):
+        yaml_jobs = jobmanager.JobManager(os.path.join(self.path, "jobs.yml"))
+        yaml_jobs.add_jobs([1, 2], "pointstreak")
+        yaml_jobs.set_job(2, "pointstreak", jobmanager.DONE)
+        yaml_jobs.save()
+        self.jm.import_yaml(os.path.join(self.path, "jobs.yml"))
+        self.assertEqual(list(self.jm.jobs("pointstreak")), [1])
+        self.assertEqual(self.jm.get_completed("pointstreak"), [2])
+
+    def test_processes(self):
+        self.jm.add_jobs(range(200), "pointstreak")
+        pool = multiprocessing.Pool(4)
+        try:
+            claimed = pool.map(claim_all, [os.path.join(self.path, "jobs.sqlite")] * 4)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(sorted(sum(claimed, [])), range(200))
+        self.assertEqual(self.jm.job_count(), 0)
+
+
+class TestHeartbeat(unittest.TestCase):
+    def test_survives_errors(self):
+        beats = []
+
+        class Jobs(object):
+            def heartbeat(self, worker, lease_seconds):
+                beats.append(worker)
+                if len(beats) == 1:
+                    raise sqlite3.OperationalError("database is locked")
+                return 1
+        heartbeat = jobmanager.Heartbeat(Jobs(), "a", lease_seconds=0.03)
+        heartbeat.start()
+        time.sleep(0.1)
+        heartbeat.stop()
+        self.assertTrue(len(beats) >= 2)
+
+
+class TestJobsWatcher(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.jobs_path = os.path.join(self.path, "jobs.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def add_later(self, job, delay=0.1):
+        def add():
+            time.sleep(delay)
+            jm = jobmanager.open_jobs(self.jobs_path)
+            jm.add_job(job, "pointstreak")
+            jm.close()
+        thread = threading.Thread(target=add)
+        thread.start()
+        return thread
+
+    def check_wakeups(self, watcher):
+        try:
+            self.assertFalse(watcher.wait(0.05))
+            # the file is created, then changed
+            for job in (1, 2):
+                thread = self.add_later(job)
+                start = time.time()
+                self.assertTrue(watcher.wait(5))
+                self.assertTrue(time.time() - start < 2)
+                thread.join()
+                while watcher.wait(0.05):
+                    pass
+            # a change made before waiting still counts
+            self.add_later(3, 0).join()
+            self.assertTrue(watcher.wait(5))
+        finally:
+            watcher.close()
+
+    def test_wait(self):
+        self.check_wakeups(jobmanager.JobsWatcher(self.jobs_path))
+
+    def test_poll(self):
+        watcher = jobmanager.JobsWatcher(self.jobs_path, poll_interval=0.05)
+        # as without inotify
+        watcher.close()
+        self.check_wakeups(watcher)
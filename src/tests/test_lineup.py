@@ -1,9 +1,27 @@
+import itertools
+import random
 import lineup
 from lineup import Player, LineupError, Name
-from constants import LEFT, RIGHT
+from constants import LEFT, RIGHT, POSITIONS, DH
 import unittest
 
 
+def brute_force_complete_positions(team):
+    """ every position layout for which team.is_complete() """
+    save_positions = [p.position for p in team]
+    options = []
+    try:
+        for test_positions in itertools.product(*[p.all_positions for p in team]):
+            for player, position in zip(team, test_positions):
+                player.position = position
+            if team.is_complete():
+                options.append(test_positions)
+    finally:
+        for player, position in zip(team, save_positions):
+            player.position = position
+    return options
+
+
 class TestNames(unittest.TestCase):
     def test_equality1(self):
         a = Name("Hirzel, Tim")
@@ -32,6 +50,41 @@ class TestNames(unittest.TestCase):
         self.assertTrue(a == b)
 
 
+    def test_hash(self):
+        a = Name("Hirzel, Tim")
+        self.assertEqual(hash(a), hash(Name(" Tim  Hirzel")))
+        self.assertEqual(len(set([a, Name("Tim Hirzel")])), 1)
+
+    def test_hash_case(self):
+        a = Name("Joe McDonald")
+        b = Name("Joe Mcdonald")
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertTrue(b in set([a]))
+        self.assertEqual({a: 1}[b], 1)
+
+    def test_first_last(self):
+        a = Name("Hirzel, Tim")
+        self.assertEqual((a.first(), a.last(), a.id()), ("Tim", "Hirzel", "hirzt"))
+        b = Name("Ichiro")
+        self.assertEqual((b.first(), b.last(), b.id()), ("", "Ichiro", "ichir"))
+
+    def test_ids_not_shared(self):
+        a = Name("Tim Hirzel")
+        b = Name("Tim Hirzel")
+        a.set_id("hirzt001")
+        self.assertEqual(a.id(), "hirzt001")
+        self.assertEqual(b.id(), "hirzt")
+
+    def test_pickle(self):
+        import pickle
+        a = Name("Hirzel, Tim")
+        a.set_id("hirzt001")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            b = pickle.loads(pickle.dumps(a, protocol))
+            self.assertEqual((b, b.id(), b.last()), ("Tim Hirzel", "hirzt001", "Hirzel"))
+
+
 class TestPlayer(unittest.TestCase):
     def test_merge(self):
         boggs = Player("Wade Boggs", 26, 1, "P", LEFT)
@@ -41,6 +94,12 @@ class TestPlayer(unittest.TestCase):
         boggs.merge(boggs2)
         self.assertEqual(boggs.number, 26)
 
+    def test_merge_then_lower_case(self):
+        # a name not yet seen, so the lower case spelling is looked up after the merge
+        zedd = Player("Q Zedd")
+        zedd.merge(Player("Quinn Zedd"))
+        self.assertEqual(Player("quinn zedd").name, zedd.name)
+
     def test_merge_keep_longer_name(self):
         boggs = Player("Wade Boggs", 26, 1, "P", LEFT)
         boggs2 = Player("Boggs, W", 26, 1, "P", LEFT)
@@ -151,6 +210,42 @@ class TestCaseComplete(unittest.TestCase):
         self.assertEqual("2B", self.lineup.find_player_by_name("Marty Barret").position)
         self.assertEqual("2B", self.lineup.find_player_by_name("M Barret").position)
 
+    def test_name_lookup_matches_scan(self):
+        queries = ["Jim Rice", "rice, jim", "ricej", "Oil Can Boyd", "boydo", "Nobody Here", "Boggs"]
+        for query in queries:
+            expected = None
+            for p in self.lineup:
+                if p.name == query:
+                    expected = p
+                    break
+            if expected is None:
+                self.assertRaises(KeyError, self.lineup.find_player_by_name, query)
+            else:
+                self.assertTrue(self.lineup.find_player_by_name(query) is expected, query)
+
+    def test_name_lookup_after_changes(self):
+        rice = self.lineup.find_player_by_name("Jim Rice")
+        rice.name.set_id("ricej001")
+        self.assertTrue(self.lineup.find_player_by_name("ricej001") is rice)
+        rice.name = Name("James Rice")
+        self.assertRaises(KeyError, self.lineup.find_player_by_name, "Jim Rice")
+        self.assertTrue(self.lineup.find_player_by_name("James Rice") is rice)
+
+    def test_name_index_kept(self):
+        self.lineup.find_player_by_name("Jim Rice")
+        index = self.lineup._name_index
+        # other games making players, or setting the ids names already have, leave the index alone
+        Player("Wade Boggs", 26, 1, "P", LEFT).name.set_id("boggw")
+        rice = self.lineup.find_player_by_name("Jim Rice")
+        rice.name.set_id(rice.name.id())
+        rice.name = rice.name
+        self.lineup.find_player_by_name("Jim Rice")
+        self.assertTrue(self.lineup._name_index is index)
+        self.lineup.remove(rice)
+        self.assertRaises(KeyError, self.lineup.find_player_by_name, "James Rice")
+        self.lineup.update_player(Player("James Rice", 14, 3, "LF", RIGHT))
+        self.assertEqual("LF", self.lineup.find_player_by_name("James Rice").position)
+
 
     def test_move(self):
         self.lineup.move_player("Jim Rice", "DH")
@@ -221,3 +316,37 @@ class TestCaseComplete(unittest.TestCase):
 #        test = Player(None, None, None, "3B", None)
 #        result = test.find_closest_name(self.lineup)
 #        self.assertEqual(result, self.lineup.find_player_by_number(26))
+
+
+class TestCompletePositions(unittest.TestCase):
+    def random_lineup(self, rng):
+        team = lineup.Lineup()
+        size = rng.choice([8, 9, 9, 10, 10])
+        orders = range(1, 10) + [None, None]
+        if rng.random() < 0.2:
+            orders[rng.randint(0, 8)] = None
+        for i in range(size):
+            p = Player("Player %s" % chr(ord('A') + i), i, orders[i], None, RIGHT)
+            p.all_positions = rng.sample(POSITIONS + [DH, "PH"], rng.randint(0, 2))
+            if rng.random() < 0.9:
+                # usually listed at their own spot
+                p.all_positions.insert(0, (POSITIONS + [DH])[i % 10])
+            team.append(p)
+        return team
+
+    def test_same_as_brute_force(self):
+        rng = random.Random(1234)
+        for i in range(400):
+            team = self.random_lineup(rng)
+            expected = brute_force_complete_positions(team)
+            self.assertEqual(team.find_complete_positions(), expected)
+            self.assertEqual(team.find_complete_positions(max_options=2), expected[:2])
+
+    def test_max_steps(self):
+        team = lineup.Lineup()
+        for i in range(10):
+            p = Player("Player %s" % chr(ord('A') + i), i, i + 1 if i < 9 else None, None, RIGHT)
+            p.all_positions = POSITIONS + [DH]
+            team.append(p)
+        self.assertEqual(len(team.find_complete_positions(max_options=2)), 2)
+        self.assertRaises(LineupError, team.find_complete_positions, max_steps=1000)
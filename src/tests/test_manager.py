@@ -0,0 +1,162 @@
+import socket
+import unittest
+import urllib2
+
+import pyparsing as pp
+from sqlalchemy import create_engine, event as sqlevent
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import jobmanager
+import lineup
+import manager
+import pointstreakscraper as pss
+from gamefixtures import new_game
+from models import event
+from models import playerinfo
+
+
+def make_game(gameid):
+    game, parser = new_game()
+    game.game_id = gameid
+    game.new_half()
+    game.new_batter("Al Abbot")
+    parser.parse_event("Ball, Called Strike, 10 Al Abbot advances to 1st (single)")
+    game.new_batter("Bo Baker")
+    parser.parse_event("11 Bo Baker putout (6-4-3 DP) for out number 2")
+    game.new_half()
+    return game
+
+
+class TestEventWriter(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        event.Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def test_rows_match_models(self):
+        game = make_game("g1")
+        rows = list(game.event_rows())
+        self.assertEqual(len(rows), 2)
+        for row, model in zip(rows, game.events()):
+            for column, value in row.items():
+                self.assertEqual(getattr(model, column), value)
+
+    def test_records(self):
+        game = make_game("g1")
+        record = game.event_list[0]
+        self.assertEqual(game.get_event_value(record, "game_id"), "g1")
+        game.set_event_value(record, "end_game_flag", 'T')
+        self.assertEqual(record.as_dict()["GAME_END_FL"], 'T')
+        self.assertEqual(list(game.events())[0].GAME_END_FL, 'T')
+
+    def test_batches(self):
+        writer = manager.EventWriter(self.session, batch_size=5)
+        writer.add_game(make_game("g1"))
+        self.assertEqual(self.session.query(event.Event).count(), 0)
+        writer.add_game(make_game("g2"))
+        writer.add_game(make_game("g3"))
+        self.assertEqual(self.session.query(event.Event).count(), 6)
+        self.assertEqual(writer.rows, [])
+        writer.add_game(make_game("g4"))
+        writer.flush()
+        self.assertEqual(self.session.query(event.Event).filter_by(GAME_ID="g4").count(), 2)
+        bat = self.session.query(event.Event).filter_by(GAME_ID="g1").order_by(event.Event.ID).first()
+        self.assertEqual(bat.PITCH_SEQ_TX, "BCX")
+
+    def test_replace(self):
+        writer = manager.EventWriter(self.session)
+        writer.add_game(make_game("g1"))
+        writer.add_game(make_game("g2"))
+        statements = []
+        sqlevent.listen(self.session.bind, "before_cursor_execute",
+                        lambda conn, cursor, statement, *args: statements.append(statement))
+        writer = manager.EventWriter(self.session, batch_size=100)
+        writer.add_rows(list(make_game("g1").event_rows()), "g1", replace=True)
+        # nothing is written, so no write lock is taken, until the batch is
+        self.assertEqual(statements, [])
+        writer.flush()
+        self.assertTrue(statements[0].startswith("DELETE"))
+        self.assertEqual(self.session.query(event.Event).filter_by(GAME_ID="g1").count(), 2)
+        self.assertEqual(self.session.query(event.Event).count(), 4)
+
+
+class TestPlayerIdResolver(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:")
+        playerinfo.Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.queries = []
+        sqlevent.listen(engine, "before_cursor_execute",
+                        lambda conn, cursor, statement, *args: self.queries.append(statement))
+
+    def player(self, name, team):
+        player = lineup.Player(name, 10, team_id=team)
+        for attr in ("birthday", "college_name", "college_year", "draft_status", "height", "hometown", "weight"):
+            setattr(player, attr, None)
+        return player
+
+    def roster(self, team, names):
+        return [self.player(name, team) for name in names]
+
+    def resolve(self, resolver, players):
+        resolver.resolve(players)
+        self.session.commit()
+        resolver.commit()
+        return [p.name.id() for p in players]
+
+    def test_new_and_existing(self):
+        existing = self.player("John Smith", "A")
+        existing.name.set_id("smitj001")
+        self.session.add(existing.to_model())
+        self.session.commit()
+
+        resolver = manager.PlayerIdResolver(self.session)
+        del self.queries[:]
+        ids = self.resolve(resolver, self.roster("A", ["John Smith", "Jim Smith", "Al Abbot"]) +
+                                     self.roster("B", ["John Smith", "Bo Baker", "Bo Baker"]))
+        self.assertEqual(ids, ["smitj001", "smitj002", "abboa001", "smitj003", "bakeb001", "bakeb001"])
+        selects = [q for q in self.queries if q.startswith("SELECT")]
+        self.assertEqual(len(selects), 2)
+        self.assertEqual(self.session.query(playerinfo.PlayerInfo).count(), 5)
+
+        # everything is cached now
+        del self.queries[:]
+        ids = self.resolve(resolver, self.roster("B", ["john smith", "Bo Baker"]))
+        self.assertEqual(ids, ["smitj003", "bakeb001"])
+        self.assertEqual(self.queries, [])
+
+    def test_warm_start_and_rollback(self):
+        self.resolve(manager.PlayerIdResolver(self.session), self.roster("A", ["Al Abbot"]))
+        resolver = manager.PlayerIdResolver(self.session)
+        resolver.warm(["A"])
+        del self.queries[:]
+        self.assertEqual(self.resolve(resolver, self.roster("A", ["Al Abbot"])), ["abboa001"])
+        self.assertEqual(self.queries, [])
+
+        resolver.resolve(self.roster("A", ["Cy Carter"]))
+        self.session.rollback()
+        resolver.rollback()
+        self.assertEqual(self.resolve(resolver, self.roster("C", ["Cy Carter"])), ["cartc001"])
+
+
+class TestClassifyFailure(unittest.TestCase):
+    def test_classes(self):
+        failures = [(urllib2.URLError("refused"), jobmanager.NETWORK),
+                    (urllib2.HTTPError("url", 503, "busy", {}, None), jobmanager.NETWORK),
+                    (urllib2.HTTPError("url", 404, "missing", {}, None), jobmanager.SCRAPE),
+                    (socket.timeout("timed out"), jobmanager.NETWORK),
+                    (pss.ScrapeError("no divs"), jobmanager.SCRAPE),
+                    (pp.ParseException("bad play"), jobmanager.PARSE),
+                    (lineup.LineupError("no pitcher"), jobmanager.LINEUP),
+                    (OperationalError("INSERT", {}, Exception("locked")), jobmanager.DB),
+                    (KeyError("name"), jobmanager.UNKNOWN)]
+        for exception, failure in failures:
+            self.assertEqual(manager.classify_failure(exception), failure)
+
+    def test_missing_page_not_retried(self):
+        for exception in (urllib2.HTTPError("url", 404, "missing", {}, None), pss.ScrapeError("no divs")):
+            failure = manager.classify_failure(exception)
+            self.assertEqual(jobmanager.DEFAULT_RETRY_POLICY.next_job_type(failure, 1), (jobmanager.QUARANTINE, None))
+        failure = manager.classify_failure(urllib2.HTTPError("url", 503, "busy", {}, None))
+        self.assertEqual(jobmanager.DEFAULT_RETRY_POLICY.next_job_type(failure, 1)[0], jobmanager.TODO)
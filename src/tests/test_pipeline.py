@@ -0,0 +1,88 @@
+import os
+import Queue
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import jobmanager
+import pipeline
+from models import event
+from models import parserecord
+from test_reparse import save_container
+
+
+class TestStage(unittest.TestCase):
+    def test_back_pressure(self):
+        produced = []
+        lag = []
+        errors = []
+
+        def produce(n):
+            produced.append(n)
+            if n == 3:
+                raise ValueError("bad item")
+            return [n, -n]
+
+        def consume(n):
+            time.sleep(0.002)
+            lag.append(len(produced) - len(lag))
+            return []
+
+        queues = [Queue.Queue(2) for i in range(2)]
+        on_error = lambda *args: errors.append(args[:2])
+        first = pipeline.Stage("produce", produce, 2, queues[0], queues[1], on_error)
+        second = pipeline.Stage("consume", consume, 1, queues[1], None, on_error)
+        first.next_stage = second
+        for stage in (first, second):
+            stage.start()
+        for n in range(50):
+            queues[0].put(n)
+        first.stop()
+        first.join()
+        second.join()
+        self.assertEqual((first.done, first.failed, second.done), (49, 1, 98))
+        self.assertEqual(errors, [("produce", 3)])
+        # the producers stay within a couple of queues of the consumer
+        self.assertTrue(max(lag) <= 8)
+
+
+class TestGamePipeline(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        engine = create_engine("sqlite:///" + os.path.join(self.path, "test.sqlite"))
+        event.Base.metadata.create_all(engine)
+        parserecord.Base.metadata.create_all(engine)
+        self.new_session = sessionmaker(bind=engine)
+        for gameid in ("101", "102"):
+            save_container(self.path, gameid)
+        with open(os.path.join(self.path, "gc_103.json"), "w") as f:
+            f.write("{}")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_saved_containers(self):
+        reports = []
+        lock = threading.Lock()
+
+        def report(*result):
+            with lock:
+                reports.append(result)
+        games = pipeline.GamePipeline(self.new_session, container_path=self.path, parse_workers=2, batch_size=1000,
+                                      report=report)
+        loaded, failures = games.run(["101", "102", "103", "101"])
+        self.assertEqual(loaded, 2)
+        self.assertEqual([f[:3] for f in failures], [("parse", "103", jobmanager.UNKNOWN)])
+        self.assertEqual(sorted(r[0] for r in reports), ["101", "102", "103"])
+
+        session = self.new_session()
+        count = session.query(event.Event).filter(event.Event.GAME_ID == "101").count()
+        self.assertTrue(count > 1)
+        self.assertEqual(games.events, session.query(event.Event).count())
+        self.assertEqual(sorted(r.GAME_ID for r in session.query(parserecord.ParseRecord)), ["101", "102"])
+        session.close()
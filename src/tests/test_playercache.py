@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import playercache
+from models.playerinfo import PlayerInfo
+
+
+class TestPlayerProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = playercache.PlayerProfileCache(os.path.join(self.tmpdir, "profiles.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def make_info(self):
+        info = PlayerInfo()
+        info.BAT_HAND = "R"
+        info.THROW_HAND = "L"
+        info.HOMETOWN = u"Qu\xe9bec"
+        return info
+
+    def test_round_trip(self):
+        self.assertEqual(self.cache.get("123"), None)
+        self.cache.put("123", u"Tim Hirzel", self.make_info())
+        self.assertTrue(123 in self.cache)
+        full_name, info = self.cache.get(123)
+        self.assertEqual(full_name, u"Tim Hirzel")
+        self.assertEqual((info.BAT_HAND, info.THROW_HAND, info.HOMETOWN, info.WEIGHT), ("R", "L", u"Qu\xe9bec", None))
+
+    def test_expiry_and_invalidate(self):
+        self.cache.put("123", u"Tim Hirzel", self.make_info())
+        self.cache.max_age = -1
+        self.assertEqual(self.cache.get("123"), None)
+        self.cache.max_age = playercache.DEFAULT_MAX_AGE
+        self.cache.invalidate("123")
+        self.assertFalse("123" in self.cache)
+
+    def test_persists(self):
+        self.cache.put("123", u"Tim Hirzel", self.make_info())
+        reopened = playercache.PlayerProfileCache(self.cache.path)
+        self.assertEqual(reopened.get("123")[0], u"Tim Hirzel")
+        reopened.close()
+
+    def test_shared_cache(self):
+        cache = playercache.profile_cache_for(self.tmpdir)
+        self.assertTrue(cache is playercache.profile_cache_for(self.tmpdir + "/"))
+        self.assertTrue(os.path.isfile(os.path.join(self.tmpdir, playercache.PROFILE_CACHE_FILENAME)))
+        cache.close()
+
+    def test_shared_cache_reopens(self):
+        cache = playercache.profile_cache_for(self.tmpdir)
+        cache.close()
+        reopened = playercache.profile_cache_for(self.tmpdir)
+        self.assertFalse(reopened is cache)
+        reopened.put("123", u"Tim Hirzel", self.make_info())
+        self.assertEqual(reopened.get("123")[0], u"Tim Hirzel")
+        reopened.close()
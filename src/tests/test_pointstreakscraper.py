@@ -1,10 +1,11 @@
+import shutil
+import tempfile
 import unittest
 
 import setuplogger
 setuplogger.setupRootLogger(0)
 
 import pointstreakscraper as pss
-from workerconstants import PERSISTENT_FILE_PATH
 
 # class Test109951(unittest.TestCase):
 #     def setUp(self):
@@ -21,7 +22,13 @@ from workerconstants import PERSISTENT_FILE_PATH
 
 class Test87621(unittest.TestCase):
     def setUp(self):
-        self.scraper = pss.PointStreakScraper(87621, PERSISTENT_FILE_PATH)
+        # pages and player profiles go to a scratch cache, not the shared html cache
+        self.cache_path = tempfile.mkdtemp()
+        self.scraper = pss.PointStreakScraper(87621, self.cache_path)
+
+    def tearDown(self):
+        self.scraper.profile_cache.close()
+        shutil.rmtree(self.cache_path)
 
     def test_lineup(self):
         away_roster, home_roster = self.scraper.game_rosters()
@@ -40,3 +47,32 @@ class Test87621(unittest.TestCase):
 
         for i in range(1,10):
             home_starting_lineup.find_player_by_order(i)
+
+
+class OfflineScraper(pss.PointStreakScraper):
+    """ a scraper that never touches the network, serving player pages from a dict """
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+
+    def _player_page_from_id(self, player_id):
+        self.fetched.append(player_id)
+        if player_id not in self.pages:
+            raise IOError("no page for " + player_id)
+        return self.pages[player_id]
+
+
+class TestPrefetchPlayerPages(unittest.TestCase):
+    def test_prefetch(self):
+        scraper = OfflineScraper(dict(("p%d" % i, "page %d" % i) for i in range(20)))
+        pages = scraper._prefetch_player_pages(["p%d" % i for i in range(20)] + ["p3", None, "missing"])
+        self.assertEqual(pages, scraper.pages)
+        self.assertEqual(sorted(scraper.fetched), sorted(scraper.pages.keys() + ["missing"]))
+
+    def test_empty(self):
+        self.assertEqual(OfflineScraper({})._prefetch_player_pages([None]), {})
+
+    def test_cached_profiles_not_fetched(self):
+        scraper = OfflineScraper({"p1": "page 1", "p2": "page 2"})
+        scraper.profile_cache = set(["p1"])
+        self.assertEqual(scraper._prefetch_player_pages(["p1", "p2"]), {"p2": "page 2"})
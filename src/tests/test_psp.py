@@ -10,6 +10,8 @@ import pointstreakparser as psp
 import pointstreakscraper as pss
 import gamewrapper
 import gamestate
+from gamefixtures import new_game
+from lineup import LineupError
 
 logger = logging.getLogger("main")
 
@@ -32,4 +34,82 @@ class TestCase(unittest.TestCase):
         self.parser.parse_event("Called Strike, Ball, Foul, Ball, 15 John Murphy advances to 1st (error by the third baseman)")
 
     def test_parse2(self):
-        self.parser.parse_event("35 Ryan Donahue subs for Chris Matulis.")
\ No newline at end of file
+        self.parser.parse_event("35 Ryan Donahue subs for Chris Matulis.")
+
+
+HALVES = [
+    [("Al Abbot", "Ball, Called Strike, Foul, 10 Al Abbot advances to 1st (single)"),
+     ("Bo Baker", "Swinging Strike, 11 Bo Baker putout (6-4-3 DP) for out number 2"),
+     ("Cy Carter", "Ball, Ball, Ball, Ball, 12 Cy Carter advances to 1st (walk)"),
+     ("Di Dunn", "13 di dunn advances to 2nd (double), 12 Cy Carter advances to 3rd base (Throw)"),
+     ("Ed Evans", "Foul, 14 Ed Evans putout (3) for out number 3")],
+    [("Jo Jones", "10 Jo Jones advances to home (home run)"),
+     ("Ken King", "Called Strike, 11 Ken King advances to 3rd (triple)"),
+     ("Lou Lane", "12 Lou Lane putout (5-3) for out number 1"),
+     ("Mo Mann", "Ball, 13 Mo Mann putout (Fly out to Left Fielder) for out number 2"),
+     ("Ned Nash", "14 Ned Nash putout (4-3) for out number 3")],
+]
+
+
+class TestFastPath(unittest.TestCase):
+    def play_game(self, use_fast_path):
+        game, parser = new_game(use_fast_path)
+        for half in HALVES:
+            game.new_half()
+            for batter, text in half:
+                game.new_batter(batter)
+                parser.parse_event(text)
+        game.new_half()
+        events = []
+        for e in game.events():
+            row = dict(e.__dict__)
+            row.pop("_sa_instance_state")
+            events.append(row)
+        return events
+
+    def test_same_events_as_grammar(self):
+        fast = self.play_game(True)
+        self.assertEqual(len(fast), 10)
+        self.assertEqual(fast, self.play_game(False))
+
+    def test_classify(self):
+        parser = psp.PointStreakParser(gamewrapper.GameWrapper(None), ["Collin Shaw"])
+        self.assertEqual(len(parser._classify_common_event("Ball, called strike, 19 Collin Shaw advances to 1st (single)")), 3)
+        self.assertEqual(len(parser._classify_common_event("19 collin shaw putout (6-4-3 DP) for out number 2")), 1)
+        # anything unusual is left to the grammar
+        self.assertIsNone(parser._classify_common_event("19 Collin Shaw advances to 2nd (error by the third baseman)"))
+        self.assertIsNone(parser._classify_common_event("19 John Murphy advances to 1st (single)"))
+        self.assertIsNone(parser._classify_common_event("19 Collin Shaw putout (6-3) For Out Number 1"))
+        self.assertIsNone(parser._classify_common_event("Ball,"))
+
+    def test_fates_resolved_each_half(self):
+        game, parser = new_game()
+        fates = []
+        for half in HALVES:
+            game.new_half()
+            for batter, text in half:
+                game.new_batter(batter)
+                parser.parse_event(text)
+            fates.append([e.get("fate_of_batter") for e in game.event_list])
+        game.new_half()
+        # fate ids stand in until the half closes
+        self.assertEqual(fates[1][:5], [1, 0, 3, 2, 0])
+        self.assertEqual([e.get("fate_of_batter") for e in game.event_list], [1, 0, 3, 2, 0, 4, 3, 0, 0, 0])
+
+
+class TestFielders(unittest.TestCase):
+    def test_layout_search_gives_up(self):
+        game, parser = new_game()
+        game.new_half()
+        fielders = game._current_fielding_lineup()
+        fielders.find_player_by_position("SS").position = "LF"
+
+        def give_up(**kwargs):
+            raise LineupError("Gave up looking for complete lineups")
+        fielders.find_complete_positions = give_up
+        game.new_batter("Al Abbot")
+        parser.parse_event("10 Al Abbot putout (6-3) for out number 1")
+        # the out is recorded, with nobody moved to shortstop, rather than failing the game
+        self.assertEqual(len(game.event_list), 1)
+        self.assertEqual(game.outs, 1)
+        self.assertRaises(KeyError, fielders.find_player_by_position, "SS")
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import manager
+import reparse
+from gamecontainer import GameContainer
+from gamefixtures import AWAY_NAMES, HOME_NAMES, game_plays, roster
+from models import event
+from models import parserecord
+
+
+def save_container(path, gameid, halves=4):
+    gc = GameContainer(path, gameid, "away", "home")
+    gc.set_away_roster(roster(AWAY_NAMES, "away"))
+    gc.set_home_roster(roster(HOME_NAMES, "home"))
+    for batters in game_plays(halves):
+        gc.new_half()
+        for name, number, text in batters:
+            gc.add_event("", text, name, number)
+    gc.save()
+
+
+class TestReparse(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        engine = create_engine('sqlite:///:memory:')
+        event.Base.metadata.create_all(engine)
+        parserecord.Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        for gameid in ("101", "102"):
+            save_container(self.path, gameid)
+        with open(os.path.join(self.path, "gc_103.json"), "w") as f:
+            f.write("{}")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def events(self, gameid):
+        return self.session.query(event.Event).filter(event.Event.GAME_ID == gameid).count()
+
+    def test_container_gameids(self):
+        self.assertEqual(reparse.container_gameids(self.path), ["101", "102", "103"])
+
+    def test_reparse(self):
+        self.session.add(event.Event(GAME_ID="101"))
+        self.session.commit()
+        reports = []
+        for workers in (2, 1):
+            good, failed, events = reparse.reparse(reparse.container_gameids(self.path), self.session, self.path,
+                                                   workers=workers, report=lambda *result: reports.append(result))
+            self.assertEqual((good, failed), (2, 1))
+            self.assertEqual(events, self.events("101") + self.events("102"))
+            self.assertTrue(self.events("101") > 1)
+            self.assertEqual(self.events("101"), self.events("102"))
+        failures = [r for r in reports if r[2] is not None]
+        self.assertEqual([r[0] for r in failures], ["103", "103"])
+
+    def test_skip_unchanged(self):
+        gameids = ["101", "102"]
+        self.assertEqual(reparse.reparse(gameids, self.session, self.path, workers=1, skip_unchanged=True)[0], 2)
+        events = self.events("101")
+        self.assertEqual(sorted(manager.parsed_hashes(self.session, gameids)), gameids)
+        self.assertTrue(manager.container_unchanged(self.session, "101", self.path))
+
+        filename = os.path.join(self.path, "gc_102.json")
+        with open(filename) as f:
+            d = json.load(f)
+        d["list_of_halfs"][1][0]["text"] = d["list_of_halfs"][1][0]["text"].replace("(single)", "(double)")
+        with open(filename, "w") as f:
+            json.dump(d, f)
+        self.assertFalse(manager.container_unchanged(self.session, "102", self.path))
+
+        reports = []
+        good, failed, _ = reparse.reparse(gameids, self.session, self.path, workers=1,
+                                          report=lambda *result: reports.append(result), skip_unchanged=True)
+        self.assertEqual((good, failed), (1, 0))
+        self.assertEqual([(r[0], r[1] is None) for r in reports], [("101", True), ("102", False)])
+        self.assertEqual(self.events("101"), events)
+        self.assertTrue(manager.container_unchanged(self.session, "102", self.path))
@@ -0,0 +1,115 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib2
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingTCPServer
+from StringIO import StringIO
+
+import scrapetools
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def send_body(self, body, code=200, headers={}):
+        self.send_response(code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_body("", 302, {"Location": "/page?x=1"})
+        elif self.path == "/gzip":
+            buf = StringIO()
+            gz = gzip.GzipFile(fileobj=buf, mode="wb")
+            gz.write("zipped")
+            gz.close()
+            self.send_body(buf.getvalue(), headers={"Content-Encoding": "gzip"})
+        elif self.path == "/refresh":
+            self.send_body("", headers={"Refresh": "0; url=/page?refresh"})
+        elif self.path == "/meta":
+            self.send_body('<html><head><meta http-equiv="refresh" content="5; URL=/page?meta"></head></html>',
+                           headers={"Content-Type": "text/html"})
+        elif self.path.startswith("/page"):
+            self.server.referers.append(self.headers.get("Referer"))
+            self.send_body("page " + self.path)
+        else:
+            self.send_body("missing", 404)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPConnectionPool(unittest.TestCase):
+    def setUp(self):
+        ThreadingTCPServer.allow_reuse_address = True
+        self.server = ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.referers = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.pool = scrapetools.HTTPConnectionPool(pool_size=2, timeout=5)
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for i in range(5):
+            self.assertEqual(self.pool.get(self.base + "/page"), "page /page")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_redirect_and_gzip(self):
+        self.assertEqual(self.pool.get(self.base + "/redirect"), "page /page?x=1")
+        self.assertEqual(self.pool.get(self.base + "/gzip"), "zipped")
+
+    def test_refresh(self):
+        self.assertEqual(self.pool.get(self.base + "/refresh"), "page /page?refresh")
+        self.assertEqual(self.pool.get(self.base + "/meta"), "page /page?meta")
+        self.assertEqual(self.server.referers, [self.base + "/refresh", self.base + "/meta"])
+
+    def test_error(self):
+        self.assertRaises(urllib2.HTTPError, self.pool.get, self.base + "/nothing")
+
+    def test_connection_refused(self):
+        closed = ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        url = "http://127.0.0.1:{}/page".format(closed.server_address[1])
+        closed.server_close()
+        self.assertRaises(urllib2.URLError, self.pool.get, url)
+
+    def test_threads(self):
+        results = []
+
+        def fetch():
+            for i in range(10):
+                results.append(self.pool.get(self.base + "/page"))
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["page /page"] * 40)
+
+    def test_get_cached_url(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "page.html")
+            self.assertEqual(scrapetools.get_cached_url(self.base + "/page", path), "page /page")
+            self.assertEqual(open(path).read(), "page /page")
+        finally:
+            shutil.rmtree(tmpdir)
@@ -1,4 +1,4 @@
 import os
 
 PERSISTENT_FILE_PATH = "../htmlcache/"
-JOBS_PATH = os.path.join(PERSISTENT_FILE_PATH, "jobs.yml")
+JOBS_PATH = os.path.join(PERSISTENT_FILE_PATH, "jobs.sqlite")